@@ -3,7 +3,8 @@ from flask_cors import CORS, cross_origin
 from flask_mail import Mail  # ✅ Import Mail
 import os
 from .config import Config
-from .extensions import mongo, init_nlp
+from .extensions import mongo
+from .services.nlp_registry import nlp_registry
 
 # ✅ Initialize Mail object
 mail = Mail()
@@ -50,8 +51,8 @@ def create_app(config_class=Config):
         upload_path = os.path.join(os.getcwd(), app.config['UPLOAD_FOLDER'])
         return send_from_directory(upload_path, filename)
 
-    with app.app_context():
-        init_nlp()
+    # spaCy pipelines load on first use; SPACY_PRELOAD names any to load before workers fork
+    nlp_registry.preload()
 
     from .routes.api import api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
@@ -1,25 +1,123 @@
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ReturnDocument
+from app.services.cache import normalize_text, stable_hash
+from app.services.telemetry import telemetry
+from app.services.tokens import split_paragraphs
+
+# Statement fields that depend on the position in the essay (rebuilt after a revision)
+STATEMENT_POSITION_FIELDS = ('id', 'position', 'linked_to')
+
+
+def paragraph_hash(paragraph):
+    """Content hash of one paragraph (formatting-only edits hash the same)"""
+    return stable_hash(normalize_text(paragraph))[:16]
+
+
+def seed_paragraphs(essay):
+    """
+    Per-paragraph artifacts for an essay that was evaluated as a whole:
+    every paragraph inherits the essay-level ratings, grammar errors are
+    assigned to the paragraph containing their quote and statements to
+    the paragraph containing their text.
+    """
+    paragraphs = split_paragraphs(essay.get('content', ''))
+    evaluated = essay.get('ai_evaluated') and essay.get('evaluation_tier', 'llm') != 'local'
+    statements = essay.get('statements') or []
+    
+    errors_by_paragraph = defaultdict(list)
+    for error in (essay.get('error_feedback') or []) if evaluated else []:
+        context = error.get('context') or ''
+        index = next((i for i, p in enumerate(paragraphs) if context and context in p), 0)
+        errors_by_paragraph[index].append(error)
+    
+    artifacts = []
+    for index, paragraph in enumerate(paragraphs):
+        evaluation = None
+        if evaluated:
+            errors = errors_by_paragraph.get(index, [])
+            evaluation = {
+                'score': essay.get('score'),
+                'grammar': essay.get('grammar'),
+                'ai_detection_score': essay.get('ai_detection_score') or 0,
+                'structure': essay.get('structure'),
+                'content': essay.get('content_quality'),
+                'coherence': essay.get('coherence'),
+                'feedback': essay.get('feedback'),
+                'suggestions': essay.get('suggestions') or [],
+                'error_feedback': errors,
+                'total_grammar_errors': len(errors),
+            }
+        artifacts.append({
+            'hash': paragraph_hash(paragraph),
+            'words': len(paragraph.split()),
+            'source': 'seeded',
+            'evaluation': evaluation,
+            'statements': [
+                {k: v for k, v in s.items() if k not in STATEMENT_POSITION_FIELDS}
+                for s in statements if s.get('text') and s['text'] in paragraph
+            ] if statements else None,
+        })
+    return artifacts
+
+
+def diff_paragraphs(artifacts, new_content):
+    """
+    Match the paragraphs of new_content against stored artifacts by hash.
+    Returns [{'text', 'hash', 'artifact'}] in new order; artifact is None
+    for new or edited paragraphs. Moved paragraphs keep their artifacts.
+    """
+    pool = defaultdict(list)
+    for artifact in artifacts or []:
+        pool[artifact['hash']].append(artifact)
+    
+    paragraphs = []
+    for text in split_paragraphs(new_content):
+        h = paragraph_hash(text)
+        artifact = pool[h].pop(0) if pool.get(h) else None
+        paragraphs.append({'text': text, 'hash': h, 'artifact': artifact})
+    return paragraphs
 
 
 class Essay:
     def __init__(self, db):
         self.collection = db['essays']
     
-    def create(self, user_id, title, content, file_name=None):
-        """Create a new essay with 'evaluating' status"""
+    def create(self, user_id, title, content, file_name=None, lease_owner=None, lease_seconds=300,
+               provisional=None):
+        """
+        Create a new essay with 'evaluating' status
+        Pass lease_owner when the caller evaluates the essay itself: the essay
+        is reserved for it (not claimed by the background workers) for
+        lease_seconds, until the caller claims it with claim_reserved
+        provisional: local pre-score (essay_features.provisional_score), shown
+        until the LLM evaluation replaces `score`
+        """
+        now = datetime.now()
         essay = {
             'user_id': user_id,
             'title': title,
             'content': content,
             'file_name': file_name,
-            'upload_date': datetime.now(),
+            'upload_date': now,
             'status': 'evaluating',
             'score': None,
             'feedback': None,
             'grammar_errors': None,
             'linguistic_stats': None,
             'ai_detection': None,
+            'provisional_score': provisional['score'] if provisional else None,
+            'provisional_features': provisional['features'] if provisional else None,
+            'provisional_scorer': provisional['scorer'] if provisional else None,
+            
+            # Evaluation job bookkeeping (claimed by EvaluationQueue workers)
+            'job': {
+                'attempts': 0,
+                'worker': lease_owner,
+                'claimed_at': None,
+                'lease_expires': now + timedelta(seconds=lease_seconds) if lease_owner else None,
+            },
             
             # ✅ NEW: Atomic Statements (initially empty)
             'statements': [],
@@ -30,12 +128,114 @@ class Essay:
         essay['_id'] = str(result.inserted_id)
         return essay
     
-    def update_evaluation(self, essay_id, evaluation_results):
-        """Update essay with evaluation results"""
-        update_data = {
+    def update_evaluation(self, essay_id, evaluation_results, paragraphs=None, worker_id=None,
+                          statements=None, summary=None):
+        """
+        Update essay with evaluation results
+        paragraphs: per-paragraph artifacts matching these results; without
+        them stored artifacts are dropped and re-seeded on the next revision
+        worker_id: fence the write to the job lease - it only applies while
+        the essay is still 'evaluating' under this worker's claim. Returns
+        None when the job was superseded (revised and requeued, or its lease
+        expired and another worker claimed it); the result must be dropped.
+        statements/summary: classified statements stored in the same write
+        """
+        update = {'$set': self._evaluation_fields(evaluation_results)}
+        if paragraphs is not None:
+            update['$set']['paragraphs'] = paragraphs
+        else:
+            update['$unset'] = {'paragraphs': ''}
+        if statements is not None:
+            update['$set'].update({
+                'statements': statements,
+                'statement_summary': summary,
+                'statements_generated_at': datetime.now(),
+            })
+        
+        query = {'_id': ObjectId(essay_id)}
+        if worker_id is not None:
+            query.update({'job.worker': worker_id, 'status': 'evaluating'})
+        
+        with telemetry.timer('mongo_write_seconds', operation='update_evaluation'):
+            result = self.collection.update_one(
+                query,
+                self._with_usage(update, evaluation_results.get('llm_usage'))
+            )
+        if not result.matched_count:
+            return None
+        
+        return self.get_by_id(essay_id)
+    
+    def revise(self, essay_id, title, content, evaluation_results, paragraphs,
+               statements=None, summary=None, provisional=None):
+        """
+        Store an edited essay with its incrementally updated evaluation and
+        artifacts. provisional: the local scorer's result for the new text,
+        so its features stay paired with the text the LLM scored
+        """
+        update_data = self._evaluation_fields(evaluation_results)
+        update_data.update({
+            'title': title,
+            'content': content,
+            'paragraphs': paragraphs,
+            'revised_at': datetime.now(),
+            # Statements are kept only if they were updated along with the text
+            'statements': statements or [],
+            'statement_summary': summary if statements else None,
+            'statements_generated_at': datetime.now() if statements else None,
+            'provisional_score': provisional['score'] if provisional else None,
+            'provisional_features': provisional['features'] if provisional else None,
+            'provisional_scorer': provisional['scorer'] if provisional else None,
+        })
+        with telemetry.timer('mongo_write_seconds', operation='revise'):
+            self.collection.update_one(
+                {'_id': ObjectId(essay_id)},
+                self._with_usage({'$set': update_data}, evaluation_results.get('llm_usage'))
+            )
+        return self.get_by_id(essay_id)
+    
+    def requeue_revision(self, essay_id, title, content, provisional=None):
+        """Store an edited essay and hand it back to the workers for a full evaluation"""
+        self.collection.update_one(
+            {'_id': ObjectId(essay_id)},
+            {
+                '$set': {
+                    'title': title,
+                    'content': content,
+                    'revised_at': datetime.now(),
+                    'status': 'evaluating',
+                    'ai_evaluated': False,
+                    'provisional_score': provisional['score'] if provisional else None,
+                    'provisional_features': provisional['features'] if provisional else None,
+                    'provisional_scorer': provisional['scorer'] if provisional else None,
+                    'job': {'attempts': 0, 'worker': None, 'claimed_at': None, 'lease_expires': None},
+                    'statements': [],
+                    'statement_summary': None,
+                    'statements_generated_at': None,
+                },
+                '$unset': {'paragraphs': ''},
+            }
+        )
+    
+    @staticmethod
+    def _evaluation_fields(evaluation_results):
+        return {
             'status': 'completed',
             'score': evaluation_results.get('score'),
             'feedback': evaluation_results.get('feedback'),
+            'grammar': evaluation_results.get('grammar', ''),
+            'structure': evaluation_results.get('structure', ''),
+            'content_quality': evaluation_results.get('content', ''),
+            'coherence': evaluation_results.get('coherence', ''),
+            'suggestions': evaluation_results.get('suggestions', []),
+            'total_grammar_errors': evaluation_results.get('total_grammar_errors'),
+            'num_sentences': evaluation_results.get('num_sentences'),
+            'num_tokens': evaluation_results.get('num_tokens'),
+            'avg_sentence_length': evaluation_results.get('avg_sentence_length'),
+            'ai_detection_label': evaluation_results.get('ai_detection_label'),
+            'ai_detection_score': evaluation_results.get('ai_detection_score'),
+            'ai_evaluated': True,
+            'job.lease_expires': None,
             'grammar_errors': evaluation_results.get('total_grammar_errors'),
             'linguistic_stats': {
                 'num_sentences': evaluation_results.get('num_sentences'),
@@ -48,18 +248,148 @@ class Essay:
                 'score': evaluation_results.get('ai_detection_score'),
             },
             'error_feedback': evaluation_results.get('error_feedback', []),
+            # 'local' when the score came from the local scorer (fallback or tier)
+            'evaluation_tier': evaluation_results.get('evaluation_tier', 'llm'),
             'evaluated_at': datetime.now(),
         }
-        
+    
+    @staticmethod
+    def _with_usage(update, llm_usage):
+        """Append per-call LLM token accounting to an update"""
+        if llm_usage:
+            update['$push'] = {'llm_usage': {'$each': llm_usage}}
+        return update
+    
+    def claim_next_evaluation(self, worker_id, lease_seconds=300):
+        """
+        Atomically claim the oldest essay waiting for evaluation.
+        An essay is claimable while its status is 'evaluating' and it has no
+        live lease, so essays held by a crashed worker are picked up again
+        once the lease expires.
+        """
+        now = datetime.now()
+        return self.collection.find_one_and_update(
+            {
+                'status': 'evaluating',
+                'job.lease_expires': {'$not': {'$gt': now}},
+            },
+            {
+                '$set': {
+                    'job.worker': worker_id,
+                    'job.claimed_at': now,
+                    'job.lease_expires': now + timedelta(seconds=lease_seconds),
+                },
+                '$inc': {'job.attempts': 1},
+            },
+            sort=[('upload_date', 1)],
+            projection={'title': 1, 'content': 1, 'job': 1},
+            return_document=ReturnDocument.AFTER
+        )
+    
+    def reserve_for(self, essay_ids, user_id, owner, lease_seconds):
+        """
+        Reserve a user's essays for a caller that evaluates them itself (a
+        batch). Essays a worker is evaluating right now are left alone.
+        Returns the ids that were reserved.
+        """
+        now = datetime.now()
+        object_ids = [ObjectId(essay_id) for essay_id in essay_ids]
+        self.collection.update_many(
+            {
+                '_id': {'$in': object_ids},
+                'user_id': user_id,
+                '$or': [
+                    {'status': {'$ne': 'evaluating'}},
+                    {'job.lease_expires': {'$not': {'$gt': now}}},
+                ],
+            },
+            {'$set': {
+                'status': 'evaluating',
+                'job.worker': owner,
+                'job.claimed_at': None,
+                'job.lease_expires': now + timedelta(seconds=lease_seconds),
+            }}
+        )
+        reserved = self.collection.find(
+            {'_id': {'$in': object_ids}, 'job.worker': owner, 'status': 'evaluating'},
+            {'_id': 1}
+        )
+        return {str(essay['_id']) for essay in reserved}
+    
+    def extend_reservations(self, owner, lease_seconds):
+        """Keep the essays still reserved for owner away from the workers for another lease_seconds"""
+        self.collection.update_many(
+            {'job.worker': owner, 'status': 'evaluating'},
+            {'$set': {'job.lease_expires': datetime.now() + timedelta(seconds=lease_seconds)}}
+        )
+    
+    def claim_reserved(self, essay_id, owner, worker_id, lease_seconds=300):
+        """
+        Turn owner's reservation into a lease for worker_id, when the caller
+        starts evaluating the essay. False if the reservation was lost (the
+        essay was revised, or the reservation expired and a worker took it).
+        """
+        now = datetime.now()
+        claimed = self.collection.find_one_and_update(
+            {'_id': ObjectId(essay_id), 'job.worker': owner, 'status': 'evaluating'},
+            {
+                '$set': {
+                    'job.worker': worker_id,
+                    'job.claimed_at': now,
+                    'job.lease_expires': now + timedelta(seconds=lease_seconds),
+                },
+                '$inc': {'job.attempts': 1},
+            },
+            projection={'_id': 1}
+        )
+        return claimed is not None
+    
+    def release_evaluation(self, essay_id, retry_in, error=None, worker_id=None):
+        """
+        Hand a claimed essay back to the queue, claimable again after retry_in
+        seconds. With worker_id only while this worker still holds the job.
+        """
+        query = {'_id': ObjectId(essay_id)}
+        if worker_id is not None:
+            query.update({'job.worker': worker_id, 'status': 'evaluating'})
         self.collection.update_one(
+            query,
+            {'$set': {
+                'job.lease_expires': datetime.now() + timedelta(seconds=retry_in),
+                'job.error': str(error) if error else None,
+            }}
+        )
+    
+    def mark_evaluation_failed(self, essay_id, error, worker_id=None):
+        """Give up on an essay after too many attempts (with worker_id: only while it holds the job)"""
+        query = {'_id': ObjectId(essay_id)}
+        if worker_id is not None:
+            query.update({'job.worker': worker_id, 'status': 'evaluating'})
+        self.collection.update_one(
+            query,
+            {'$set': {
+                'status': 'failed',
+                'job.lease_expires': None,
+                'job.error': str(error),
+            }}
+        )
+    
+    def get_status(self, essay_id):
+        """Get evaluation status without fetching content or statements"""
+        return self.collection.find_one(
             {'_id': ObjectId(essay_id)},
-            {'$set': update_data}
+            {
+                'user_id': 1, 'status': 1, 'job': 1, 'upload_date': 1, 'evaluated_at': 1,
+                'score': 1, 'provisional_score': 1, 'feedback': 1, 'grammar': 1, 'structure': 1,
+                'content_quality': 1, 'coherence': 1, 'suggestions': 1,
+                'total_grammar_errors': 1, 'error_feedback': 1,
+                'num_sentences': 1, 'num_tokens': 1, 'avg_sentence_length': 1,
+                'ai_detection_label': 1, 'ai_detection_score': 1,
+            }
         )
-        
-        return self.get_by_id(essay_id)
     
     # ✅ NEW: Add atomic statements to essay
-    def add_statements(self, essay_id, statements, summary):
+    def add_statements(self, essay_id, statements, summary, llm_usage=None):
         """
         Add atomic statements to an essay (first-time generation)
         Called when user first views atomic statements tab
@@ -70,15 +400,16 @@ class Essay:
             'statements_generated_at': datetime.now(),
         }
         
-        result = self.collection.update_one(
-            {'_id': ObjectId(essay_id)},
-            {'$set': update_data}
-        )
+        with telemetry.timer('mongo_write_seconds', operation='add_statements'):
+            result = self.collection.update_one(
+                {'_id': ObjectId(essay_id)},
+                self._with_usage({'$set': update_data}, llm_usage)
+            )
         
         return result.modified_count > 0
     
     # ✅ NEW: Regenerate atomic statements
-    def regenerate_statements(self, essay_id, statements, summary):
+    def regenerate_statements(self, essay_id, statements, summary, llm_usage=None):
         """
         Regenerate (update) atomic statements for an essay
         Called when user clicks "Regenerate" button
@@ -89,10 +420,11 @@ class Essay:
             'statements_generated_at': datetime.now(),
         }
         
-        result = self.collection.update_one(
-            {'_id': ObjectId(essay_id)},
-            {'$set': update_data}
-        )
+        with telemetry.timer('mongo_write_seconds', operation='regenerate_statements'):
+            result = self.collection.update_one(
+                {'_id': ObjectId(essay_id)},
+                self._with_usage({'$set': update_data}, llm_usage)
+            )
         
         return result.modified_count > 0
     
@@ -134,6 +466,29 @@ class Essay:
             }
         return None
     
+    def get_statements_view(self, essay_id):
+        """
+        Everything the statements tab needs in one projected query (owner,
+        statements, summary, generation time) - without the essay content
+        """
+        essay = self.collection.find_one(
+            {'_id': ObjectId(essay_id)},
+            {
+                'user_id': 1,
+                'statements': 1,
+                'statement_summary': 1,
+                'statements_generated_at': 1
+            }
+        )
+        if essay:
+            essay['_id'] = str(essay['_id'])
+        return essay
+    
+    def get_content(self, essay_id):
+        """Only the essay text (None if the essay does not exist)"""
+        essay = self.collection.find_one({'_id': ObjectId(essay_id)}, {'content': 1})
+        return essay.get('content', '') if essay else None
+    
     def get_by_id(self, essay_id):
         """Get essay by ID"""
         essay = self.collection.find_one({'_id': ObjectId(essay_id)})
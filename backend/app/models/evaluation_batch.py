@@ -0,0 +1,73 @@
+from datetime import datetime
+from bson import ObjectId
+
+
+class EvaluationBatch:
+    def __init__(self, db):
+        self.collection = db['evaluation_batches']
+
+    def create(self, user_id, items):
+        """
+        Create a batch document tracking per-essay progress
+        items: [{'essay_id': ..., 'title': ...}, ...]
+        """
+        batch = {
+            'user_id': user_id,
+            'status': 'running',
+            'total': len(items),
+            'completed': 0,
+            'failed': 0,
+            'items': [
+                {
+                    'essay_id': item['essay_id'],
+                    'title': item.get('title'),
+                    'status': 'pending',
+                    'score': None,
+                    'error': None,
+                }
+                for item in items
+            ],
+            'created_at': datetime.now(),
+            'finished_at': None,
+        }
+        result = self.collection.insert_one(batch)
+        batch['_id'] = str(result.inserted_id)
+        return batch
+
+    def mark_item_running(self, batch_id, index):
+        self.collection.update_one(
+            {'_id': ObjectId(batch_id)},
+            {'$set': {f'items.{index}.status': 'running'}}
+        )
+
+    def complete_item(self, batch_id, index, score):
+        self.collection.update_one(
+            {'_id': ObjectId(batch_id)},
+            {
+                '$set': {f'items.{index}.status': 'completed', f'items.{index}.score': score},
+                '$inc': {'completed': 1},
+            }
+        )
+
+    def fail_item(self, batch_id, index, error):
+        self.collection.update_one(
+            {'_id': ObjectId(batch_id)},
+            {
+                '$set': {f'items.{index}.status': 'failed', f'items.{index}.error': str(error)},
+                '$inc': {'failed': 1},
+            }
+        )
+
+    def finish(self, batch_id):
+        self.collection.update_one(
+            {'_id': ObjectId(batch_id)},
+            {'$set': {'status': 'completed', 'finished_at': datetime.now()}}
+        )
+
+    def get_by_id(self, batch_id):
+        """Get batch by ID"""
+        batch = self.collection.find_one({'_id': ObjectId(batch_id)})
+        if batch:
+            batch['_id'] = str(batch['_id'])
+            batch['id'] = batch['_id']
+        return batch
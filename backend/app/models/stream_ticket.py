@@ -0,0 +1,51 @@
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta
+
+
+class StreamTicket:
+    """
+    Short-lived, single-use tickets for endpoints a browser opens with
+    EventSource (which cannot send an Authorization header). The ticket is
+    bound to one user and essay and only its hash is stored, so it is
+    worthless once redeemed, expired or read from the database.
+    """
+
+    def __init__(self, db, ttl_seconds=None):
+        self.collection = db['stream_tickets']
+        self.ttl_seconds = ttl_seconds or int(os.getenv('STREAM_TICKET_TTL_SECONDS', 60))
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        try:
+            # Stored in UTC (datetime.utcnow), which is what TTL indexes compare against
+            self.collection.create_index('expires_at', expireAfterSeconds=0)
+        except Exception as e:
+            print(f"⚠️ Could not create stream ticket index: {e}")
+
+    @staticmethod
+    def _hash(ticket):
+        return hashlib.sha256(ticket.encode('utf-8')).hexdigest()
+
+    def issue(self, user_id, essay_id):
+        """A new ticket for streaming this essay's evaluation"""
+        ticket = secrets.token_urlsafe(32)
+        self.collection.insert_one({
+            '_id': self._hash(ticket),
+            'user_id': user_id,
+            'essay_id': essay_id,
+            'expires_at': datetime.utcnow() + timedelta(seconds=self.ttl_seconds),
+        })
+        return ticket
+
+    def redeem(self, ticket, essay_id):
+        """The ticket's user_id, consuming the ticket; None if unknown, used, expired or for another essay"""
+        if not ticket:
+            return None
+        entry = self.collection.find_one_and_delete({
+            '_id': self._hash(ticket),
+            'essay_id': essay_id,
+            'expires_at': {'$gt': datetime.utcnow()},
+        })
+        return entry['user_id'] if entry else None
@@ -1,28 +1,67 @@
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, request, jsonify, make_response, Response, stream_with_context
 from werkzeug.utils import secure_filename
-import spacy
-from app.models.essay import Essay
+from app.models.essay import Essay, diff_paragraphs, seed_paragraphs
+from app.models.evaluation_batch import EvaluationBatch
+from app.models.stream_ticket import StreamTicket
+from app.services.cache import ClassificationCache, DocCache, EvaluationCache, normalize_text, stable_hash
+from app.services.deadline import request_budget
+from app.services.evaluation_queue import EvaluationQueue
+from app.services.batch_evaluator import BatchEvaluator
+from app.services.local_scorer import provisional_score
+from app.services.nlp_registry import nlp_registry
+from app.services.single_flight import SingleFlight, SingleFlightTimeout
+from app.services.telemetry import telemetry
 from bson import ObjectId
 from app.routes.auth import verify_token 
-from datetime import datetime
+import json
+import os
+import time
+import uuid
 
 api_bp = Blueprint('api', __name__)
 
-# Initialize NLP tools
-nlp = spacy.load("en_core_web_sm")
-
 # Initialize MongoDB
 from app import mongo
 essay_model = Essay(mongo.db)
+batch_model = EvaluationBatch(mongo.db)
+stream_tickets = StreamTicket(mongo.db)
+# spaCy parses of essays, shared by scoring and statement extraction
+doc_cache = DocCache(mongo.db)
 
 # Import LLM service
 try:
     from app.services.llm_service import llm_service
+    llm_service.attach_cache(EvaluationCache(mongo.db))
+    llm_service.attach_classification_cache(ClassificationCache(mongo.db))
+    llm_service.attach_doc_cache(doc_cache)
     LLM_AVAILABLE = True
 except Exception as e:
     print(f"Warning: LLM service not available: {e}")
     LLM_AVAILABLE = False
 
+# Background evaluation workers (uploads return immediately, see /essays/<id>/status)
+evaluation_queue = None
+if LLM_AVAILABLE:
+    evaluation_queue = EvaluationQueue(essay_model, llm_service)
+    evaluation_queue.start()
+
+batch_evaluator = BatchEvaluator(essay_model, batch_model, llm_service) if LLM_AVAILABLE else None
+
+# Concurrent identical LLM requests (double clicks, client retries) share one call
+single_flight = SingleFlight(mongo.db)
+
+# Upper bound for GET /essays/<id>/status?wait=N long-polling
+MAX_STATUS_WAIT_SECONDS = 30
+
+# Max essays per POST /essays/batch-evaluate
+MAX_BATCH_SIZE = 100
+# Revisions changing more than this share of the words get a full evaluation instead
+MAX_INCREMENTAL_CHANGE = float(os.getenv('EVAL_INCREMENTAL_MAX_CHANGE', 0.6))
+
+# Latency budget of requests that wait on the LLM; clients may ask for less (or more, up to the max)
+DEFAULT_REQUEST_BUDGET_MS = int(os.getenv('REQUEST_BUDGET_MS', 90000))
+MAX_REQUEST_BUDGET_MS = int(os.getenv('MAX_REQUEST_BUDGET_MS', 300000))
+
 def extract_text_from_docx(file_stream):
     """Extract text from DOCX file"""
     try:
@@ -33,16 +72,70 @@ def extract_text_from_docx(file_stream):
         print(f"Error extracting DOCX: {e}")
         raise Exception("Failed to read DOCX file")
 
+def read_essay_file(file):
+    """Extract text from an uploaded .txt/.docx file. Returns (text, error)."""
+    if file.filename == '':
+        return None, 'No selected file'
+    
+    if file.filename.endswith('.txt'):
+        text = file.read().decode('utf-8')
+    elif file.filename.endswith('.docx'):
+        text = extract_text_from_docx(file.stream)
+    else:
+        return None, 'Unsupported file type'
+    
+    if not text or len(text.strip()) < 10:
+        return None, 'Text is too short'
+    
+    return text, None
+
 def add_cors_headers(response):
     """Add CORS headers to response"""
     response.headers['Access-Control-Allow-Origin'] = '*'  # Allow all origins
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
     response.headers['Access-Control-Allow-Headers'] = (
-        'Origin, X-Requested-With, Content-Type, Accept, Authorization'
+        'Origin, X-Requested-With, Content-Type, Accept, Authorization, X-Request-Budget-Ms, If-None-Match'
     )
+    response.headers['Access-Control-Expose-Headers'] = 'ETag'
     response.headers['Access-Control-Max-Age'] = '1728000'
     return response
 
+def request_budget_seconds():
+    """Latency budget of this request: X-Request-Budget-Ms header, else REQUEST_BUDGET_MS"""
+    try:
+        budget_ms = int(request.headers.get('X-Request-Budget-Ms', DEFAULT_REQUEST_BUDGET_MS))
+    except ValueError:
+        budget_ms = DEFAULT_REQUEST_BUDGET_MS
+    return max(0, min(budget_ms, MAX_REQUEST_BUDGET_MS)) / 1000
+
+def statements_etag(essay_id, generated_at):
+    """ETag of an essay's stored statements (changes whenever they are regenerated)"""
+    version = generated_at.isoformat() if generated_at else ''
+    return stable_hash('statements', essay_id, version)[:20]
+
+def flight_key(kind, essay_id, *parts):
+    """Single-flight key: one in-flight call per essay and content version"""
+    return f"{kind}:{essay_id}:{stable_hash(*parts)[:16]}"
+
+def serialize_evaluation(essay):
+    """Evaluation fields of a stored essay, in the shape returned by evaluate_essay"""
+    return {
+        'score': essay.get('score'),
+        'feedback': essay.get('feedback'),
+        'grammar': essay.get('grammar'),
+        'structure': essay.get('structure'),
+        'content': essay.get('content_quality'),
+        'coherence': essay.get('coherence'),
+        'suggestions': essay.get('suggestions', []),
+        'total_grammar_errors': essay.get('total_grammar_errors', 0),
+        'error_feedback': essay.get('error_feedback', []),
+        'ai_detection_label': essay.get('ai_detection_label'),
+        'ai_detection_score': essay.get('ai_detection_score'),
+        'num_sentences': essay.get('num_sentences'),
+        'num_tokens': essay.get('num_tokens'),
+        'avg_sentence_length': essay.get('avg_sentence_length')
+    }
+
 @api_bp.route('/upload-essay', methods=['POST', 'OPTIONS'])
 def upload_essay():
     if request.method == 'OPTIONS':
@@ -70,32 +163,30 @@ def upload_essay():
             return jsonify({'error': 'No file part in request'}), 400
         
         file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No selected file'}), 400
         
         # Extract text
-        if file.filename.endswith('.txt'):
-            text = file.read().decode('utf-8')
-        elif file.filename.endswith('.docx'):
-            text = extract_text_from_docx(file.stream)
-        else:
-            return jsonify({'error': 'Unsupported file type'}), 400
-        
-        if not text or len(text.strip()) < 10:
-            return jsonify({'error': 'Text is too short'}), 400
+        text, error = read_essay_file(file)
+        if error:
+            return jsonify({'error': error}), 400
         
         title = file.filename.rsplit('.', 1)[0]
         
+        # Local pre-score so the UI has a number while the LLM works
+        doc = doc_cache.parse(text)
+        provisional = provisional_score(text, doc)
+        
         # Create essay record first
         essay = essay_model.create(
             user_id=user_id,
             title=title,
             content=text,
-            file_name=secure_filename(file.filename)
+            file_name=secure_filename(file.filename),
+            provisional=provisional
         )
         
         essay_id = essay['_id']
-        print(f"✅ Essay created with ID: {essay_id}")
+        doc_cache.store(essay_id, text, doc)
+        print(f"✅ Essay created with ID: {essay_id} (provisional score {provisional['score']})")
         
         # Check if LLM is available
         if not LLM_AVAILABLE:
@@ -103,7 +194,8 @@ def upload_essay():
             return jsonify({
                 'essay_id': essay_id,
                 'score': 0,
-                'feedback': 'AI evaluation service is not available. Please check HUGGINGFACE_API_TOKEN.',
+                'provisional_score': provisional['score'],
+                'feedback': 'AI evaluation service is not available. Please check HUGGINGFACE_API_TOKEN (or set LLM_BACKEND).',
                 'total_grammar_errors': 0,
                 'error_feedback': [],
                 'num_sentences': 0,
@@ -114,62 +206,16 @@ def upload_essay():
                 'ai_detection_score': 0
             }), 200
         
-        # Perform AI evaluation
-        print(f"🤖 Starting AI evaluation for: {title}")
-        evaluation = llm_service.evaluate_essay(title=title, content=text)
-        
-        print(f"✅ AI Evaluation received - Score: {evaluation.get('score', 'N/A')}")
-        print(f"   Grammar errors: {evaluation.get('total_grammar_errors', 0)}")
-        print(f"   AI Detection: {evaluation.get('ai_detection_label', 'N/A')}")
-        
-        # Update essay in database
-        mongo.db.essays.update_one(
-            {'_id': ObjectId(essay_id)},
-            {
-                '$set': {
-                    'status': 'completed',
-                    'score': evaluation['score'],
-                    'feedback': evaluation['feedback'],
-                    'grammar': evaluation.get('grammar', ''),
-                    'structure': evaluation.get('structure', ''),
-                    'content_quality': evaluation.get('content', ''),
-                    'coherence': evaluation.get('coherence', ''),
-                    'suggestions': evaluation.get('suggestions', []),
-                    'total_grammar_errors': evaluation['total_grammar_errors'],
-                    'error_feedback': evaluation['error_feedback'],
-                    'num_sentences': evaluation['num_sentences'],
-                    'num_tokens': evaluation['num_tokens'],
-                    'avg_sentence_length': evaluation['avg_sentence_length'],
-                    'ai_detection_label': evaluation['ai_detection_label'],
-                    'ai_detection_score': evaluation['ai_detection_score'],
-                    'ai_evaluated': True,
-                    'evaluated_at': datetime.now()
-                }
-            }
-        )
+        # Hand the essay to the background workers and return right away
+        evaluation_queue.notify()
+        print(f"📥 Essay {essay_id} queued for AI evaluation")
         
-        # Return AI evaluation results to frontend
-        result = {
+        return jsonify({
             'essay_id': essay_id,
-            'score': evaluation['score'],
-            'feedback': evaluation['feedback'],
-            'grammar': evaluation.get('grammar', ''),
-            'structure': evaluation.get('structure', ''),
-            'content': evaluation.get('content', ''),
-            'coherence': evaluation.get('coherence', ''),
-            'suggestions': evaluation.get('suggestions', []),
-            'total_grammar_errors': evaluation['total_grammar_errors'],
-            'error_feedback': evaluation['error_feedback'],
-            'num_sentences': evaluation['num_sentences'],
-            'num_tokens': evaluation['num_tokens'],
-            'num_entities': 0,
-            'avg_sentence_length': evaluation['avg_sentence_length'],
-            'ai_detection_label': evaluation['ai_detection_label'],
-            'ai_detection_score': evaluation['ai_detection_score']
-        }
-        
-        print(f"📤 Sending response to frontend")
-        return jsonify(result), 200
+            'status': 'evaluating',
+            'provisional_score': provisional['score'],
+            'status_url': f"/api/essays/{essay_id}/status"
+        }), 202
         
     except Exception as e:
         print(f"❌ Error in upload_essay: {str(e)}")
@@ -225,6 +271,8 @@ def get_essays():
                 'upload_date': upload_date_str,
                 'status': essay.get('status', 'pending'),
                 'score': essay.get('score', 0),
+                # Local pre-score, shown while the LLM evaluation is pending
+                'provisional_score': essay.get('provisional_score'),
                 'feedback': essay.get('feedback', ''),
                 'grammar': essay.get('grammar', ''),
                 'structure': essay.get('structure', ''),
@@ -246,16 +294,19 @@ def get_essays():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
-@api_bp.route('/essays/<essay_id>', methods=['GET', 'DELETE', 'OPTIONS'])
+@api_bp.route('/essays/<essay_id>', methods=['GET', 'PUT', 'DELETE', 'OPTIONS'])
 def handle_essay(essay_id):
-    """Get or delete a specific essay - GET allows unauthenticated access for public posts"""
+    """Get, update or delete a specific essay - GET allows unauthenticated access for public posts"""
     if request.method == 'OPTIONS':
         response = jsonify({'status': 'ok'})
         response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
-        response.headers.add('Access-Control-Allow-Methods', 'GET, DELETE, OPTIONS')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Request-Budget-Ms')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, PUT, DELETE, OPTIONS')
         return response, 200
     
+    if request.method == 'PUT':
+        return update_essay(essay_id)
+    
     # Handle GET request - Allow unauthenticated access for public posts
     if request.method == 'GET':
         try:
@@ -284,6 +335,7 @@ def handle_essay(essay_id):
                     'upload_date': essay.get('upload_date'),
                     'status': essay.get('status', 'completed'),
                     'score': essay.get('score'),
+                    'provisional_score': essay.get('provisional_score'),
                     'feedback': essay.get('feedback'),
                     'grammar': essay.get('grammar'),
                     'structure': essay.get('structure'),
@@ -310,6 +362,7 @@ def handle_essay(essay_id):
                     'upload_date': essay.get('upload_date'),
                     'status': essay.get('status', 'completed'),
                     'score': essay.get('score'),
+                    'provisional_score': essay.get('provisional_score'),
                     'feedback': essay.get('feedback'),
                     'grammar': essay.get('grammar'),
                     'structure': essay.get('structure'),
@@ -341,6 +394,7 @@ def handle_essay(essay_id):
                     'upload_date': essay.get('upload_date'),
                     'status': essay.get('status', 'completed'),
                     'score': essay.get('score'),
+                    'provisional_score': essay.get('provisional_score'),
                     'feedback': essay.get('feedback'),
                     'grammar': essay.get('grammar'),
                     'structure': essay.get('structure'),
@@ -387,6 +441,7 @@ def handle_essay(essay_id):
             
             # Delete essay
             mongo.db.essays.delete_one({'_id': ObjectId(essay_id)})
+            doc_cache.invalidate(essay_id)
             
             return jsonify({
                 'message': 'Essay deleted successfully',
@@ -397,13 +452,123 @@ def handle_essay(essay_id):
             print(f"Error deleting essay: {str(e)}")
             return jsonify({'error': str(e)}), 500
 
+def update_essay(essay_id):
+    """
+    Save an edited essay (JSON {"content": ..., "title": ...}) and update its
+    evaluation incrementally: only new or edited paragraphs go to the LLM,
+    the stored artifacts of unchanged paragraphs are reused and merged.
+    Large rewrites and essays not evaluated yet are re-queued instead (202).
+    """
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return jsonify({'error': 'No token provided'}), 401
+    
+    token = auth_header.split(' ')[1]
+    user_id = verify_token(token)
+    
+    if not user_id:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    if not ObjectId.is_valid(essay_id):
+        return jsonify({'error': 'Invalid essay ID format'}), 400
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        content = (data.get('content') or '').strip()
+        if not content:
+            return jsonify({'error': 'Essay content is required'}), 400
+        
+        essay = essay_model.get_by_id(essay_id)
+        if not essay:
+            return jsonify({'error': 'Essay not found'}), 404
+        
+        if essay['user_id'] != user_id:
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        title = (data.get('title') or essay.get('title') or 'Untitled').strip()
+        
+        if normalize_text(content) == normalize_text(essay.get('content', '')):
+            if title != essay.get('title'):
+                mongo.db.essays.update_one({'_id': ObjectId(essay_id)}, {'$set': {'title': title}})
+            return jsonify({
+                'essay_id': essay_id,
+                'status': essay.get('status'),
+                'changed_paragraphs': 0,
+                'evaluation': serialize_evaluation(essay)
+            }), 200
+        
+        artifacts = essay.get('paragraphs') or seed_paragraphs(essay)
+        paragraphs = diff_paragraphs(artifacts, content)
+        changed_words = sum(len(p['text'].split()) for p in paragraphs if p['artifact'] is None)
+        change_ratio = changed_words / max(sum(len(p['text'].split()) for p in paragraphs), 1)
+        budget = request_budget_seconds()
+        with request_budget(budget):
+            # Not enough time left for the paragraph calls: queue it and answer with the local score
+            fits_budget = LLM_AVAILABLE and llm_service.budget_allows('evaluation_paragraph')
+        incremental = (
+            fits_budget
+            and essay.get('status') == 'completed'
+            and all(p['artifact']['evaluation'] for p in paragraphs if p['artifact'])
+            and any(p['artifact'] for p in paragraphs)
+            and change_ratio <= MAX_INCREMENTAL_CHANGE
+        )
+        
+        if not incremental:
+            provisional = provisional_score(content, doc_cache.parse(content, essay_id))
+            essay_model.requeue_revision(essay_id, title, content, provisional)
+            if evaluation_queue is not None:
+                evaluation_queue.notify()
+            print(f"📥 Essay {essay_id} revised ({change_ratio:.0%} changed) - queued for full evaluation")
+            return jsonify({
+                'essay_id': essay_id,
+                'status': 'evaluating',
+                'provisional_score': provisional['score'],
+                'status_url': f"/api/essays/{essay_id}/status"
+            }), 202
+        
+        def run_revision():
+            result = llm_service.evaluate_revision(title, content, paragraphs)
+            essay_model.revise(
+                essay_id, title, content, result['evaluation'], result['paragraphs'],
+                result['statements'], result['summary'],
+                provisional_score(content, doc_cache.parse(content, essay_id))
+            )
+            return result
+        
+        with request_budget(budget):
+            result, shared = single_flight.run(
+                flight_key('revise', essay_id, title, content),
+                run_revision,
+                lambda: {
+                    'evaluation': serialize_evaluation(essay_model.get_by_id(essay_id)),
+                    'changed': None,
+                }
+            )
+        
+        return jsonify({
+            'essay_id': essay_id,
+            'status': 'completed',
+            'changed_paragraphs': result['changed'],
+            'total_paragraphs': len(paragraphs),
+            'evaluation': result['evaluation'],
+            'shared': shared
+        }), 200
+        
+    except SingleFlightTimeout as e:
+        return jsonify({'error': 'This revision is already being evaluated', 'detail': str(e)}), 409
+    except Exception as e:
+        print(f"❌ Error updating essay: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/essays/<essay_id>/evaluate', methods=['POST', 'OPTIONS'])
 def evaluate_essay(essay_id):
     """Re-evaluate an existing essay with AI"""
     if request.method == 'OPTIONS':
         response = jsonify({'status': 'ok'})
         response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Request-Budget-Ms')
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
     
@@ -429,76 +594,395 @@ def evaluate_essay(essay_id):
         if not essay:
             return jsonify({'error': 'Essay not found'}), 404
         
-        if essay.get('ai_evaluated'):
+        # Local scores (fallbacks, the local tier) can be upgraded to an LLM evaluation
+        if essay.get('ai_evaluated') and essay.get('evaluation_tier', 'llm') != 'local':
             return jsonify({
                 'message': 'Essay already evaluated',
-                'evaluation': {
-                    'score': essay.get('score'),
-                    'feedback': essay.get('feedback'),
-                    'grammar': essay.get('grammar'),
-                    'structure': essay.get('structure'),
-                    'content': essay.get('content_quality'),
-                    'coherence': essay.get('coherence'),
-                    'suggestions': essay.get('suggestions', []),
-                    'total_grammar_errors': essay.get('total_grammar_errors', 0),
-                    'error_feedback': essay.get('error_feedback', []),
-                    'ai_detection_label': essay.get('ai_detection_label'),
-                    'ai_detection_score': essay.get('ai_detection_score'),
-                    'num_sentences': essay.get('num_sentences'),
-                    'num_tokens': essay.get('num_tokens'),
-                    'avg_sentence_length': essay.get('avg_sentence_length')
-                }
+                'evaluation': serialize_evaluation(essay)
             }), 200
         
-        print(f"Re-evaluating essay: {essay.get('title')}")
-        evaluation = llm_service.evaluate_essay(
-            title=essay.get('title', 'Untitled'),
-            content=essay.get('content', '')
-        )
+        def run_evaluation():
+            print(f"Re-evaluating essay: {essay.get('title')}")
+            evaluation = llm_service.evaluate_essay(
+                title=essay.get('title', 'Untitled'),
+                content=essay.get('content', ''),
+                essay_id=essay_id
+            )
+            essay_model.update_evaluation(essay_id, evaluation)
+            return evaluation
         
-        mongo.db.essays.update_one(
-            {'_id': ObjectId(essay_id)},
-            {
-                '$set': {
-                    'status': 'completed',
-                    'score': evaluation['score'],
-                    'feedback': evaluation['feedback'],
-                    'grammar': evaluation.get('grammar'),
-                    'structure': evaluation.get('structure'),
-                    'content_quality': evaluation.get('content'),
-                    'coherence': evaluation.get('coherence'),
-                    'suggestions': evaluation.get('suggestions', []),
-                    'total_grammar_errors': evaluation['total_grammar_errors'],
-                    'error_feedback': evaluation['error_feedback'],
-                    'num_sentences': evaluation['num_sentences'],
-                    'num_tokens': evaluation['num_tokens'],
-                    'avg_sentence_length': evaluation['avg_sentence_length'],
-                    'ai_detection_label': evaluation['ai_detection_label'],
-                    'ai_detection_score': evaluation['ai_detection_score'],
-                    'ai_evaluated': True,
-                    'evaluated_at': datetime.now()
-                }
-            }
-        )
+        with request_budget(request_budget_seconds()):
+            evaluation, shared = single_flight.run(
+                flight_key('evaluate', essay_id, essay.get('title', ''), essay.get('content', '')),
+                run_evaluation,
+                lambda: serialize_evaluation(essay_model.get_by_id(essay_id))
+            )
         
         return jsonify({
             'message': 'Essay evaluated successfully',
-            'evaluation': evaluation
+            'evaluation': evaluation,
+            'shared': shared
         }), 200
         
+    except SingleFlightTimeout as e:
+        return jsonify({'error': 'This essay is already being evaluated', 'detail': str(e)}), 409
     except Exception as e:
         print(f"Error evaluating essay: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/essays/batch-evaluate', methods=['POST', 'OPTIONS'])
+def batch_evaluate_essays():
+    """
+    Evaluate many essays at once - JSON {"essay_ids": [...]} or multipart
+    "files". Results stream back as NDJSON, one line per essay as it finishes.
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response, 200
+    
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return jsonify({'error': 'No token provided'}), 401
+    
+    token = auth_header.split(' ')[1]
+    user_id = verify_token(token)
+    
+    if not user_id:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    if not LLM_AVAILABLE:
+        return jsonify({'error': 'AI evaluation service is not available'}), 503
+    
+    try:
+        essays = []
+        skipped = []
+        # The batch evaluates its essays itself: they are reserved for it so
+        # the background workers keep off them
+        batch_owner = BatchEvaluator.owner(uuid.uuid4().hex)
+        
+        files = request.files.getlist('files')
+        if files:
+            if len(files) > MAX_BATCH_SIZE:
+                return jsonify({'error': f'At most {MAX_BATCH_SIZE} essays per batch'}), 400
+            
+            for file in files:
+                text, error = read_essay_file(file)
+                if error:
+                    skipped.append({'file_name': file.filename, 'error': error})
+                    continue
+                
+                title = file.filename.rsplit('.', 1)[0]
+                essay = essay_model.create(
+                    user_id=user_id,
+                    title=title,
+                    content=text,
+                    file_name=secure_filename(file.filename),
+                    lease_owner=batch_owner,
+                    lease_seconds=batch_evaluator.reservation_seconds
+                )
+                essays.append({'essay_id': essay['_id'], 'title': title, 'content': text})
+        else:
+            data = request.get_json(silent=True) or {}
+            essay_ids = data.get('essay_ids') or []
+            if not isinstance(essay_ids, list) or not essay_ids:
+                return jsonify({'error': 'Provide "essay_ids" or upload "files"'}), 400
+            if len(essay_ids) > MAX_BATCH_SIZE:
+                return jsonify({'error': f'At most {MAX_BATCH_SIZE} essays per batch'}), 400
+            
+            valid_ids = [ObjectId(eid) for eid in essay_ids if ObjectId.is_valid(eid)]
+            # Reserve first, then read: the content is what the batch evaluates
+            reserved = essay_model.reserve_for(
+                [str(oid) for oid in valid_ids], user_id, batch_owner, batch_evaluator.reservation_seconds
+            ) if valid_ids else set()
+            found = {
+                str(essay['_id']): essay
+                for essay in mongo.db.essays.find(
+                    {'_id': {'$in': valid_ids}, 'user_id': user_id},
+                    {'title': 1, 'content': 1}
+                )
+            }
+            for eid in essay_ids:
+                essay = found.get(eid)
+                if not essay:
+                    skipped.append({'essay_id': eid, 'error': 'Essay not found'})
+                    continue
+                if eid not in reserved:
+                    skipped.append({'essay_id': eid, 'error': 'Essay is already being evaluated'})
+                    continue
+                essays.append({
+                    'essay_id': eid,
+                    'title': essay.get('title', 'Untitled'),
+                    'content': essay.get('content', '')
+                })
+        
+        if not essays:
+            return jsonify({'error': 'No essays to evaluate', 'skipped': skipped}), 400
+        
+        batch = batch_model.create(user_id, essays)
+        batch_id = batch['_id']
+        print(f"📚 Batch {batch_id}: evaluating {len(essays)} essays")
+        
+        def generate():
+            yield json.dumps({'type': 'batch', 'batch_id': batch_id, 'total': len(essays), 'skipped': skipped}) + '\n'
+            completed = failed = 0
+            for result in batch_evaluator.run(batch_id, essays, batch_owner):
+                if result['status'] == 'completed':
+                    completed += 1
+                else:
+                    failed += 1
+                yield json.dumps({'type': 'result', **result}, default=str) + '\n'
+            yield json.dumps({'type': 'done', 'batch_id': batch_id, 'completed': completed, 'failed': failed}) + '\n'
+        
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        print(f"❌ Error in batch_evaluate_essays: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/essays/batches/<batch_id>', methods=['GET', 'OPTIONS'])
+def get_evaluation_batch(batch_id):
+    """Progress of a batch evaluation (for clients that lost the stream)"""
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response, 200
+    
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return jsonify({'error': 'No token provided'}), 401
+    
+    token = auth_header.split(' ')[1]
+    user_id = verify_token(token)
+    
+    if not user_id:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    if not ObjectId.is_valid(batch_id):
+        return jsonify({'error': 'Invalid batch ID format'}), 400
+    
+    batch = batch_model.get_by_id(batch_id)
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+    
+    if batch['user_id'] != user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify(batch), 200
+
+@api_bp.route('/essays/<essay_id>/evaluate/stream/ticket', methods=['POST', 'OPTIONS'])
+def issue_stream_ticket(essay_id):
+    """
+    Single-use ticket for opening the evaluation stream with EventSource,
+    which cannot send the Authorization header: GET .../evaluate/stream?ticket=...
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response, 200
+    
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return jsonify({'error': 'No token provided'}), 401
+    
+    user_id = verify_token(auth_header.split(' ')[1])
+    if not user_id:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    if not ObjectId.is_valid(essay_id):
+        return jsonify({'error': 'Invalid essay ID format'}), 400
+    
+    if not mongo.db.essays.find_one({'_id': ObjectId(essay_id), 'user_id': user_id}, {'_id': 1}):
+        return jsonify({'error': 'Essay not found'}), 404
+    
+    return jsonify({
+        'ticket': stream_tickets.issue(user_id, essay_id),
+        'expires_in': stream_tickets.ttl_seconds
+    }), 201
+
+@api_bp.route('/essays/<essay_id>/evaluate/stream', methods=['GET', 'OPTIONS'])
+def stream_essay_evaluation(essay_id):
+    """Evaluate an essay and push each section as a Server-Sent Event"""
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Request-Budget-Ms')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response, 200
+    
+    # EventSource cannot send headers: it passes a single-use ?ticket= from
+    # .../evaluate/stream/ticket instead (never the long-lived token in the URL)
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        user_id = verify_token(auth_header.split(' ')[1])
+    elif request.args.get('ticket'):
+        user_id = stream_tickets.redeem(request.args['ticket'], essay_id)
+    else:
+        return jsonify({'error': 'No token or stream ticket provided'}), 401
+    if not user_id:
+        return jsonify({'error': 'Invalid token or stream ticket'}), 401
+    
+    if not LLM_AVAILABLE:
+        return jsonify({'error': 'AI evaluation service is not available'}), 503
+    
+    if not ObjectId.is_valid(essay_id):
+        return jsonify({'error': 'Invalid essay ID format'}), 400
+    
+    essay = mongo.db.essays.find_one(
+        {'_id': ObjectId(essay_id), 'user_id': user_id},
+        {'title': 1, 'content': 1}
+    )
+    if not essay:
+        return jsonify({'error': 'Essay not found'}), 404
+    
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    
+    budget = request_budget_seconds()
+    
+    def generate():
+        yield sse('start', {'essay_id': essay_id})
+        try:
+            with request_budget(budget):
+                for kind, payload in llm_service.stream_evaluation(
+                    title=essay.get('title', 'Untitled'),
+                    content=essay.get('content', ''),
+                    essay_id=essay_id
+                ):
+                    if kind == 'section':
+                        yield sse('section', payload)
+                    elif kind == 'error':
+                        yield sse('error', {'error': payload})
+                    elif kind == 'complete':
+                        essay_model.update_evaluation(essay_id, payload)
+                        yield sse('complete', {'essay_id': essay_id, 'evaluation': payload})
+        except Exception as e:
+            print(f"❌ Error streaming evaluation: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield sse('error', {'error': str(e)})
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+@api_bp.route('/essays/<essay_id>/status', methods=['GET', 'OPTIONS'])
+def get_essay_status(essay_id):
+    """Poll (or long-poll with ?wait=<seconds>) the evaluation status of an essay"""
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response, 200
+    
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return jsonify({'error': 'No token provided'}), 401
+    
+    token = auth_header.split(' ')[1]
+    user_id = verify_token(token)
+    
+    if not user_id:
+        return jsonify({'error': 'Invalid token'}), 401
+    
+    if not ObjectId.is_valid(essay_id):
+        return jsonify({'error': 'Invalid essay ID format'}), 400
+    
+    try:
+        wait = min(max(request.args.get('wait', 0, type=float), 0), MAX_STATUS_WAIT_SECONDS)
+        deadline = time.time() + wait
+        
+        while True:
+            essay = essay_model.get_status(essay_id)
+            if not essay:
+                return jsonify({'error': 'Essay not found'}), 404
+            
+            if essay['user_id'] != user_id:
+                return jsonify({'error': 'Unauthorized'}), 403
+            
+            remaining = deadline - time.time()
+            if essay.get('status') != 'evaluating' or remaining <= 0:
+                break
+            
+            # Woken early when a worker in this process finishes; otherwise re-check every second
+            if evaluation_queue is not None:
+                evaluation_queue.wait_for_completion(min(remaining, 1.0))
+            else:
+                time.sleep(min(remaining, 1.0))
+        
+        job = essay.get('job') or {}
+        result = {
+            'essay_id': essay_id,
+            'status': essay.get('status'),
+            'attempts': job.get('attempts', 0),
+            'evaluated_at': essay.get('evaluated_at'),
+            'provisional_score': essay.get('provisional_score'),
+        }
+        if essay.get('status') == 'completed':
+            result['evaluation'] = serialize_evaluation(essay)
+        elif essay.get('status') == 'failed':
+            result['error'] = job.get('error', 'Evaluation failed')
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        print(f"❌ Error getting essay status: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/metrics', methods=['GET', 'OPTIONS'])
+def get_metrics():
+    """
+    LLM and evaluation telemetry: latency/token histograms, parse back-fill
+    and fallback counters, client queue stats, loaded spaCy pipelines and
+    their memory. JSON by default, ?format=prometheus for the text
+    exposition format. Set METRICS_TOKEN to require
+    "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    if request.method == 'OPTIONS':
+        response = jsonify({'status': 'ok'})
+        response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        return response, 200
+    
+    metrics_token = os.getenv('METRICS_TOKEN')
+    if metrics_token and request.headers.get('Authorization') != f'Bearer {metrics_token}':
+        return jsonify({'error': 'Invalid metrics token'}), 401
+    
+    if request.args.get('format') == 'prometheus':
+        return Response(telemetry.prometheus(), mimetype='text/plain; version=0.0.4')
+    
+    metrics = telemetry.snapshot()
+    metrics['llm_available'] = LLM_AVAILABLE
+    metrics['spacy'] = nlp_registry.stats()
+    if LLM_AVAILABLE:
+        metrics['llm_client'] = llm_service.client.stats()
+    return jsonify(metrics), 200
+
 @api_bp.route('/essays/<essay_id>/statements', methods=['GET', 'OPTIONS'])
 def get_essay_statements(essay_id):
     """Get atomic statements for an essay"""
     if request.method == 'OPTIONS':
         response = jsonify({'status': 'ok'})
         response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Request-Budget-Ms, If-None-Match')
         response.headers.add('Access-Control-Allow-Methods', 'GET, OPTIONS')
         return response, 200
     
@@ -514,50 +998,69 @@ def get_essay_statements(essay_id):
         if not ObjectId.is_valid(essay_id):
             return jsonify({'error': 'Invalid essay ID format'}), 400
         
-        # ✅ Use model method instead of direct query
-        essay = essay_model.get_by_id(essay_id)
+        # One projected read: owner and statements, not the essay body
+        essay = essay_model.get_statements_view(essay_id)
         if not essay:
             return jsonify({'error': 'Essay not found'}), 404
         
         # Check access permissions (same logic as essay viewing)
         if user_id != essay.get('user_id'):
             # Check if essay is shared as public post
-            post = mongo.db.posts.find_one({'essay_id': essay_id})
+            post = mongo.db.posts.find_one({'essay_id': essay_id}, {'visibility': 1})
             if not post or post.get('visibility') != 'public':
                 return jsonify({'error': 'Unauthorized'}), 403
         
-        # ✅ Use model method to check if statements exist
-        if essay_model.has_statements(essay_id):
-            print(f"📦 Returning cached statements for essay {essay_id}")
-            statements_data = essay_model.get_statements(essay_id)
-            return jsonify({
-                'statements': statements_data['statements'],
-                'summary': statements_data['summary'],
-                'cached': True
-            }), 200
+        if essay.get('statements'):
+            # Statements only change when regenerated, so their timestamp versions them
+            etag = statements_etag(essay_id, essay.get('statements_generated_at'))
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                print(f"📦 Returning cached statements for essay {essay_id}")
+                response = make_response(jsonify({
+                    'statements': essay['statements'],
+                    'summary': essay.get('statement_summary', {}),
+                    'cached': True
+                }), 200)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
         
         # Extract statements using LLM
         print(f"🔬 Extracting new statements for essay {essay_id}")
-        content = essay.get('content', '')
+        content = essay_model.get_content(essay_id)
         
         if not content:
             return jsonify({'error': 'Essay has no content'}), 400
         
-        result = llm_service.extract_atomic_statements(content)
+        def run_extraction():
+            result = llm_service.extract_atomic_statements(content, essay_id)
+            
+            # ✅ Use model method to save statements
+            essay_model.add_statements(
+                essay_id,
+                result['statements'],
+                result['summary'],
+                result.get('llm_usage')
+            )
+            return result
         
-        # ✅ Use model method to save statements
-        essay_model.add_statements(
-            essay_id,
-            result['statements'],
-            result['summary']
-        )
+        # Shares the regenerate key: either request's result answers both
+        with request_budget(request_budget_seconds()):
+            result, shared = single_flight.run(
+                flight_key('statements', essay_id, content),
+                run_extraction,
+                lambda: essay_model.get_statements(essay_id)
+            )
         
         return jsonify({
             'statements': result['statements'],
             'summary': result['summary'],
-            'cached': False
+            'cached': shared
         }), 200
         
+    except SingleFlightTimeout as e:
+        return jsonify({'error': 'Statements are already being generated', 'detail': str(e)}), 409
     except Exception as e:
         print(f"❌ Error getting statements: {str(e)}")
         import traceback
@@ -570,7 +1073,7 @@ def regenerate_statements(essay_id):
     if request.method == 'OPTIONS':
         response = jsonify({'status': 'ok'})
         response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Request-Budget-Ms')
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
     
@@ -603,22 +1106,35 @@ def regenerate_statements(essay_id):
         if not content:
             return jsonify({'error': 'Essay has no content'}), 400
         
-        print(f"🔄 Regenerating statements for essay {essay_id}")
-        result = llm_service.extract_atomic_statements(content)
+        def run_regeneration():
+            print(f"🔄 Regenerating statements for essay {essay_id}")
+            result = llm_service.extract_atomic_statements(content, essay_id)
+            
+            # ✅ Use model method to update statements
+            essay_model.regenerate_statements(
+                essay_id,
+                result['statements'],
+                result['summary'],
+                result.get('llm_usage')
+            )
+            return result
         
-        # ✅ Use model method to update statements
-        essay_model.regenerate_statements(
-            essay_id,
-            result['statements'],
-            result['summary']
-        )
+        with request_budget(request_budget_seconds()):
+            result, shared = single_flight.run(
+                flight_key('statements', essay_id, content),
+                run_regeneration,
+                lambda: essay_model.get_statements(essay_id)
+            )
         
         return jsonify({
             'statements': result['statements'],
             'summary': result['summary'],
+            'shared': shared,
             'message': 'Statements regenerated successfully'
         }), 200
         
+    except SingleFlightTimeout as e:
+        return jsonify({'error': 'Statements are already being regenerated', 'detail': str(e)}), 409
     except Exception as e:
         print(f"❌ Error regenerating statements: {str(e)}")
         import traceback
@@ -0,0 +1,135 @@
+import os
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SupersededError(Exception):
+    """The batch no longer holds the essay's reservation or lease"""
+
+
+class BatchEvaluator:
+    """
+    Runs evaluate_essay for every essay of a batch through a bounded
+    thread pool. Each task writes its own result (essay + batch item), so
+    the batch finishes even if the client stops reading the stream.
+
+    The essays are reserved for the batch (Essay.reserve_for / create with
+    lease_owner=owner) so the EvaluationQueue leaves them alone; every item
+    and finished item extends the reservation of the rest. When an item
+    starts, the reservation becomes a normal lease held by that item, and
+    its result is written fenced to it, exactly as a queue worker's.
+    """
+
+    def __init__(self, essay_model, batch_model, llm_service, max_workers=None):
+        self.essay_model = essay_model
+        self.batch_model = batch_model
+        self.llm_service = llm_service
+        self.max_workers = max_workers or int(os.getenv('BATCH_EVAL_WORKERS', 4))
+        self.lease_seconds = int(os.getenv('EVAL_LEASE_SECONDS', 300))
+        self.reservation_seconds = int(os.getenv('BATCH_RESERVATION_SECONDS', 900))
+        self.retry_delay = float(os.getenv('EVAL_RETRY_DELAY_SECONDS', 15))
+
+    @staticmethod
+    def owner(batch_key):
+        """Reservation owner of a batch (batch_key: any id unique to the batch)"""
+        return f"batch:{batch_key}"
+
+    def run(self, batch_id, essays, owner):
+        """
+        Evaluate essays ([{'essay_id', 'title', 'content'}], in batch item
+        order, reserved for `owner`) and yield one result dict per essay as
+        each one finishes.
+        """
+        results = queue.Queue()
+        remaining = [len(essays)]
+        lock = threading.Lock()
+
+        def on_done(future):
+            results.put(future)
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                try:
+                    self.batch_model.finish(batch_id)
+                except Exception as e:
+                    print(f"⚠️ Could not finish batch {batch_id}: {e}")
+
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.max_workers, max(len(essays), 1)),
+            thread_name_prefix=f"batch-{batch_id[-6:]}"
+        )
+        for index, essay in enumerate(essays):
+            future = executor.submit(self._evaluate_item, batch_id, index, essay, owner)
+            future.add_done_callback(on_done)
+        # Let running tasks finish on their own if the caller goes away
+        executor.shutdown(wait=False)
+
+        for _ in essays:
+            yield results.get().result()
+
+    def _evaluate_item(self, batch_id, index, essay, owner):
+        essay_id = essay['essay_id']
+        worker_id = f"{owner}:{index}"
+        try:
+            if not self.essay_model.claim_reserved(essay_id, owner, worker_id, self.lease_seconds):
+                raise SupersededError("Essay was revised or picked up by the evaluation queue")
+            # The batch is making progress: keep the items still waiting reserved
+            self.essay_model.extend_reservations(owner, self.reservation_seconds)
+            self.batch_model.mark_item_running(batch_id, index)
+            if getattr(self.llm_service, 'combined_mode', False):
+                result = self.llm_service.evaluate_with_statements(
+                    title=essay.get('title', 'Untitled'),
+                    content=essay.get('content', ''),
+                    essay_id=essay_id
+                )
+                evaluation = result['evaluation']
+            else:
+                result = None
+                evaluation = self.llm_service.evaluate_essay(
+                    title=essay.get('title', 'Untitled'),
+                    content=essay.get('content', ''),
+                    essay_id=essay_id
+                )
+            statements = result['statements'] if result else None
+            stored = self.essay_model.update_evaluation(
+                essay_id, evaluation, worker_id=worker_id,
+                statements=statements, summary=result['summary'] if statements is not None else None
+            )
+            if stored is None:
+                raise SupersededError("Essay was revised or its lease expired while evaluating")
+            self.batch_model.complete_item(batch_id, index, evaluation.get('score'))
+            return {
+                'index': index,
+                'essay_id': essay_id,
+                'title': essay.get('title'),
+                'status': 'completed',
+                'evaluation': evaluation,
+            }
+        except SupersededError as e:
+            print(f"⏭️ Batch {batch_id}: dropping essay {essay_id}: {e}")
+            return self._fail_item(batch_id, index, essay, e)
+        except Exception as e:
+            print(f"❌ Batch {batch_id}: error evaluating essay {essay_id}: {e}")
+            traceback.print_exc()
+            try:
+                # Hand it to the evaluation queue for a retry
+                self.essay_model.release_evaluation(essay_id, self.retry_delay, e, worker_id)
+            except Exception as release_error:
+                print(f"⚠️ Could not release essay {essay_id}: {release_error}")
+            return self._fail_item(batch_id, index, essay, e)
+
+    def _fail_item(self, batch_id, index, essay, e):
+        try:
+            self.batch_model.fail_item(batch_id, index, e)
+        except Exception as record_error:
+            print(f"⚠️ Could not record batch failure: {record_error}")
+        return {
+            'index': index,
+            'essay_id': essay['essay_id'],
+            'title': essay.get('title'),
+            'status': 'failed',
+            'error': str(e),
+        }
@@ -0,0 +1,373 @@
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import ReplaceOne
+
+from .telemetry import telemetry
+
+
+def normalize_text(text: str) -> str:
+    """Normalize essay text so formatting-only differences hash the same"""
+    text = unicodedata.normalize('NFC', text or '')
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = [re.sub(r'[ \t\u00a0]+', ' ', line).strip() for line in text.split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def stable_hash(*parts) -> str:
+    """SHA-256 over the given parts, separated so ("ab", "c") != ("a", "bc")"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """Small thread-safe in-process LRU"""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class EvaluationCache:
+    """
+    Content-addressed cache of essay evaluations.
+    In-process LRU in front of the `evaluation_cache` collection, which is
+    bounded by a TTL index on `created_at` and a max entry count (least
+    recently hit entries are evicted first). LRU hits refresh `last_hit_at`
+    too, at most once per `touch_seconds` per key.
+    """
+
+    def __init__(self, db, lru_size=None, ttl_seconds=None, max_entries=None, touch_seconds=None):
+        self.collection = db['evaluation_cache']
+        self.lru = LRUCache(lru_size or int(os.getenv('EVAL_CACHE_LRU_SIZE', 256)))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('EVAL_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+        self.max_entries = max_entries or int(os.getenv('EVAL_CACHE_MAX_ENTRIES', 20000))
+        self.touch_seconds = (touch_seconds if touch_seconds is not None
+                              else float(os.getenv('EVAL_CACHE_TOUCH_SECONDS', 60)))
+        self._writes = 0
+        # key -> (monotonic time of the last last_hit_at write, LRU hits since)
+        self._touches = LRUCache(self.lru.maxsize)
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        try:
+            # Stored in UTC (datetime.utcnow), which is what TTL indexes compare against
+            self.collection.create_index('created_at', expireAfterSeconds=self.ttl_seconds)
+            self.collection.create_index('last_hit_at')
+        except Exception as e:
+            print(f"⚠️ Could not create evaluation cache indexes: {e}")
+
+    @staticmethod
+    def make_key(content: str, model: str, prompt_version: str) -> str:
+        # The title only labels the essay in the prompt, so re-uploads under another name still hit
+        return stable_hash(normalize_text(content), model, prompt_version)
+
+    def get(self, key):
+        """Return a copy of the cached evaluation, or None"""
+        evaluation = self.lru.get(key)
+        if evaluation is not None:
+            self._touch(key)
+            return copy.deepcopy(evaluation)
+
+        try:
+            doc = self.collection.find_one_and_update(
+                {'_id': key},
+                {'$set': {'last_hit_at': datetime.utcnow()}, '$inc': {'hits': 1}}
+            )
+        except Exception as e:
+            print(f"⚠️ Evaluation cache lookup failed: {e}")
+            return None
+
+        if not doc:
+            return None
+        # The TTL monitor only runs once a minute, so double-check expiry here
+        if doc['created_at'] < datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+            return None
+
+        self.lru.set(key, doc['evaluation'])
+        self._touches.set(key, (time.monotonic(), 0))
+        return copy.deepcopy(doc['evaluation'])
+
+    def _touch(self, key):
+        """Record an LRU hit in the collection, batched to one write per touch_seconds"""
+        now = time.monotonic()
+        touched_at, hits = self._touches.get(key) or (None, 0)
+        hits += 1
+        if touched_at is not None and now - touched_at < self.touch_seconds:
+            self._touches.set(key, (touched_at, hits))
+            return
+        self._touches.set(key, (now, 0))
+        try:
+            self.collection.update_one(
+                {'_id': key},
+                {'$set': {'last_hit_at': datetime.utcnow()}, '$inc': {'hits': hits}}
+            )
+        except Exception as e:
+            print(f"⚠️ Evaluation cache touch failed: {e}")
+
+    def set(self, key, evaluation, model, prompt_version):
+        self.lru.set(key, copy.deepcopy(evaluation))
+        self._touches.set(key, (time.monotonic(), 0))
+        now = datetime.utcnow()
+        try:
+            self.collection.replace_one(
+                {'_id': key},
+                {
+                    'evaluation': evaluation,
+                    'model': model,
+                    'prompt_version': prompt_version,
+                    'created_at': now,
+                    'last_hit_at': now,
+                    'hits': 0,
+                },
+                upsert=True
+            )
+        except Exception as e:
+            print(f"⚠️ Evaluation cache write failed: {e}")
+            return
+
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._evict_overflow()
+
+    def invalidate(self, key):
+        self.lru.pop(key)
+        self._touches.pop(key)
+        try:
+            self.collection.delete_one({'_id': key})
+        except Exception as e:
+            print(f"⚠️ Evaluation cache delete failed: {e}")
+
+    def _evict_overflow(self):
+        """Drop the least recently hit entries beyond max_entries"""
+        try:
+            overflow = self.collection.estimated_document_count() - self.max_entries
+            if overflow <= 0:
+                return
+            stale = self.collection.find({}, {'_id': 1}).sort('last_hit_at', 1).limit(overflow)
+            ids = [doc['_id'] for doc in stale]
+            if ids:
+                self.collection.delete_many({'_id': {'$in': ids}})
+                for key in ids:
+                    self.lru.pop(key)
+                    self._touches.pop(key)
+                print(f"🧹 Evicted {len(ids)} evaluation cache entries")
+        except Exception as e:
+            print(f"⚠️ Evaluation cache eviction failed: {e}")
+
+
+class ClassificationCache:
+    """
+    Sentence-level cache of statement classifications ((type, strength)
+    keyed by sentence text, model and prompt version), so unchanged and
+    recurring sentences are not sent to the LLM again. In-process LRU in
+    front of the `classification_cache` collection (TTL on `created_at`).
+    """
+
+    def __init__(self, db, lru_size=None, ttl_seconds=None):
+        self.collection = db['classification_cache']
+        self.lru = LRUCache(lru_size or int(os.getenv('CLASSIFY_CACHE_LRU_SIZE', 20000)))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('CLASSIFY_CACHE_TTL_SECONDS', 90 * 24 * 3600))
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        try:
+            # Stored in UTC (datetime.utcnow), which is what TTL indexes compare against
+            self.collection.create_index('created_at', expireAfterSeconds=self.ttl_seconds)
+        except Exception as e:
+            print(f"⚠️ Could not create classification cache index: {e}")
+
+    @staticmethod
+    def make_key(sentence: str, model: str, prompt_version: str) -> str:
+        return stable_hash(normalize_text(sentence), model, prompt_version)
+
+    def get_many(self, keys) -> dict:
+        """{key: (type, strength)} for the cached keys; one query for all LRU misses"""
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.lru.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                missing.append(key)
+        if not missing:
+            return found
+
+        expired_before = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        try:
+            docs = self.collection.find(
+                {'_id': {'$in': missing}, 'created_at': {'$gte': expired_before}},
+                {'type': 1, 'strength': 1}
+            )
+            for doc in docs:
+                value = (doc['type'], doc['strength'])
+                self.lru.set(doc['_id'], value)
+                found[doc['_id']] = value
+        except Exception as e:
+            print(f"⚠️ Classification cache lookup failed: {e}")
+        return found
+
+    def set_many(self, entries: dict, model, prompt_version):
+        """Store {key: (type, strength)} in one bulk write"""
+        if not entries:
+            return
+        now = datetime.utcnow()
+        for key, value in entries.items():
+            self.lru.set(key, tuple(value))
+        try:
+            self.collection.bulk_write([
+                ReplaceOne(
+                    {'_id': key},
+                    {
+                        'type': value[0],
+                        'strength': value[1],
+                        'model': model,
+                        'prompt_version': prompt_version,
+                        'created_at': now,
+                    },
+                    upsert=True
+                )
+                for key, value in entries.items()
+            ], ordered=False)
+        except Exception as e:
+            print(f"⚠️ Classification cache write failed: {e}")
+
+
+class DocCache:
+    """
+    Parsed spaCy Docs of essays, serialized with DocBin. One entry per essay
+    in the `parsed_docs` collection, valid while the essay text hashes the
+    same (and for the same model, spaCy version and pipeline); an in-process
+    LRU keeps recently used Docs. Loading a DocBin is far cheaper than
+    re-running the pipeline on a long essay.
+    """
+
+    def __init__(self, db, registry=None, pipeline='entities', lru_size=None, ttl_seconds=None):
+        from .nlp_registry import nlp_registry
+
+        self.collection = db['parsed_docs']
+        self.registry = registry or nlp_registry
+        self.pipeline = pipeline
+        self.lru = LRUCache(lru_size or int(os.getenv('DOC_CACHE_LRU_SIZE', 64)))
+        self.ttl_seconds = ttl_seconds or int(os.getenv('DOC_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+        self._ensure_indexes()
+
+    def _ensure_indexes(self):
+        try:
+            # Stored in UTC (datetime.utcnow), which is what TTL indexes compare against
+            self.collection.create_index('created_at', expireAfterSeconds=self.ttl_seconds)
+        except Exception as e:
+            print(f"⚠️ Could not create parsed doc cache index: {e}")
+
+    def make_key(self, text: str, nlp) -> str:
+        """Exact text (Doc offsets must match it) plus everything that shapes the parse"""
+        import spacy
+        return stable_hash(text, self.registry.model, spacy.__version__, self.pipeline, *nlp.pipe_names)
+
+    def parse(self, text: str, essay_id=None):
+        """
+        Doc of an essay's text: from the cache when the essay was parsed with
+        this text before, otherwise parsed now (and stored when essay_id is
+        given). None when spaCy is not available.
+        """
+        text = text or ''
+        nlp = self.registry.get(self.pipeline)
+        if nlp is None or not text.strip():
+            return None
+        if essay_id is None:
+            return nlp(text)
+
+        essay_id = str(essay_id)
+        key = self.make_key(text, nlp)
+        doc = self.get(essay_id, key, nlp)
+        if doc is None:
+            doc = nlp(text)
+            self.set(essay_id, key, doc)
+        return doc
+
+    def get(self, essay_id, key, nlp):
+        doc = self.lru.get((essay_id, key))
+        if doc is not None:
+            telemetry.increment('doc_cache_hits_total', tier='memory')
+            return doc
+
+        expired_before = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        try:
+            entry = self.collection.find_one(
+                {'_id': essay_id, 'key': key, 'created_at': {'$gte': expired_before}},
+                {'data': 1}
+            )
+            if entry is not None:
+                from spacy.tokens import DocBin
+                doc = next(DocBin().from_bytes(entry['data']).get_docs(nlp.vocab))
+                self.lru.set((essay_id, key), doc)
+                telemetry.increment('doc_cache_hits_total', tier='mongo')
+                return doc
+        except Exception as e:
+            print(f"⚠️ Parsed doc cache lookup failed: {e}")
+        telemetry.increment('doc_cache_misses_total')
+        return None
+
+    def set(self, essay_id, key, doc):
+        """Store the essay's Doc, replacing the parse of any earlier text"""
+        self.lru.set((essay_id, key), doc)
+        try:
+            from spacy.tokens import DocBin
+            doc_bin = DocBin(store_user_data=False)
+            doc_bin.add(doc)
+            self.collection.replace_one(
+                {'_id': essay_id},
+                {'key': key, 'data': doc_bin.to_bytes(), 'created_at': datetime.utcnow()},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"⚠️ Parsed doc cache write failed: {e}")
+
+    def store(self, essay_id, text: str, doc):
+        """Keep a Doc parsed before the essay had an id (e.g. during upload)"""
+        nlp = self.registry.get(self.pipeline)
+        if doc is not None and nlp is not None:
+            self.set(str(essay_id), self.make_key(text or '', nlp), doc)
+
+    def invalidate(self, essay_id):
+        try:
+            self.collection.delete_one({'_id': str(essay_id)})
+        except Exception as e:
+            print(f"⚠️ Parsed doc cache delete failed: {e}")
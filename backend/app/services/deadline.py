@@ -0,0 +1,41 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+# Absolute time.monotonic() by which the current request wants its answer
+_expires = contextvars.ContextVar('request_deadline', default=None)
+
+
+@contextmanager
+def request_budget(seconds):
+    """
+    Run the block under a latency budget. LLM calls made inside it (also
+    from pools started with submit() below) see the remaining time via
+    remaining(). Nested budgets can only shorten the outer one.
+    """
+    if seconds is None:
+        yield
+        return
+    expires = time.monotonic() + max(0.0, seconds)
+    outer = _expires.get()
+    if outer is not None:
+        expires = min(expires, outer)
+    token = _expires.set(expires)
+    try:
+        yield
+    finally:
+        _expires.reset(token)
+
+
+def remaining():
+    """Seconds left in the current budget, or None when there is none"""
+    expires = _expires.get()
+    if expires is None:
+        return None
+    return max(0.0, expires - time.monotonic())
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit that carries the caller's budget into the worker thread"""
+    context = contextvars.copy_context()
+    return executor.submit(context.run, fn, *args, **kwargs)
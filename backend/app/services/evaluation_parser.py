@@ -0,0 +1,299 @@
+import re
+
+# Section headers, in the order the evaluation prompt asks for them
+SECTION_HEADERS = {
+    'SCORE': 'score',
+    'AI DETECTION': 'ai_detection',
+    'GRAMMAR ERRORS': 'grammar_errors',
+    'GRAMMAR RATING': 'grammar',
+    'STRUCTURE': 'structure',
+    'CONTENT QUALITY': 'content',
+    'CONTENT': 'content',
+    'COHERENCE': 'coherence',
+    'SUGGESTIONS': 'suggestions',
+    'OVERALL FEEDBACK': 'feedback',
+    'FEEDBACK': 'feedback',
+}
+
+# Fields of the evaluation dict that each section fills in
+SECTION_FIELDS = {
+    'score': ('score',),
+    'ai_detection': ('ai_detection_label', 'ai_detection_score'),
+    'grammar_errors': ('total_grammar_errors', 'error_feedback'),
+    'grammar': ('grammar',),
+    'structure': ('structure',),
+    'content': ('content',),
+    'coherence': ('coherence',),
+    'suggestions': ('suggestions',),
+    'feedback': ('feedback',),
+}
+
+# Sections whose value is complete as soon as a non-empty header line ends
+SINGLE_LINE_SECTIONS = {'score', 'ai_detection', 'grammar'}
+
+# "SCORE: 85", "**Score:** 85", "## GRAMMAR ERRORS", "CONTENT QUALITY:" ...
+# Headers must start the line (list items never match) and longer names
+# come first so CONTENT QUALITY wins over CONTENT.
+HEADER_RE = re.compile(
+    r'^[\s#*_>]*('
+    + '|'.join(re.escape(h) for h in sorted(SECTION_HEADERS, key=len, reverse=True))
+    + r')[\s*_]*(?::[\s*_]*(.*)|$)',
+    re.IGNORECASE
+)
+NUMBER_RE = re.compile(r'\d+')
+LIST_MARKER_RE = re.compile(r'^[\d\.\-\*\)]+\s*')
+QUOTE_RE = re.compile(r'"([^"]*)"')
+NO_ERRORS_RE = re.compile(r'\bno\b.*\b(errors?|issues?)\b', re.IGNORECASE)
+
+AI_LABELS = (
+    ('human', 'Human-written', 0.95),
+    ('assisted', 'Possibly AI-assisted', 0.5),
+    ('generated', 'Likely AI-generated', 0.1),
+)
+
+# Best to worst, used when averaging ratings of several evaluations
+GRAMMAR_RATINGS = ('Excellent', 'Good', 'Fair', 'Poor')
+
+MAX_GRAMMAR_ERRORS = 10
+MAX_SUGGESTIONS = 5
+NOT_EVALUATED = 'Not evaluated'
+
+
+def default_evaluation() -> dict:
+    """Evaluation dict before any section has been parsed"""
+    return {
+        'score': 75,
+        'grammar': NOT_EVALUATED,
+        'structure': NOT_EVALUATED,
+        'content': NOT_EVALUATED,
+        'coherence': NOT_EVALUATED,
+        'suggestions': [],
+        'feedback': '',
+        'total_grammar_errors': 0,
+        'error_feedback': [],
+        'ai_detection_label': 'Human-written',
+        'ai_detection_score': 0.95,
+        'num_sentences': 0,
+        'num_tokens': 0,
+        'avg_sentence_length': 0
+    }
+
+
+def linguistic_stats(content: str) -> dict:
+    """Sentence/word counts stored alongside every evaluation"""
+    content = content or ''
+    sentences = [s for s in content.split('.') if s.strip()]
+    words = content.split()
+    return {
+        'num_sentences': len(sentences),
+        'num_tokens': len(words),
+        'avg_sentence_length': len(words) / max(len(sentences), 1)
+    }
+
+
+def format_grammar_error(error: str) -> dict:
+    """Turn '- Error in "quote" → Suggestion: fix' into an error_feedback entry"""
+    error_clean = error.lstrip('-•').lstrip('0123456789.').strip()
+
+    if '→' not in error_clean:
+        return {'message': error_clean, 'context': '', 'replacements': []}
+
+    message, _, suggestion = error_clean.partition('→')
+    message = message.strip()
+    suggestion = suggestion.replace('Suggestion:', '').strip()
+    quote_match = QUOTE_RE.search(message)
+
+    return {
+        'message': message,
+        'context': quote_match.group(1) if quote_match else '',
+        'replacements': [suggestion] if suggestion else []
+    }
+
+
+class EvaluationParser:
+    """
+    Incremental parser for the evaluation response format.
+
+    Feed it raw text as it arrives (whole responses or streamed tokens);
+    `feed` returns an event for every section that is complete so far, e.g.
+    {'section': 'score', 'data': {'score': 85}}. Multi-line sections are
+    complete once the next header arrives or the stream is closed.
+    """
+
+    def __init__(self, original_content: str = ''):
+        self.original_content = original_content
+        self.evaluation = default_evaluation()
+        self._buffer = ''
+        self._section = None
+        self._parts = {name: [] for name in SECTION_FIELDS}
+        self._seen = set()
+        self._closed = False
+
+    def feed(self, text: str) -> list:
+        """Consume more response text, return events for completed sections"""
+        self._buffer += text
+        if '\n' not in text:
+            return []
+        *lines, self._buffer = self._buffer.split('\n')
+        events = []
+        for line in lines:
+            self._consume_line(line, events)
+        return events
+
+    def close(self) -> list:
+        """Flush the last line and section, return their events"""
+        if self._closed:
+            return []
+        events = []
+        if self._buffer:
+            self._consume_line(self._buffer, events)
+            self._buffer = ''
+        self._finish_section(events)
+        self._closed = True
+        self._add_linguistic_stats()
+        return events
+
+    def result(self) -> dict:
+        """The parsed evaluation dict (closes the parser if needed)"""
+        self.close()
+        return self.evaluation
+
+    def _consume_line(self, line, events):
+        line = line.strip()
+        if not line:
+            return
+
+        match = HEADER_RE.match(line)
+        if match:
+            self._finish_section(events)
+            section = SECTION_HEADERS[match.group(1).upper()]
+            self._section = section
+            self._seen.add(section)
+            remainder = (match.group(2) or '').strip()
+            if section == 'grammar_errors':
+                # Inline text after the header is usually the first error
+                if len(remainder) > 10:
+                    self._parts[section].append(remainder)
+            elif remainder:
+                self._parts[section].append(remainder)
+            if section in SINGLE_LINE_SECTIONS and remainder:
+                self._finish_section(events)
+            return
+
+        if self._section is None:
+            return
+        if self._section == 'suggestions':
+            line = LIST_MARKER_RE.sub('', line).strip()
+            if len(line) <= 5:
+                return
+        self._parts[self._section].append(line)
+
+    def _finish_section(self, events):
+        section = self._section
+        if section is None:
+            return
+        self._section = None
+        self._apply(section, self._parts[section])
+        events.append({
+            'section': section,
+            'data': {field: self.evaluation[field] for field in SECTION_FIELDS[section]}
+        })
+
+    def _apply(self, section, parts):
+        evaluation = self.evaluation
+        text = ' '.join(parts).strip()
+
+        if section == 'score':
+            number = NUMBER_RE.search(text)
+            if number:
+                evaluation['score'] = min(100, max(0, int(number.group())))
+        elif section == 'ai_detection':
+            lowered = text.lower()
+            for needle, label, score in AI_LABELS:
+                if needle in lowered:
+                    evaluation['ai_detection_label'] = label
+                    evaluation['ai_detection_score'] = score
+                    break
+        elif section == 'grammar_errors':
+            errors = [p for p in parts if not NO_ERRORS_RE.search(p)]
+            evaluation['total_grammar_errors'] = len(errors)
+            evaluation['error_feedback'] = [
+                format_grammar_error(error) for error in errors[:MAX_GRAMMAR_ERRORS]
+            ]
+        elif section == 'suggestions':
+            evaluation['suggestions'] = parts[:MAX_SUGGESTIONS]
+        elif section == 'feedback':
+            evaluation['feedback'] = text
+        elif text:
+            # grammar rating, structure, content, coherence
+            evaluation[section] = text
+
+    def _add_linguistic_stats(self):
+        self.evaluation.update(linguistic_stats(self.original_content))
+
+    @property
+    def missing_sections(self) -> list:
+        """Sections the response never produced"""
+        return [name for name in SECTION_FIELDS if name not in self._seen]
+
+
+def sections_from_evaluation(evaluation: dict) -> list:
+    """Section events for an already complete evaluation (e.g. a cache hit)"""
+    return [
+        {'section': section, 'data': {field: evaluation.get(field) for field in fields}}
+        for section, fields in SECTION_FIELDS.items()
+    ]
+
+
+def merge_evaluations(evaluations: list, weights: list, content: str) -> dict:
+    """
+    Reduce per-chunk evaluations of one essay into a single evaluation.
+    Scores and ratings are averaged weighted by chunk size, grammar errors
+    are concatenated, suggestions are interleaved and de-duplicated.
+    """
+    total_weight = float(sum(weights)) or 1.0
+    merged = default_evaluation()
+
+    merged['score'] = int(round(sum(e['score'] * w for e, w in zip(evaluations, weights)) / total_weight))
+
+    ai_score = sum(e['ai_detection_score'] * w for e, w in zip(evaluations, weights)) / total_weight
+    merged['ai_detection_score'] = round(ai_score, 2)
+    merged['ai_detection_label'] = (
+        'Human-written' if ai_score >= 0.7
+        else 'Possibly AI-assisted' if ai_score >= 0.3
+        else 'Likely AI-generated'
+    )
+
+    ranks = []
+    rank_weights = []
+    for evaluation, weight in zip(evaluations, weights):
+        rating = (evaluation.get('grammar') or '').strip().capitalize()
+        if rating in GRAMMAR_RATINGS:
+            ranks.append(GRAMMAR_RATINGS.index(rating))
+            rank_weights.append(weight)
+    if ranks:
+        avg_rank = sum(r * w for r, w in zip(ranks, rank_weights)) / sum(rank_weights)
+        merged['grammar'] = GRAMMAR_RATINGS[int(round(avg_rank))]
+
+    merged['total_grammar_errors'] = sum(e['total_grammar_errors'] for e in evaluations)
+    merged['error_feedback'] = [error for e in evaluations for error in e['error_feedback']]
+
+    for field in ('structure', 'content', 'coherence', 'feedback'):
+        texts = [e[field] for e in evaluations if e.get(field) and e[field] != NOT_EVALUATED]
+        if texts:
+            # dict.fromkeys: parts sharing one text (e.g. re-used paragraphs) contribute it once
+            merged[field] = ' '.join(dict.fromkeys(texts))
+
+    seen = set()
+    suggestions = []
+    for round_ in range(max((len(e['suggestions']) for e in evaluations), default=0)):
+        for evaluation in evaluations:
+            if round_ < len(evaluation['suggestions']):
+                suggestion = evaluation['suggestions'][round_]
+                if suggestion.lower() not in seen:
+                    seen.add(suggestion.lower())
+                    suggestions.append(suggestion)
+    merged['suggestions'] = suggestions[:MAX_SUGGESTIONS]
+
+    merged.update(linguistic_stats(content))
+    return merged
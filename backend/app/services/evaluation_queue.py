@@ -0,0 +1,159 @@
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+from .telemetry import telemetry
+
+
+class EvaluationQueue:
+    """
+    Background evaluation workers backed by the `essays` collection.
+
+    Essays are created with status 'evaluating'; a bounded pool of worker
+    threads claims them one at a time with an atomic find-and-modify (see
+    Essay.claim_next_evaluation), runs the LLM evaluation and writes the
+    result - only while the claim still holds, so a job that was requeued by
+    a revision or taken over after its lease expired drops its stale result.
+    Because the queue *is* the essays collection, several processes
+    (gunicorn workers, the Flask reloader) can run pools side by side.
+    """
+
+    def __init__(self, essay_model, llm_service, workers=None, lease_seconds=None,
+                 poll_interval=None, max_attempts=None):
+        self.essay_model = essay_model
+        self.llm_service = llm_service
+        self.workers = workers or int(os.getenv('EVAL_WORKERS', 4))
+        self.lease_seconds = lease_seconds or int(os.getenv('EVAL_LEASE_SECONDS', 300))
+        self.poll_interval = poll_interval or float(os.getenv('EVAL_POLL_INTERVAL', 5))
+        self.max_attempts = max_attempts or int(os.getenv('EVAL_MAX_ATTEMPTS', 3))
+        self.retry_delay = float(os.getenv('EVAL_RETRY_DELAY_SECONDS', 15))
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+        self._wakeup = threading.Condition()
+        self._finished = threading.Condition()
+        self._threads = []
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        with self._lock:
+            if self._started:
+                return
+            self._ensure_indexes()
+            for idx in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    args=(f"{self.worker_prefix}:{idx}",),
+                    name=f"evaluation-worker-{idx}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+        print(f"🧵 Started {self.workers} evaluation workers ({self.worker_prefix})")
+
+    def _ensure_indexes(self):
+        try:
+            self.essay_model.collection.create_index([('status', 1), ('upload_date', 1)])
+        except Exception as e:
+            print(f"⚠️ Could not create evaluation queue index: {e}")
+
+    def notify(self):
+        """Wake one idle worker after a new essay was enqueued"""
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def wait_for_completion(self, timeout):
+        """Block until any evaluation finishes in this process (or timeout)"""
+        with self._finished:
+            self._finished.wait(timeout)
+
+    def _provider_down(self):
+        breaker = getattr(getattr(self.llm_service, 'client', None), 'breaker', None)
+        return breaker is not None and breaker.is_open
+
+    def _worker_loop(self, worker_id):
+        while True:
+            if self._provider_down():
+                # Leave essays queued rather than claiming them only to fail
+                time.sleep(self.poll_interval)
+                continue
+
+            try:
+                essay = self.essay_model.claim_next_evaluation(worker_id, self.lease_seconds)
+            except Exception as e:
+                print(f"❌ Evaluation worker {worker_id} could not claim a job: {e}")
+                essay = None
+
+            if essay is None:
+                # Other processes may enqueue too, so poll even without a notify
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            self._process(essay, worker_id)
+            with self._finished:
+                self._finished.notify_all()
+
+    def _process(self, essay, worker_id):
+        essay_id = str(essay['_id'])
+        attempts = (essay.get('job') or {}).get('attempts', 1)
+
+        if attempts > self.max_attempts:
+            print(f"❌ Giving up on essay {essay_id} after {attempts - 1} attempts")
+            try:
+                self.essay_model.mark_evaluation_failed(essay_id, 'Too many evaluation attempts', worker_id)
+            except Exception as mark_error:
+                # The lease expires and the next claim gives up again
+                print(f"⚠️ Could not mark essay {essay_id} as failed: {mark_error}")
+                return
+            telemetry.increment('evaluation_jobs_abandoned_total')
+            return
+
+        started = time.time()
+        try:
+            print(f"🤖 Worker evaluating essay {essay_id} (attempt {attempts})")
+            # Only the last attempt settles for the fallback evaluation
+            use_fallback = attempts >= self.max_attempts
+            if getattr(self.llm_service, 'combined_mode', False):
+                result = self.llm_service.evaluate_with_statements(
+                    title=essay.get('title', 'Untitled'),
+                    content=essay.get('content', ''),
+                    use_fallback=use_fallback,
+                    essay_id=essay_id
+                )
+                evaluation = result['evaluation']
+            else:
+                result = None
+                evaluation = self.llm_service.evaluate_essay(
+                    title=essay.get('title', 'Untitled'),
+                    content=essay.get('content', ''),
+                    use_fallback=use_fallback,
+                    essay_id=essay_id
+                )
+            statements = result['statements'] if result else None
+            stored = self.essay_model.update_evaluation(
+                essay_id, evaluation, worker_id=worker_id,
+                statements=statements, summary=result['summary'] if statements is not None else None
+            )
+            if stored is None:
+                # Revised and requeued, or the lease expired and another worker took over
+                telemetry.observe('evaluation_job_seconds', time.time() - started, outcome='superseded')
+                print(f"⏭️ Dropping evaluation of essay {essay_id}: job was superseded")
+                return
+            telemetry.observe('evaluation_job_seconds', time.time() - started, outcome='success')
+            print(f"✅ Essay {essay_id} evaluated in {time.time() - started:.1f}s - Score: {evaluation.get('score')}")
+        except Exception as e:
+            telemetry.observe('evaluation_job_seconds', time.time() - started, outcome='retry')
+            retry_in = self.retry_delay * 2 ** (attempts - 1)
+            print(f"❌ Error evaluating essay {essay_id} in worker: {e} - retrying in {retry_in:.0f}s")
+            traceback.print_exc()
+            try:
+                self.essay_model.release_evaluation(essay_id, retry_in, e, worker_id)
+            except Exception as release_error:
+                # The lease still expires on its own
+                print(f"⚠️ Could not release essay {essay_id}: {release_error}")
@@ -0,0 +1,335 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+
+from .cache import stable_hash
+from .tokens import estimate_messages_tokens, estimate_tokens
+
+
+class LLMBackendError(Exception):
+    """A backend could not produce a completion"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        # Read by llm_client.is_retryable
+        self.retryable = retryable
+
+
+def completion_response(text, prompt_tokens=None, completion_tokens=None, finish_reason='stop'):
+    """Non-streamed response shaped like huggingface_hub's ChatCompletionOutput"""
+    usage = None
+    if prompt_tokens is not None and completion_tokens is not None:
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                total_tokens=prompt_tokens + completion_tokens)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(
+            index=0,
+            message=SimpleNamespace(role='assistant', content=text),
+            finish_reason=finish_reason,
+        )],
+        usage=usage,
+    )
+
+
+def stream_chunk(content, finish_reason=None):
+    """Streamed chunk shaped like huggingface_hub's ChatCompletionStreamOutput"""
+    return SimpleNamespace(choices=[SimpleNamespace(
+        index=0,
+        delta=SimpleNamespace(role='assistant', content=content),
+        finish_reason=finish_reason,
+    )])
+
+
+WORD_PIECE_RE = re.compile(r'\S+\s*|\s+')
+
+
+def split_stream_pieces(text):
+    """Word-sized pieces (whitespace kept) used to replay text as a stream"""
+    return WORD_PIECE_RE.findall(text or '')
+
+
+class LLMBackend(ABC):
+    """
+    Interface of an LLM backend: an InferenceClient-compatible
+    `chat_completion(messages=..., model=..., max_tokens=..., stream=False, timeout=None, **kwargs)`
+    returning a completion response, or an iterator of chunks with stream=True.
+    `timeout` (seconds) caps this one call below the backend's own timeout.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    def chat_completion(self, messages, model=None, max_tokens=None, stream=False, timeout=None, **kwargs):
+        """A completion response, or an iterator of chunks with stream=True"""
+
+
+class HuggingFaceBackend(LLMBackend):
+    """Hugging Face Inference API (the production backend)"""
+
+    name = 'huggingface'
+
+    def __init__(self, token=None, timeout=None):
+        token = token or os.getenv('HUGGINGFACE_API_TOKEN')
+        if not token:
+            raise ValueError("HUGGINGFACE_API_TOKEN environment variable not set")
+        from huggingface_hub import InferenceClient
+        self.token = token
+        self.timeout = timeout or float(os.getenv('LLM_TIMEOUT_SECONDS', 60))
+        self.client = InferenceClient(token=token, timeout=self.timeout)
+
+    def chat_completion(self, messages, model=None, max_tokens=None, stream=False, timeout=None, **kwargs):
+        client = self.client
+        if timeout is not None and timeout < self.timeout:
+            # The timeout is per client; a throwaway one is cheap (no connection until the request)
+            from huggingface_hub import InferenceClient
+            client = InferenceClient(token=self.token, timeout=max(timeout, 0.001))
+        return client.chat_completion(
+            messages=messages, model=model, max_tokens=max_tokens, stream=stream, **kwargs
+        )
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Record/replay backend over a JSONL file of responses keyed by
+    (model, messages). In 'record' mode calls go to `inner` and every
+    response is appended to the file; in 'replay' mode stored responses
+    are served and unknown prompts fail without touching the network.
+    """
+
+    name = 'replay'
+
+    def __init__(self, path, mode='replay', inner=None):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown replay mode: {mode}")
+        if mode == 'record' and inner is None:
+            raise ValueError("Record mode needs a backend to record from")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self._responses = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def key(model, messages):
+        return stable_hash(model, json.dumps(messages, sort_keys=True, ensure_ascii=False))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    self._responses[record['key']] = record
+                except (ValueError, KeyError):
+                    print(f"⚠️ Skipping malformed replay record in {self.path}")
+        print(f"📼 Loaded {len(self._responses)} recorded LLM responses from {self.path}")
+
+    def __len__(self):
+        return len(self._responses)
+
+    def chat_completion(self, messages, model=None, max_tokens=None, stream=False, timeout=None, **kwargs):
+        key = self.key(model, messages)
+        if self.mode == 'record':
+            response = self.inner.chat_completion(
+                messages=messages, model=model, max_tokens=max_tokens, stream=stream, timeout=timeout, **kwargs
+            )
+            if stream:
+                return self._record_stream(key, model, messages, response)
+            choice = response.choices[0]
+            usage = getattr(response, 'usage', None)
+            self._store(key, model, messages, choice.message.content or '', choice.finish_reason,
+                        getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None))
+            return response
+
+        record = self._responses.get(key)
+        if record is None:
+            raise LLMBackendError(f"No recorded response for prompt {key[:12]} in {self.path}")
+        if stream:
+            return self._replay_stream(record)
+        return completion_response(record['text'], record.get('prompt_tokens'),
+                                   record.get('completion_tokens'), record.get('finish_reason') or 'stop')
+
+    def _record_stream(self, key, model, messages, stream):
+        pieces = []
+        finish_reason = None
+        for chunk in stream:
+            if chunk.choices:
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                pieces.append(chunk.choices[0].delta.content or '')
+            yield chunk
+        # Only fully consumed streams are recorded
+        self._store(key, model, messages, ''.join(pieces), finish_reason, None, None)
+
+    def _replay_stream(self, record):
+        pieces = split_stream_pieces(record['text'])
+        for piece in pieces:
+            yield stream_chunk(piece)
+        yield stream_chunk('', finish_reason=record.get('finish_reason') or 'stop')
+
+    def _store(self, key, model, messages, text, finish_reason, prompt_tokens, completion_tokens):
+        record = {
+            'key': key,
+            'model': model,
+            'messages': messages,
+            'text': text,
+            'finish_reason': finish_reason,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+        }
+        with self._lock:
+            self._responses[key] = record
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class StubBackend(LLMBackend):
+    """
+    Offline backend producing well-formed evaluation and classification
+    responses. Content is deterministic per prompt; latency follows a
+    log-normal fit of the configured p50/p95 time to first token plus a
+    per-token generation time, so production latency profiles can be
+    reproduced under load.
+    """
+
+    name = 'stub'
+
+    STATEMENT_LINE_RE = re.compile(r'^(\d+)\. (.+)$', re.MULTILINE)
+    ESSAY_RE = re.compile(r'Essay Content:\n(.*?)\n\n\nIMPORTANT:', re.DOTALL)
+    SENTENCE_RE = re.compile(r'[^.!?\n]{20,}[.!?]')
+    TYPES = ('claim', 'evidence', 'transition', 'conclusion')
+
+    def __init__(self, latency_p50_ms=None, latency_p95_ms=None, tokens_per_second=None,
+                 failure_rate=None, seed=None):
+        p50 = latency_p50_ms if latency_p50_ms is not None else float(os.getenv('LLM_STUB_LATENCY_P50_MS', 800))
+        p95 = latency_p95_ms if latency_p95_ms is not None else float(os.getenv('LLM_STUB_LATENCY_P95_MS', 2000))
+        self.latency_mu = math.log(max(p50, 1.0) / 1000.0)
+        # p95 = p50 * exp(1.645 * sigma)
+        self.latency_sigma = max(0.0, math.log(max(p95, p50, 1.0) / max(p50, 1.0)) / 1.645)
+        self.tokens_per_second = tokens_per_second or float(os.getenv('LLM_STUB_TOKENS_PER_SECOND', 60))
+        self.failure_rate = failure_rate if failure_rate is not None else float(os.getenv('LLM_STUB_FAILURE_RATE', 0))
+        self._random = random.Random(seed if seed is not None else os.getenv('LLM_STUB_SEED'))
+        self._lock = threading.Lock()
+
+    def chat_completion(self, messages, model=None, max_tokens=None, stream=False, timeout=None, **kwargs):
+        with self._lock:
+            first_token = self._random.lognormvariate(self.latency_mu, self.latency_sigma)
+            fail = self._random.random() < self.failure_rate
+        if timeout is not None and first_token > timeout:
+            time.sleep(max(0.0, timeout))
+            raise LLMBackendError("Stub backend: request timed out", retryable=True)
+        time.sleep(first_token)
+        if fail:
+            raise LLMBackendError("Stub backend: injected provider failure", retryable=True)
+
+        text = self.respond(messages)
+        finish_reason = 'stop'
+        if max_tokens and estimate_tokens(text) > max_tokens:
+            # Mirror the provider: cut the response at the budget
+            text = text[:int(max_tokens * 4)]
+            finish_reason = 'length'
+
+        if stream:
+            return self._stream(text, finish_reason)
+        time.sleep(estimate_tokens(text) / self.tokens_per_second)
+        return completion_response(text, estimate_messages_tokens(messages), estimate_tokens(text), finish_reason)
+
+    def _stream(self, text, finish_reason):
+        for piece in split_stream_pieces(text):
+            time.sleep(estimate_tokens(piece) / self.tokens_per_second)
+            yield stream_chunk(piece)
+        yield stream_chunk('', finish_reason=finish_reason)
+
+    def respond(self, messages):
+        """Deterministic response text for the prompt"""
+        prompt = messages[-1]['content'] if messages else ''
+        rng = random.Random(stable_hash(prompt))
+        parts = []
+        if 'SCORE:' in prompt:
+            parts.append(self._evaluation(prompt, rng))
+        if 'type=' in prompt:
+            statement_count = len(self.STATEMENT_LINE_RE.findall(prompt.split('Statements:', 1)[-1]))
+            if parts:
+                parts.append('STATEMENT CLASSIFICATION')
+            parts.append(self._classifications(statement_count, rng))
+        return '\n\n'.join(parts) or 'OK'
+
+    def _evaluation(self, prompt, rng):
+        match = self.ESSAY_RE.search(prompt)
+        essay = match.group(1) if match else ''
+        sentences = [s.strip() for s in self.SENTENCE_RE.findall(essay)]
+        error_lines = []
+        for sentence in rng.sample(sentences, min(3, len(sentences))):
+            quote = ' '.join(sentence.split()[:6])
+            error_lines.append(f'- Possible comma splice in "{quote}" → Suggestion: split into two sentences')
+        grammar_errors = '\n'.join(error_lines) or 'No significant errors found'
+        score = rng.randint(55, 92)
+        ai_label = rng.choice(['Human-written', 'Human-written', 'Possibly AI-assisted', 'Likely AI-generated'])
+        rating = 'Excellent' if score >= 85 else 'Good' if score >= 70 else 'Fair'
+        return f"""SCORE: {score}
+
+AI DETECTION: {ai_label}
+
+GRAMMAR ERRORS:
+{grammar_errors}
+
+GRAMMAR RATING: {rating}
+
+STRUCTURE: The essay has a recognisable introduction, body and conclusion. Paragraph breaks follow the main points, although some paragraphs combine two ideas.
+
+CONTENT QUALITY: The main argument is stated clearly and supported with relevant points. Several claims would be stronger with specific evidence or sources.
+
+COHERENCE: Ideas generally follow one another logically. A few transitions between paragraphs are abrupt.
+
+SUGGESTIONS:
+1. State the thesis explicitly at the end of the introduction
+2. Support each main claim with a concrete example or citation
+3. Add transition sentences between body paragraphs
+4. Split long sentences that carry more than one idea
+5. Tie the conclusion back to the thesis
+
+OVERALL FEEDBACK: A solid essay with a clear position and reasonable organisation. Stronger evidence and smoother transitions would raise it further."""
+
+    def _classifications(self, count, rng):
+        lines = []
+        for i in range(count):
+            kind = 'claim' if i == 0 else 'conclusion' if i == count - 1 else rng.choice(self.TYPES)
+            lines.append(f"{i + 1}: type={kind} | strength={rng.uniform(0.4, 0.95):.2f}")
+        return '\n'.join(lines)
+
+
+BACKENDS = ('huggingface', 'replay', 'stub')
+
+
+def create_backend(name=None):
+    """
+    Build the backend selected by LLM_BACKEND (huggingface, replay or stub).
+    Replay reads LLM_REPLAY_PATH and LLM_REPLAY_MODE ('replay' or 'record';
+    recording wraps the Hugging Face backend).
+    """
+    name = (name or os.getenv('LLM_BACKEND', 'huggingface')).lower()
+    if name == 'huggingface':
+        return HuggingFaceBackend()
+    if name == 'replay':
+        mode = os.getenv('LLM_REPLAY_MODE', 'replay').lower()
+        return ReplayBackend(
+            os.getenv('LLM_REPLAY_PATH', 'llm_recordings.jsonl'),
+            mode=mode,
+            inner=HuggingFaceBackend() if mode == 'record' else None
+        )
+    if name == 'stub':
+        return StubBackend()
+    raise ValueError(f"Unknown LLM_BACKEND '{name}' (expected one of: {', '.join(BACKENDS)})")
@@ -0,0 +1,287 @@
+import os
+import random
+import threading
+import time
+
+from .telemetry import telemetry
+
+
+class LLMUnavailableError(Exception):
+    """The LLM provider could not serve the call (circuit open, deadline hit, retries exhausted)"""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """Raised without calling the provider while the circuit breaker is open"""
+
+
+class DeadlineExceededError(LLMUnavailableError):
+    """The call's deadline passed while queued or between retries"""
+
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by all threads of a process"""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to `timeout` seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures.
+    Open -> half-open after `reset_timeout` seconds, letting one probe call
+    through; its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_started = None
+            # A probe that never reported back (e.g. it timed out in the queue) is replaced
+            if self.state == self.HALF_OPEN and (
+                    self._probe_started is None or now - self._probe_started >= self.reset_timeout):
+                self._probe_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"🔌 LLM circuit breaker opened after {self._failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+
+def is_retryable(error):
+    """Timeouts, connection errors, 429 and 5xx are worth retrying; other 4xx are not"""
+    retryable = getattr(error, 'retryable', None)
+    if retryable is not None:
+        return retryable
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return True
+
+
+class ResilientLLMClient:
+    """
+    Wraps an InferenceClient-compatible client (an LLMBackend) with a concurrency cap,
+    a token-bucket rate limiter, per-call deadlines, jittered exponential
+    retries and a circuit breaker. `chat_completion` keeps the wrapped
+    client's signature, plus optional `deadline` (seconds) and `purpose`
+    (telemetry label) keywords. The deadline covers the whole call: slot and
+    rate-limit waits, backoff sleeps, and each provider attempt, whose
+    timeout is capped at the time remaining.
+    """
+
+    def __init__(self, client, max_concurrency=None, rate_per_second=None, burst=None,
+                 deadline=None, max_retries=None, backoff_base=None, backoff_max=None,
+                 breaker=None):
+        self.client = client
+        self.max_concurrency = max_concurrency or int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+        self.deadline = deadline or float(os.getenv('LLM_DEADLINE_SECONDS', 120))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('LLM_MAX_RETRIES', 2))
+        self.backoff_base = backoff_base or float(os.getenv('LLM_BACKOFF_BASE_SECONDS', 1))
+        self.backoff_max = backoff_max or float(os.getenv('LLM_BACKOFF_MAX_SECONDS', 10))
+        self.rate_limiter = TokenBucket(
+            rate_per_second or float(os.getenv('LLM_RATE_PER_SECOND', 2)),
+            burst or int(os.getenv('LLM_BURST', 4))
+        )
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=int(os.getenv('LLM_BREAKER_FAILURES', 5)),
+            reset_timeout=float(os.getenv('LLM_BREAKER_RESET_SECONDS', 30))
+        )
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._metrics_lock = threading.Lock()
+        self._in_flight = 0
+        self._metrics = {
+            'calls': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'retries': 0,
+            'rejected': 0,
+            'queue_wait_seconds': 0.0,
+            'model_seconds': 0.0,
+            'max_queue_wait_seconds': 0.0,
+            'max_model_seconds': 0.0,
+        }
+
+    def chat_completion(self, deadline=None, purpose='unspecified', **kwargs):
+        expires = time.monotonic() + (self.deadline if deadline is None else deadline)
+        attempt = 0
+
+        while True:
+            if not self.breaker.allow():
+                self._record(rejected=1, purpose=purpose, outcome='rejected')
+                raise CircuitOpenError("LLM provider circuit is open - failing fast")
+
+            queued = time.monotonic()
+            self._acquire(expires, purpose)
+            queue_wait = time.monotonic() - queued
+
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                self._release()
+                self._record(failed=1, queue_wait=queue_wait, purpose=purpose, outcome='deadline')
+                raise DeadlineExceededError("LLM call deadline passed before the provider was called")
+
+            started = time.monotonic()
+            try:
+                response = self.client.chat_completion(timeout=remaining, **kwargs)
+            except Exception as e:
+                self._release()
+                model_time = time.monotonic() - started
+                retryable = is_retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    # A 4xx from the provider means a bad request, not an outage
+                    self.breaker.record_success()
+
+                backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if not retryable or attempt >= self.max_retries or time.monotonic() + backoff >= expires:
+                    self._record(failed=1, queue_wait=queue_wait, model_time=model_time,
+                                 purpose=purpose, outcome='failure')
+                    raise
+                attempt += 1
+                self._record(retries=1, queue_wait=queue_wait, model_time=model_time, count=False,
+                             purpose=purpose, outcome='retry')
+                print(f"🔁 LLM call failed ({e}); retry {attempt}/{self.max_retries} in {backoff:.1f}s")
+                time.sleep(backoff)
+                continue
+
+            if kwargs.get('stream'):
+                # The slot stays taken until the stream is consumed
+                return self._guard_stream(response, started, queue_wait, purpose)
+
+            self._release()
+            self.breaker.record_success()
+            self._record(succeeded=1, queue_wait=queue_wait, model_time=time.monotonic() - started,
+                         purpose=purpose, outcome='success')
+            return response
+
+    def _acquire(self, expires, purpose=None):
+        """Wait for a concurrency slot and a rate-limit token before the deadline"""
+        if not self._slots.acquire(timeout=max(0.0, expires - time.monotonic())):
+            self._record(failed=1, purpose=purpose, outcome='deadline')
+            raise DeadlineExceededError("Timed out waiting for a free LLM slot")
+        if not self.rate_limiter.acquire(timeout=max(0.0, expires - time.monotonic())):
+            self._slots.release()
+            self._record(failed=1, purpose=purpose, outcome='deadline')
+            raise DeadlineExceededError("Timed out waiting for the LLM rate limiter")
+        with self._metrics_lock:
+            self._in_flight += 1
+
+    def _release(self):
+        with self._metrics_lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    @property
+    def idle_slots(self):
+        """Concurrency slots not taken right now (a hint; it can change at once)"""
+        with self._metrics_lock:
+            return self.max_concurrency - self._in_flight
+
+    def _guard_stream(self, stream, started, queue_wait, purpose=None):
+        try:
+            for chunk in stream:
+                yield chunk
+        except Exception:
+            self.breaker.record_failure()
+            self._record(failed=1, queue_wait=queue_wait, model_time=time.monotonic() - started,
+                         purpose=purpose, outcome='failure')
+            raise
+        else:
+            self.breaker.record_success()
+            self._record(succeeded=1, queue_wait=queue_wait, model_time=time.monotonic() - started,
+                         purpose=purpose, outcome='success')
+        finally:
+            self._release()
+
+    def _record(self, succeeded=0, failed=0, retries=0, rejected=0, queue_wait=0.0,
+                model_time=0.0, count=True, purpose=None, outcome=None):
+        with self._metrics_lock:
+            m = self._metrics
+            m['calls'] += 1 if count else 0
+            m['succeeded'] += succeeded
+            m['failed'] += failed
+            m['retries'] += retries
+            m['rejected'] += rejected
+            m['queue_wait_seconds'] += queue_wait
+            m['model_seconds'] += model_time
+            m['max_queue_wait_seconds'] = max(m['max_queue_wait_seconds'], queue_wait)
+            m['max_model_seconds'] = max(m['max_model_seconds'], model_time)
+
+        if purpose is not None:
+            telemetry.increment('llm_attempts_total', purpose=purpose, outcome=outcome)
+            if model_time:
+                # Only attempts that reached the provider
+                telemetry.observe('llm_queue_wait_seconds', queue_wait, purpose=purpose)
+                telemetry.observe('llm_model_seconds', model_time, purpose=purpose, outcome=outcome)
+
+    def stats(self):
+        """Snapshot of call counts and queue-wait vs model time"""
+        with self._metrics_lock:
+            m = dict(self._metrics)
+        attempts = max(m['succeeded'] + m['failed'] + m['retries'], 1)
+        m['avg_queue_wait_seconds'] = round(m['queue_wait_seconds'] / attempts, 3)
+        m['avg_model_seconds'] = round(m['model_seconds'] / attempts, 3)
+        m['circuit_state'] = self.breaker.state
+        m['max_concurrency'] = self.max_concurrency
+        m['in_flight'] = self.max_concurrency - self.idle_slots
+        return m
@@ -1,37 +1,376 @@
-from huggingface_hub import InferenceClient
 import os
 import re
-
-# Try to import spaCy (optional - will use fallback if not available)
-try:
-    import spacy
-    nlp = spacy.load("en_core_web_sm")
-    SPACY_AVAILABLE = True
-except:
-    SPACY_AVAILABLE = False
-    print("⚠️ spaCy not available - using basic sentence splitting")
+import time
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from . import deadline
+from .evaluation_parser import EvaluationParser, merge_evaluations, sections_from_evaluation
+from .llm_backends import create_backend
+from .llm_client import DeadlineExceededError, ResilientLLMClient
+from .local_scorer import local_evaluation, local_scorer
+from .segmentation import segment, segment_many
+from .statement_features import compute_features, summarize
+from .statement_graph import entity_links, similarity_links
+from .telemetry import TOKEN_BUCKETS, telemetry
+from .tokens import (
+    batch_ranges, chunk_paragraphs, classification_output_budget, estimate_messages_tokens,
+    estimate_tokens, evaluation_output_budget, split_paragraphs,
+)
+
+# Bump whenever the evaluation prompt or parser changes so cached results are not reused
+EVALUATION_PROMPT_VERSION = 'eval-v2'
+# Same for the statement classification prompt (sentence-level cache)
+CLASSIFICATION_PROMPT_VERSION = 'classify-v1'
+
+# Evaluation fields kept per paragraph for incremental re-evaluation
+PARAGRAPH_EVALUATION_FIELDS = (
+    'score', 'grammar', 'ai_detection_score', 'structure', 'content', 'coherence',
+    'feedback', 'suggestions', 'error_feedback', 'total_grammar_errors',
+)
+
+# "3: type=claim | strength=0.8" lines of a classification response
+CLASSIFICATION_LINE_RE = re.compile(
+    r'^\W*(\d+)\s*[:.)]\s*type\s*=\s*(\w+)\s*\|\s*strength\s*=\s*([\d.]+)',
+    re.IGNORECASE | re.MULTILINE
+)
+# Statements are cut to this many characters in classification prompts
+STATEMENT_PROMPT_CHARS = 150
+# Header separating the evaluation from the classifications in combined mode
+STATEMENTS_HEADER_RE = re.compile(r'^\W*STATEMENT CLASSIFICATIONS?\W*$', re.IGNORECASE | re.MULTILINE)
 
 
 class LLMService:
     def __init__(self):
-        self.api_token = os.getenv('HUGGINGFACE_API_TOKEN')
-        if not self.api_token:
-            raise ValueError("HUGGINGFACE_API_TOKEN environment variable not set")
+        # LLM_BACKEND=huggingface (default), replay or stub - see app/services/llm_backends.py
+        self.backend = create_backend()
+        print(f"🔌 LLM backend: {self.backend.name}")
         
-        self.client = InferenceClient(token=self.api_token)
+        # Shared by all Flask threads: concurrency cap, rate limit, retries, circuit breaker
+        self.client = ResilientLLMClient(self.backend)
         self.model = "meta-llama/Llama-3.1-8B-Instruct"
+        self.cache = None
+        self.classification_cache = None
+        self.doc_cache = None
+        
+        # Essays longer than this (estimated tokens) are evaluated chunk by chunk in parallel
+        self.chunk_tokens = int(os.getenv('EVAL_CHUNK_TOKENS', 3000))
+        self.chunk_parallelism = int(os.getenv('EVAL_CHUNK_PARALLELISM', self.client.max_concurrency))
+        
+        # Statement classification is split into batches of at most this many prompt tokens / statements
+        self.classify_batch_tokens = int(os.getenv('CLASSIFY_BATCH_TOKENS', 1500))
+        self.classify_batch_size = int(os.getenv('CLASSIFY_BATCH_SIZE', 50))
+        self.classify_min_batch = int(os.getenv('CLASSIFY_MIN_BATCH', 20))
+        
+        # Opt-in: evaluate and classify statements in one call (see evaluate_with_statements)
+        self.combined_mode = os.getenv('LLM_COMBINED_MODE', 'false').lower() in ('1', 'true', 'yes')
+        
+        # Hedging: a call still running past this percentile of its purpose's model time gets a twin
+        self.hedging = os.getenv('LLM_HEDGING', 'true').lower() in ('1', 'true', 'yes')
+        self.hedge_percentile = float(os.getenv('LLM_HEDGE_PERCENTILE', 0.95))
+        self.hedge_min_delay = float(os.getenv('LLM_HEDGE_MIN_DELAY_SECONDS', 1))
+        self.latency_min_samples = int(os.getenv('LLM_LATENCY_MIN_SAMPLES', 20))
+        # Below this much remaining request budget an LLM call is not attempted
+        self.min_call_seconds = float(os.getenv('LLM_MIN_CALL_SECONDS', 3))
+        # Losing hedges finish in the background, so the pool is larger than the slot count
+        self._hedge_pool = ThreadPoolExecutor(max_workers=self.client.max_concurrency * 4,
+                                              thread_name_prefix='llm-call')
+    
+    def attach_cache(self, cache):
+        """Attach an EvaluationCache (see app/services/cache.py)"""
+        self.cache = cache
+    
+    def attach_classification_cache(self, cache):
+        """Attach a ClassificationCache (see app/services/cache.py)"""
+        self.classification_cache = cache
+    
+    def attach_doc_cache(self, cache):
+        """Attach a DocCache (see app/services/cache.py) so essays are not re-parsed"""
+        self.doc_cache = cache
+    
+    def evaluate_essay(self, title: str, content: str, use_fallback: bool = True, essay_id: str = None) -> dict:
+        """
+        Comprehensive essay evaluation including grammar checking and AI detection.
+        With use_fallback=False, LLM errors are raised instead of returning
+        the score-0 fallback evaluation (used by the background workers).
+        With essay_id the local scorer reuses the essay's cached spaCy parse.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(content, self.model, EVALUATION_PROMPT_VERSION)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"⚡ Evaluation cache hit ({cache_key[:12]})")
+                cached['llm_usage'] = [self._cached_usage_entry('evaluation')]
+                return cached
+        
+        local = self._local_tier_evaluation(content, essay_id)
+        if local is not None:
+            return local
+        
+        if not self.budget_allows('evaluation'):
+            telemetry.increment('evaluation_budget_fallbacks_total', purpose='evaluation')
+            print(f"⏱️ {deadline.remaining():.1f}s left in the request budget - using the local scorer")
+            return self._fallback_evaluation(content, essay_id)
+        
+        try:
+            evaluation = self._request_evaluation(title, content)
+        except Exception as e:
+            print(f"❌ Error evaluating essay with LLM: {str(e)}")
+            if not use_fallback:
+                raise
+            import traceback
+            traceback.print_exc()
+            return self._fallback_evaluation(content, essay_id)
+        
+        # Fallback and partial results are never cached, so a transient failure is retried next time
+        if cache_key is not None and not evaluation.get('failed_chunks'):
+            self._cache_evaluation(cache_key, evaluation)
+        
+        return evaluation
+    
+    def evaluate_with_statements(self, title: str, content: str, use_fallback: bool = True,
+                                 essay_id: str = None) -> dict:
+        """
+        Combined mode: evaluate the essay and classify its statements in a
+        single LLM call. Returns {'evaluation', 'statements', 'summary'};
+        statements is None when they were not classified (cached evaluation,
+        long essay, LLM failure) and are left to extract_atomic_statements.
+        With essay_id the spaCy parse is kept for later analyses.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(content, self.model, EVALUATION_PROMPT_VERSION)
+        
+        cached = cache_key is not None and self.cache.get(cache_key) is not None
+        # As in evaluate_essay: a cached evaluation first, then the local tier
+        local = None if cached else self._local_tier_evaluation(content, essay_id)
+        if local is not None:
+            return {'evaluation': local, 'statements': None, 'summary': None}
+        
+        statements = []
+        if estimate_tokens(content) <= self.chunk_tokens:
+            statements = self._segment_sentences(content, self._parse(content, essay_id))
+        if not statements or not self.budget_allows('evaluation_with_statements') or cached:
+            # Nothing to share a round trip with - classification stays on demand
+            return {'evaluation': self.evaluate_essay(title, content, use_fallback, essay_id),
+                    'statements': None, 'summary': None}
+        
+        try:
+            print(f"🤖 Calling Llama 3.1 for combined evaluation + {len(statements)} statement classifications...")
+            usage_log = []
+            response_text = self._chat(
+                'evaluation_with_statements',
+                self._build_evaluation_messages(title, content, statements=statements),
+                max_tokens=evaluation_output_budget(content) + classification_output_budget(len(statements)),
+                usage_log=usage_log,
+                temperature=0.5,
+                top_p=0.95
+            )
+        except Exception as e:
+            print(f"❌ Error in combined evaluation: {str(e)}")
+            if not use_fallback:
+                raise
+            import traceback
+            traceback.print_exc()
+            return {'evaluation': self._fallback_evaluation(content, essay_id), 'statements': None, 'summary': None}
+        
+        # Headers are matched at line start, so the classification block is cut off first
+        header = STATEMENTS_HEADER_RE.search(response_text)
+        evaluation_text = response_text[:header.start()] if header else response_text
+        classification_text = response_text[header.end():] if header else response_text
+        
+        evaluation = self._fill_missing_sections(self._parse_evaluation(evaluation_text, content))
+        evaluation['llm_usage'] = usage_log
+        if cache_key is not None:
+            self._cache_evaluation(cache_key, evaluation)
+        
+        statements = self._apply_classifications(statements, classification_text)
+        return {
+            'evaluation': evaluation,
+            'statements': statements,
+            'summary': self._generate_statement_summary(statements),
+        }
     
-    def evaluate_essay(self, title: str, content: str) -> dict:
+    def _local_tier_evaluation(self, content: str, essay_id: str = None):
+        """Local evaluation when the trained scorer says no LLM pass is needed, else None"""
+        # Off by default: then no features are extracted (no spaCy parse) at all
+        if not local_scorer.tier_enabled:
+            return None
+        try:
+            result = local_scorer.score(content, self._parse(content, essay_id))
+        except Exception as e:
+            print(f"⚠️ Local scorer failed: {e}")
+            return None
+        if not local_scorer.skip_llm(result):
+            return None
+        print(f"📈 Local tier: score {result['score']} (±{result['uncertainty']}) - skipping the LLM")
+        telemetry.increment('evaluation_local_tier_total')
+        return local_evaluation(content, result, 'tier')
+    
+    def _cache_evaluation(self, cache_key, evaluation):
+        cacheable = {k: v for k, v in evaluation.items() if k != 'llm_usage'}
+        self.cache.set(cache_key, cacheable, self.model, EVALUATION_PROMPT_VERSION)
+    
+    def _chat(self, purpose: str, messages: list, max_tokens: int, usage_log: list, **kwargs) -> str:
+        """chat_completion returning the text; appends a usage entry to usage_log"""
+        if not self.budget_allows(purpose):
+            telemetry.increment('llm_budget_skips_total', purpose=purpose)
+            raise DeadlineExceededError(f"Request budget too small for a {purpose} call")
+        # Wall time includes rate limiting, queueing, retries and hedging (see llm_model_seconds)
+        with telemetry.timer('llm_call_seconds', purpose=purpose):
+            response = self._hedged_completion(
+                purpose,
+                messages=messages,
+                model=self.model,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+        choice = response.choices[0]
+        text = choice.message.content or ''
+        usage_log.append(self._usage_entry(
+            purpose, messages, text, max_tokens,
+            usage=getattr(response, 'usage', None),
+            finish_reason=getattr(choice, 'finish_reason', None)
+        ))
+        return text
+    
+    def _model_seconds(self, q, purpose):
+        """Quantile q of successful model time for a purpose, None until there are enough samples"""
+        value, count = telemetry.quantile('llm_model_seconds', q, purpose=purpose, outcome='success')
+        return value if count >= self.latency_min_samples else None
+    
+    def budget_allows(self, purpose: str) -> bool:
+        """False when the request budget cannot cover a typical (median) call for this purpose"""
+        remaining = deadline.remaining()
+        if remaining is None:
+            return True
+        return remaining >= max(self.min_call_seconds, self._model_seconds(0.5, purpose) or 0.0)
+    
+    def _hedged_completion(self, purpose: str, **kwargs):
         """
-        Comprehensive essay evaluation including grammar checking and AI detection
+        Non-streaming chat_completion bounded by the request budget. If the
+        call outlives the hedge percentile of its purpose, an identical
+        second call is sent and whichever answers first wins; the loser
+        is left to finish in the background.
         """
+        hedge_after = self._hedge_delay(purpose)
+        if hedge_after is None and deadline.remaining() is None:
+            return self.client.chat_completion(purpose=purpose, **kwargs)
+        
+        def call():
+            return self.client.chat_completion(deadline=deadline.remaining(), purpose=purpose, **kwargs)
+        
+        pending = {deadline.submit(self._hedge_pool, call): 'primary'}
+        if hedge_after is not None:
+            done, _ = wait(pending, timeout=hedge_after)
+            if not done and self._can_hedge(purpose):
+                print(f"🏁 {purpose} call still running after {hedge_after:.1f}s - sending a hedged request")
+                telemetry.increment('llm_hedges_total', purpose=purpose)
+                pending[deadline.submit(self._hedge_pool, call)] = 'hedge'
+        hedged = len(pending) > 1
+        
+        error = None
+        while pending:
+            done, _ = wait(pending, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                telemetry.increment('llm_budget_timeouts_total', purpose=purpose)
+                raise DeadlineExceededError(f"Request budget ran out waiting for the {purpose} call")
+            for future in done:
+                role = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if hedged:
+                    telemetry.increment('llm_hedge_wins_total', purpose=purpose, winner=role)
+                return response
+        raise error
+    
+    def _hedge_delay(self, purpose: str):
+        """Seconds to wait before hedging a call, None while hedging is off or latency is unknown"""
+        if not self.hedging:
+            return None
+        threshold = self._model_seconds(self.hedge_percentile, purpose)
+        return None if threshold is None else max(self.hedge_min_delay, threshold)
+    
+    def _can_hedge(self, purpose: str) -> bool:
+        """A hedge needs a free slot, a closed circuit and enough budget left to finish"""
+        if self.client.idle_slots <= 0 or self.client.breaker.state != 'closed':
+            return False
+        return self.budget_allows(purpose)
+    
+    def _usage_entry(self, purpose, messages, completion_text, max_tokens, usage=None, finish_reason=None):
+        """Token accounting for one call (provider counts when reported, estimates otherwise)"""
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        estimated = prompt_tokens is None or completion_tokens is None
+        if estimated:
+            prompt_tokens = estimate_messages_tokens(messages)
+            completion_tokens = estimate_tokens(completion_text)
+        telemetry.observe('llm_prompt_tokens', prompt_tokens, buckets=TOKEN_BUCKETS, purpose=purpose)
+        telemetry.observe('llm_completion_tokens', completion_tokens, buckets=TOKEN_BUCKETS, purpose=purpose)
+        if finish_reason == 'length':
+            telemetry.increment('llm_truncated_total', purpose=purpose)
+        return {
+            'purpose': purpose,
+            'model': self.model,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'max_tokens': max_tokens,
+            'finish_reason': finish_reason,
+            'estimated': estimated,
+            'cached': False,
+            'at': datetime.now(),
+        }
+    
+    def _cached_usage_entry(self, purpose):
+        telemetry.increment('evaluation_cache_hits_total', purpose=purpose)
+        return {
+            'purpose': purpose,
+            'model': self.model,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'max_tokens': 0,
+            'finish_reason': None,
+            'estimated': False,
+            'cached': True,
+            'at': datetime.now(),
+        }
+    
+    def _build_evaluation_messages(self, title: str, content: str, part: tuple = None,
+                                   statements: list = None) -> list:
+        """
+        Chat messages for a full essay evaluation (or one (index, total) part
+        of it). With `statements`, the response must also classify each one.
+        """
+        part_note = ''
+        if part:
+            part_note = (f"\n\nNOTE: This is part {part[0]} of {part[1]} of a longer essay. "
+                         f"Evaluate this part on its own merits; other parts are evaluated separately.")
+        
+        statements_note = ''
+        if statements:
+            statements_note = f"""
+
+
+STATEMENT CLASSIFICATION
+[After the sections above, write the line "STATEMENT CLASSIFICATION" and classify EACH of these {len(statements)} statements from the essay]
+Type: claim, evidence, transition, or conclusion. Strength: 0.0 to 1.0
+
+Statements:
+{self._format_statement_list(statements)}
+
+Respond EXACTLY in this format (one per line, all {len(statements)} statements):
+1: type=claim | strength=0.8
+2: type=evidence | strength=0.9"""
         
         system_prompt = """You are an expert academic essay evaluator. You MUST provide detailed analysis for ALL categories. Never skip any section. Be specific and constructive."""
         
         user_prompt = f"""Evaluate this essay thoroughly. You MUST fill out ALL sections below.
 
 
-Essay Title: {title}
+Essay Title: {title}{part_note}
 
 
 Essay Content:
@@ -76,248 +415,321 @@ SUGGESTIONS:
 OVERALL FEEDBACK: [Write 2-3 comprehensive sentences summarizing strengths and areas for improvement]
 
 
-Remember: Fill out EVERY section above. Be specific and helpful. Return those data BASED on the language used in the uploaded essay"""
-
+Remember: Fill out EVERY section above. Be specific and helpful. Return those data BASED on the language used in the uploaded essay{statements_note}"""
 
-        try:
-            print(f"🤖 Calling Llama 3.1 for essay evaluation...")
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-            
-            response = self.client.chat_completion(
-                messages=messages,
-                model=self.model,
-                max_tokens=2000,  # Increased for more detailed response
-                temperature=0.5,  # Lower for more consistent formatting
-                top_p=0.95
-            )
-            
-            response_text = response.choices[0].message.content
-            print(f"✅ Received response from Llama 3.1")
-            print(f"📄 Response preview: {response_text[:200]}...")
-            
-            evaluation = self._parse_evaluation(response_text, content)
-            
-            # Ensure all fields have values
-            if evaluation['grammar'] == 'Not evaluated':
-                evaluation['grammar'] = 'Good'
-            if evaluation['structure'] == 'Not evaluated':
-                evaluation['structure'] = 'The essay demonstrates basic organizational structure with clear paragraphs.'
-            if evaluation['content'] == 'Not evaluated':
-                evaluation['content'] = 'The content addresses the topic with relevant points and examples.'
-            if evaluation['coherence'] == 'Not evaluated':
-                evaluation['coherence'] = 'The ideas flow logically with appropriate transitions between sections.'
-            
-            return evaluation
-            
-        except Exception as e:
-            print(f"❌ Error evaluating essay with LLM: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return self._fallback_evaluation()
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
     
-    def _parse_evaluation(self, response: str, original_content: str) -> dict:
-        """Parse the LLM response into structured data"""
-        print("📋 Parsing LLM response...")
-        lines = response.strip().split('\n')
-        
-        evaluation = {
-            'score': 75,
-            'grammar': 'Not evaluated',
-            'structure': 'Not evaluated',
-            'content': 'Not evaluated',
-            'coherence': 'Not evaluated',
-            'suggestions': [],
-            'feedback': '',
-            'total_grammar_errors': 0,
-            'error_feedback': [],
-            'ai_detection_label': 'Human-written',
-            'ai_detection_score': 0.95,
-            'num_sentences': 0,
-            'num_tokens': 0,
-            'avg_sentence_length': 0
-        }
+    def _request_evaluation(self, title: str, content: str) -> dict:
+        """Call the LLM and parse its evaluation (raises on failure)"""
+        if estimate_tokens(content) > self.chunk_tokens:
+            return self._request_chunked_evaluation(title, content)
         
-        current_section = None
-        suggestions_list = []
-        feedback_parts = []
-        grammar_errors = []
-        grammar_rating = ''
-        structure_parts = []
-        content_parts = []
-        coherence_parts = []
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # Parse SCORE
-            if 'SCORE:' in line:
+        print(f"🤖 Calling Llama 3.1 for essay evaluation...")
+        
+        usage_log = []
+        response_text = self._chat(
+            'evaluation',
+            self._build_evaluation_messages(title, content),
+            max_tokens=evaluation_output_budget(content),
+            usage_log=usage_log,
+            temperature=0.5,  # Lower for more consistent formatting
+            top_p=0.95
+        )
+        print(f"✅ Received response from Llama 3.1")
+        print(f"📄 Response preview: {response_text[:200]}...")
+        
+        evaluation = self._fill_missing_sections(self._parse_evaluation(response_text, content))
+        evaluation['llm_usage'] = usage_log
+        return evaluation
+    
+    def _request_chunked_evaluation(self, title: str, content: str) -> dict:
+        """
+        Map-reduce evaluation for essays that do not fit one prompt:
+        paragraphs are packed into token-budgeted chunks, chunks are
+        evaluated concurrently and the results merged into one evaluation.
+        """
+        chunks = chunk_paragraphs(split_paragraphs(content), self.chunk_tokens)
+        total = len(chunks)
+        print(f"🧩 Long essay: evaluating {total} chunks, {self.chunk_parallelism} at a time")
+        
+        usage_log = []
+        
+        evaluations = []
+        weights = []
+        errors = []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.chunk_parallelism, total))) as executor:
+            futures = [
+                deadline.submit(executor, self._evaluate_part, title, chunk, (i + 1, total), usage_log,
+                                'evaluation_chunk')
+                for i, chunk in enumerate(chunks)
+            ]
+            for index, future in enumerate(futures):
                 try:
-                    score_text = line.split('SCORE:')[1].strip()
-                    numbers = re.findall(r'\d+', score_text)
-                    if numbers:
-                        score = int(numbers[0])
-                        evaluation['score'] = min(100, max(0, score))
-                        print(f"   ✓ Score: {evaluation['score']}")
+                    evaluations.append(future.result())
+                    weights.append(estimate_tokens(chunks[index]))
                 except Exception as e:
-                    print(f"   ⚠ Error parsing score: {e}")
-                current_section = None
-            
-            # Parse AI DETECTION
-            elif 'AI DETECTION:' in line:
-                ai_text = line.split('AI DETECTION:')[1].strip().lower()
-                if 'human' in ai_text:
-                    evaluation['ai_detection_label'] = 'Human-written'
-                    evaluation['ai_detection_score'] = 0.95
-                elif 'ai-assisted' in ai_text or 'assisted' in ai_text:
-                    evaluation['ai_detection_label'] = 'Possibly AI-assisted'
-                    evaluation['ai_detection_score'] = 0.5
-                elif 'ai-generated' in ai_text or 'generated' in ai_text:
-                    evaluation['ai_detection_label'] = 'Likely AI-generated'
-                    evaluation['ai_detection_score'] = 0.1
-                print(f"   ✓ AI Detection: {evaluation['ai_detection_label']}")
-                current_section = None
-            
-            # Parse GRAMMAR ERRORS
-            elif 'GRAMMAR ERRORS:' in line:
-                current_section = 'grammar_errors'
-                remaining = line.split('GRAMMAR ERRORS:')[1].strip()
-                if remaining and len(remaining) > 10:
-                    grammar_errors.append(remaining)
-            
-            # Parse GRAMMAR RATING
-            elif 'GRAMMAR RATING:' in line:
-                grammar_rating = line.split('GRAMMAR RATING:')[1].strip()
-                evaluation['grammar'] = grammar_rating
-                print(f"   ✓ Grammar: {grammar_rating}")
-                current_section = None
-            
-            # Parse STRUCTURE
-            elif 'STRUCTURE:' in line:
-                text = line.split('STRUCTURE:')[1].strip()
-                if text:
-                    structure_parts.append(text)
-                current_section = 'structure'
-            
-            # Parse CONTENT QUALITY or CONTENT
-            elif 'CONTENT QUALITY:' in line or (line.startswith('CONTENT:') and 'QUALITY' not in line):
-                text = line.split(':')[1].strip() if ':' in line else ''
-                if text:
-                    content_parts.append(text)
-                current_section = 'content'
-            
-            # Parse COHERENCE
-            elif 'COHERENCE:' in line:
-                text = line.split('COHERENCE:')[1].strip()
-                if text:
-                    coherence_parts.append(text)
-                current_section = 'coherence'
-            
-            # Parse SUGGESTIONS
-            elif 'SUGGESTIONS:' in line:
-                current_section = 'suggestions'
-            
-            # Parse OVERALL FEEDBACK
-            elif 'OVERALL FEEDBACK:' in line:
-                text = line.split('OVERALL FEEDBACK:')[1].strip()
-                if text:
-                    feedback_parts.append(text)
-                current_section = 'feedback'
-            
-            # Continue parsing current section
-            elif current_section == 'grammar_errors':
-                if line and not any(x in line for x in ['GRAMMAR RATING', 'STRUCTURE', 'CONTENT', 'COHERENCE', 'SUGGESTIONS', 'OVERALL']):
-                    grammar_errors.append(line)
-            
-            elif current_section == 'structure':
-                if not any(x in line for x in ['CONTENT', 'COHERENCE', 'SUGGESTIONS', 'OVERALL']):
-                    structure_parts.append(line)
-            
-            elif current_section == 'content':
-                if not any(x in line for x in ['COHERENCE', 'SUGGESTIONS', 'OVERALL']):
-                    content_parts.append(line)
-            
-            elif current_section == 'coherence':
-                if not any(x in line for x in ['SUGGESTIONS', 'OVERALL']):
-                    coherence_parts.append(line)
-            
-            elif current_section == 'suggestions':
-                if 'OVERALL' not in line:
-                    cleaned = re.sub(r'^[\d\.\-\*\)]+\s*', '', line).strip()
-                    if cleaned and len(cleaned) > 5:
-                        suggestions_list.append(cleaned)
-            
-            elif current_section == 'feedback':
-                if line:
-                    feedback_parts.append(line)
+                    print(f"⚠️ Chunk {index + 1}/{total} failed: {e}")
+                    errors.append(e)
         
-        # Process results
-        evaluation['total_grammar_errors'] = len(grammar_errors)
+        # A partial evaluation beats the score-0 fallback, but not if most chunks failed
+        if len(errors) * 2 > total:
+            raise errors[0]
         
-        # Format grammar errors
-        error_feedback = []
-        for error in grammar_errors[:10]:
-            if 'no' in error.lower() and ('error' in error.lower() or 'issue' in error.lower()):
-                continue
-            
-            error_clean = error.lstrip('-•').lstrip('0123456789.').strip()
-            
-            if '→' in error_clean:
-                parts = error_clean.split('→')
-                message = parts[0].strip()
-                suggestion = parts[1].replace('Suggestion:', '').strip() if len(parts) > 1 else ''
-                
-                context = ''
-                if '"' in message:
-                    quote_match = re.search(r'"([^"]*)"', message)
-                    if quote_match:
-                        context = quote_match.group(1)
-                
-                error_feedback.append({
-                    'message': message,
-                    'context': context,
-                    'replacements': [suggestion] if suggestion else []
-                })
-            else:
-                error_feedback.append({
-                    'message': error_clean,
-                    'context': '',
-                    'replacements': []
+        evaluation = self._fill_missing_sections(merge_evaluations(evaluations, weights, content))
+        evaluation['llm_usage'] = usage_log
+        if errors:
+            # Covers only part of the essay: served, but never cached
+            evaluation['failed_chunks'] = len(errors)
+        return evaluation
+    
+    def _evaluate_part(self, title: str, text: str, part: tuple, usage_log: list, purpose: str) -> dict:
+        """Evaluate one part (chunk or paragraph) of an essay on its own"""
+        response_text = self._chat(
+            purpose,
+            self._build_evaluation_messages(title, text, part=part),
+            max_tokens=evaluation_output_budget(text),
+            usage_log=usage_log,
+            temperature=0.5,
+            top_p=0.95
+        )
+        return self._parse_evaluation(response_text, text)
+    
+    def evaluate_revision(self, title: str, content: str, paragraphs: list) -> dict:
+        """
+        Incremental re-evaluation of an edited essay. `paragraphs` comes from
+        models.essay.diff_paragraphs: paragraphs with a stored artifact are
+        reused, the others are evaluated (and their statements classified)
+        on their own, then everything is merged as in chunked evaluation.
+        Returns {'evaluation', 'paragraphs' (new artifacts), 'statements',
+        'summary', 'changed'}; raises if a changed paragraph fails.
+        """
+        changed = [i for i, p in enumerate(paragraphs) if p['artifact'] is None]
+        total = len(paragraphs)
+        print(f"✏️ Revision: re-evaluating {len(changed)} of {total} paragraphs")
+        
+        usage_log = []
+        fresh = {}
+        if changed:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.chunk_parallelism, len(changed)))) as executor:
+                futures = {
+                    i: deadline.submit(executor, self._evaluate_part, title, paragraphs[i]['text'],
+                                       (i + 1, total), usage_log, 'evaluation_paragraph')
+                    for i in changed
+                }
+                fresh = {i: future.result() for i, future in futures.items()}
+        
+        artifacts = []
+        for i, paragraph in enumerate(paragraphs):
+            old = paragraph['artifact'] or {}
+            evaluation = old.get('evaluation')
+            if i in fresh:
+                evaluation = {k: v for k, v in fresh[i].items() if k in PARAGRAPH_EVALUATION_FIELDS}
+            artifacts.append({
+                'hash': paragraph['hash'],
+                'words': len(paragraph['text'].split()),
+                'source': 'llm' if i in fresh else old.get('source', 'seeded'),
+                'evaluation': evaluation,
+                'statements': old.get('statements'),
+            })
+        
+        evaluations = [a['evaluation'] for a in artifacts if a['evaluation']]
+        weights = [estimate_tokens(p['text']) for p, a in zip(paragraphs, artifacts) if a['evaluation']]
+        evaluation = self._fill_missing_sections(merge_evaluations(evaluations, weights, content))
+        evaluation['llm_usage'] = usage_log
+        
+        # Statements are only maintained if every kept paragraph still has them
+        statements = None
+        summary = None
+        if all(a['statements'] is not None for i, a in enumerate(artifacts) if i not in fresh):
+            new_statements = dict(zip(changed, segment_many([paragraphs[i]['text'] for i in changed])))
+            flat = [s for i in changed for s in new_statements[i]]
+            # Ids restart in every paragraph, so links are left to _place_statements
+            self._llm_classify_statements(flat, usage_log, relationships=False)
+            for i in changed:
+                artifacts[i]['statements'] = [
+                    {k: v for k, v in s.items() if k not in ('id', 'position')}
+                    for s in new_statements[i]
+                ]
+            statements = self._place_statements(content, [a['statements'] for a in artifacts])
+            summary = self._generate_statement_summary(statements)
+        
+        return {
+            'evaluation': evaluation,
+            'paragraphs': artifacts,
+            'statements': statements,
+            'summary': summary,
+            'changed': len(changed),
+        }
+    
+    def _place_statements(self, content: str, per_paragraph: list) -> list:
+        """Renumber per-paragraph statements, recompute their positions in content and link them"""
+        statements = []
+        cursor = 0
+        for paragraph_statements in per_paragraph:
+            for stmt in paragraph_statements or []:
+                start = content.find(stmt['text'], cursor)
+                if start < 0:
+                    start = content.find(stmt['text'])
+                else:
+                    cursor = start + len(stmt['text'])
+                index = len(statements)
+                statements.append({
+                    **stmt,
+                    'id': f'stmt_{index}',
+                    'position': {
+                        'start': start,
+                        'end': start + len(stmt['text']) if start >= 0 else -1,
+                        'sentence_index': index
+                    },
                 })
+        return self._analyze_relationships(statements)
+    
+    def _fill_missing_sections(self, evaluation: dict) -> dict:
+        """Ensure all fields have values"""
+        backfilled = [f for f in ('grammar', 'structure', 'content', 'coherence') if evaluation[f] == 'Not evaluated']
+        if evaluation['grammar'] == 'Not evaluated':
+            evaluation['grammar'] = 'Good'
+        if evaluation['structure'] == 'Not evaluated':
+            evaluation['structure'] = 'The essay demonstrates basic organizational structure with clear paragraphs.'
+        if evaluation['content'] == 'Not evaluated':
+            evaluation['content'] = 'The content addresses the topic with relevant points and examples.'
+        if evaluation['coherence'] == 'Not evaluated':
+            evaluation['coherence'] = 'The ideas flow logically with appropriate transitions between sections.'
         
-        evaluation['error_feedback'] = error_feedback
+        telemetry.increment('evaluations_total', backfilled='yes' if backfilled else 'no')
+        for field in backfilled:
+            telemetry.increment('evaluation_backfilled_sections_total', section=field)
+        return evaluation
+    
+    def stream_evaluation(self, title: str, content: str, essay_id: str = None):
+        """
+        Evaluate an essay with a streaming completion.
+        Yields ('section', {'section': ..., 'data': {...}}) as soon as each
+        section of the response is complete, then ('complete', evaluation).
+        On failure yields ('error', message) followed by the fallback result.
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(content, self.model, EVALUATION_PROMPT_VERSION)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"⚡ Evaluation cache hit ({cache_key[:12]})")
+                cached['llm_usage'] = [self._cached_usage_entry('evaluation_stream')]
+                for event in sections_from_evaluation(cached):
+                    yield 'section', event
+                yield 'complete', cached
+                return
         
-        # Join multi-line fields
-        evaluation['structure'] = ' '.join(structure_parts).strip()
-        evaluation['content'] = ' '.join(content_parts).strip()
-        evaluation['coherence'] = ' '.join(coherence_parts).strip()
-        evaluation['suggestions'] = suggestions_list[:5]
-        evaluation['feedback'] = ' '.join(feedback_parts).strip()
+        local = self._local_tier_evaluation(content, essay_id)
+        if local is None and not self.budget_allows('evaluation_stream'):
+            telemetry.increment('evaluation_budget_fallbacks_total', purpose='evaluation_stream')
+            local = self._fallback_evaluation(content, essay_id)
+        if local is not None:
+            for event in sections_from_evaluation(local):
+                yield 'section', event
+            yield 'complete', local
+            return
         
-        print(f"   ✓ Structure: {'Yes' if evaluation['structure'] else 'Missing'}")
-        print(f"   ✓ Content: {'Yes' if evaluation['content'] else 'Missing'}")
-        print(f"   ✓ Coherence: {'Yes' if evaluation['coherence'] else 'Missing'}")
-        print(f"   ✓ Suggestions: {len(evaluation['suggestions'])}")
+        if estimate_tokens(content) > self.chunk_tokens:
+            # Too long for one streamed prompt: evaluate chunks in parallel, then replay sections
+            evaluation = self.evaluate_essay(title, content, essay_id=essay_id)
+            for event in sections_from_evaluation(evaluation):
+                yield 'section', event
+            yield 'complete', evaluation
+            return
         
-        # Calculate linguistic stats
+        parser = EvaluationParser(content)
+        messages = self._build_evaluation_messages(title, content)
+        max_tokens = evaluation_output_budget(content)
+        streamed = []
+        finish_reason = None
+        started = time.perf_counter()
+        first_section = None
         try:
-            sentences = [s.strip() for s in original_content.split('.') if s.strip()]
-            words = original_content.split()
-            evaluation['num_sentences'] = len(sentences)
-            evaluation['num_tokens'] = len(words)
-            evaluation['avg_sentence_length'] = len(words) / max(len(sentences), 1)
-        except:
-            pass
+            print(f"🤖 Streaming Llama 3.1 essay evaluation...")
+            stream = self.client.chat_completion(
+                messages=messages,
+                model=self.model,
+                max_tokens=max_tokens,
+                temperature=0.5,
+                top_p=0.95,
+                stream=True,
+                deadline=deadline.remaining(),
+                purpose='evaluation_stream'
+            )
+            
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                token = chunk.choices[0].delta.content
+                if not token:
+                    continue
+                streamed.append(token)
+                for event in parser.feed(token):
+                    if first_section is None:
+                        first_section = time.perf_counter() - started
+                        telemetry.observe('evaluation_stream_first_section_seconds', first_section)
+                    yield 'section', event
+            
+            for event in parser.close():
+                yield 'section', event
+            telemetry.observe('llm_call_seconds', time.perf_counter() - started, purpose='evaluation_stream')
+            self._record_parse(parser)
+            
+        except Exception as e:
+            print(f"❌ Error streaming essay evaluation: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            yield 'error', str(e)
+            yield 'complete', self._fallback_evaluation(content, essay_id)
+            return
+        
+        evaluation = self._fill_missing_sections(parser.result())
+        # Streamed responses carry no usage block, so both counts are estimated
+        evaluation['llm_usage'] = [self._usage_entry(
+            'evaluation_stream', messages, ''.join(streamed), max_tokens, finish_reason=finish_reason
+        )]
+        if cache_key is not None:
+            self._cache_evaluation(cache_key, evaluation)
+        
+        print(f"✅ Streamed evaluation complete - Score: {evaluation['score']}")
+        yield 'complete', evaluation
+    
+    def _parse_evaluation(self, response: str, original_content: str) -> dict:
+        """Parse the LLM response into structured data (single pass, see EvaluationParser)"""
+        with telemetry.timer('evaluation_parse_seconds'):
+            parser = EvaluationParser(original_content)
+            parser.feed(response)
+            evaluation = parser.result()
         
+        missing = self._record_parse(parser)
+        print(f"📋 Parsed LLM response - Score: {evaluation['score']}, "
+              f"suggestions: {len(evaluation['suggestions'])}, "
+              f"missing sections: {', '.join(missing) if missing else 'none'}")
         return evaluation
     
-    def _fallback_evaluation(self) -> dict:
-        """Return fallback evaluation"""
+    def _record_parse(self, parser):
+        """Count the sections a response left out; returns them"""
+        missing = parser.missing_sections
+        for section in missing:
+            telemetry.increment('evaluation_missing_sections_total', section=section)
+        return missing
+    
+    def _fallback_evaluation(self, content: str = None, essay_id: str = None) -> dict:
+        """Return fallback evaluation (scored by the local scorer when the content is known)"""
+        if content:
+            try:
+                result = local_scorer.score(content, self._parse(content, essay_id))
+                evaluation = local_evaluation(content, result, 'fallback')
+                telemetry.increment('evaluation_fallbacks_total', scorer=evaluation['local_scorer'])
+                return evaluation
+            except Exception as e:
+                print(f"⚠️ Local scorer failed: {e}")
+        telemetry.increment('evaluation_fallbacks_total', scorer='none')
         return {
             'score': 0,
             'grammar': 'Evaluation failed',
@@ -339,19 +751,22 @@ Remember: Fill out EVERY section above. Be specific and helpful. Return those da
     # ✅ NEW: ATOMIC STATEMENT EXTRACTION (Added below)
     # ═══════════════════════════════════════════════════════════════════
     
-    def extract_atomic_statements(self, essay_content: str) -> dict:
+    def extract_atomic_statements(self, essay_content: str, essay_id: str = None) -> dict:
         """
         Extract atomic statements from essay using LLM
         Returns: {'statements': [...], 'summary': {...}}
+        With essay_id the essay's cached spaCy parse is reused.
         """
         print(f"🔬 Extracting atomic statements...")
         
         try:
+            usage_log = []
+            
             # Step 1: Split into sentences (basic or spaCy)
-            raw_statements = self._segment_sentences(essay_content)
+            raw_statements = self._segment_sentences(essay_content, self._parse(essay_content, essay_id))
             
             # Step 2: Use LLM for classification
-            enhanced_statements = self._llm_classify_statements(raw_statements)
+            enhanced_statements = self._llm_classify_statements(raw_statements, usage_log)
             
             # Step 3: Generate summary
             summary = self._generate_statement_summary(enhanced_statements)
@@ -360,68 +775,130 @@ Remember: Fill out EVERY section above. Be specific and helpful. Return those da
             
             return {
                 'statements': enhanced_statements,
-                'summary': summary
+                'summary': summary,
+                'llm_usage': usage_log
             }
             
         except Exception as e:
             print(f"❌ Error extracting statements: {str(e)}")
             import traceback
             traceback.print_exc()
-            return {'statements': [], 'summary': {}}
+            return {'statements': [], 'summary': {}, 'llm_usage': []}
     
-    def _segment_sentences(self, text: str) -> list:
-        """Split text into sentences"""
-        statements = []
+    def extract_statements_many(self, contents: list, batch_size: int = None, n_process: int = None) -> list:
+        """
+        extract_atomic_statements for many essays (backfills, bulk uploads):
+        all essays are segmented in one nlp.pipe pass, then classified essay
+        by essay. Results are in input order.
+        """
+        print(f"🔬 Extracting atomic statements of {len(contents)} essays...")
+        segmented = segment_many(contents, batch_size=batch_size, n_process=n_process)
         
-        if SPACY_AVAILABLE:
-            # Use spaCy for better sentence segmentation
-            doc = nlp(text)
-            for idx, sent in enumerate(doc.sents):
-                if len(sent.text.split()) >= 3:
-                    statements.append({
-                        'id': f'stmt_{idx}',
-                        'text': sent.text.strip(),
-                        'position': {
-                            'start': sent.start_char,
-                            'end': sent.end_char,
-                            'sentence_index': idx
-                        },
-                        'word_count': len(sent.text.split()),
-                        'has_citation': self._has_citation(sent.text),
-                        'entities': [{'text': ent.text, 'label': ent.label_} for ent in sent.ents]
-                    })
-        else:
-            # Fallback: basic sentence splitting
-            sentences = re.split(r'[.!?]+', text)
-            for idx, sent in enumerate(sentences):
-                sent = sent.strip()
-                if len(sent.split()) >= 3:
-                    statements.append({
-                        'id': f'stmt_{idx}',
-                        'text': sent,
-                        'position': {
-                            'start': text.find(sent),
-                            'end': text.find(sent) + len(sent),
-                            'sentence_index': idx
-                        },
-                        'word_count': len(sent.split()),
-                        'has_citation': self._has_citation(sent),
-                        'entities': []
-                    })
+        results = []
+        for raw_statements in segmented:
+            try:
+                usage_log = []
+                statements = self._llm_classify_statements(raw_statements, usage_log)
+                results.append({
+                    'statements': statements,
+                    'summary': self._generate_statement_summary(statements),
+                    'llm_usage': usage_log
+                })
+            except Exception as e:
+                print(f"❌ Error extracting statements: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                results.append({'statements': [], 'summary': {}, 'llm_usage': []})
         
-        return statements
+        print(f"✅ Extracted {sum(len(r['statements']) for r in results)} statements")
+        return results
     
-    def _llm_classify_statements(self, statements: list) -> list:
-        """Use LLM to classify statement types and strength"""
+    def _parse(self, text: str, essay_id: str = None):
+        """The essay's spaCy Doc from the doc cache, or None to let segmentation parse it"""
+        if self.doc_cache is None or essay_id is None:
+            return None
+        return self.doc_cache.parse(text, essay_id)
+    
+    def _segment_sentences(self, text: str, doc=None) -> list:
+        """Split text into sentences"""
+        return segment(text, doc)
+    
+    def _llm_classify_statements(self, statements: list, usage_log: list = None,
+                                 relationships: bool = True) -> list:
+        """
+        Use LLM to classify statement types and strength. Sentences found in
+        the classification cache are not sent again; the rest are split into
+        token-budgeted batches classified concurrently. Statements of a
+        failed batch get the rule-based classification. relationships=False
+        skips linking (for statements whose ids are not final yet).
+        """
+        if usage_log is None:
+            usage_log = []
         
         if not statements:
             return []
         
+        classified = {}
+        pending = list(range(len(statements)))
+        keys = None
+        if self.classification_cache is not None:
+            keys = [self.classification_cache.make_key(stmt['text'], self.model, CLASSIFICATION_PROMPT_VERSION)
+                    for stmt in statements]
+            cached = self.classification_cache.get_many(keys)
+            classified = {i: cached[key] for i, key in enumerate(keys) if key in cached}
+            pending = [i for i in pending if i not in classified]
+            telemetry.increment('classification_cache_hits_total', len(classified))
+            telemetry.increment('classification_cache_misses_total', len(pending))
+            if classified:
+                print(f"⚡ {len(classified)}/{len(statements)} statement classifications cached")
+        
+        if pending:
+            fresh = self._classify_batched([statements[i] for i in pending], usage_log)
+            fresh = {pending[position]: result for position, result in fresh.items()}
+            classified.update(fresh)
+            if keys is not None:
+                self.classification_cache.set_many(
+                    {keys[i]: result for i, result in fresh.items()}, self.model, CLASSIFICATION_PROMPT_VERSION
+                )
+        
+        return self._finish_classifications(statements, classified, relationships)
+    
+    def _classify_batched(self, statements: list, usage_log: list) -> dict:
+        """{index: (type, strength)} for the statements the LLM classified"""
+        # Spread over the parallel slots, but small lists stay in one call
+        per_batch = -(-len(statements) // max(1, self.chunk_parallelism))
+        batches = batch_ranges(
+            [f"{i + 1}. {stmt['text'][:STATEMENT_PROMPT_CHARS]}" for i, stmt in enumerate(statements)],
+            self.classify_batch_tokens,
+            min(self.classify_batch_size, max(self.classify_min_batch, per_batch))
+        )
+        
+        if len(batches) == 1:
+            try:
+                return self._classify_batch(statements, usage_log)
+            except Exception as e:
+                print(f"⚠️ LLM classification failed: {e}")
+                return {}
+        
+        print(f"🧩 Classifying {len(statements)} statements in {len(batches)} batches, "
+              f"{self.chunk_parallelism} at a time")
+        classified = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.chunk_parallelism, len(batches)))) as executor:
+            futures = [
+                (start, deadline.submit(executor, self._classify_batch, statements[start:end], usage_log))
+                for start, end in batches
+            ]
+            for start, future in futures:
+                try:
+                    classified.update({start + i: result for i, result in future.result().items()})
+                except Exception as e:
+                    print(f"⚠️ LLM classification of statements {start + 1}+ failed: {e}")
+        return classified
+    
+    def _classify_batch(self, statements: list, usage_log: list) -> dict:
+        """Classify one batch in one call; {index in batch: (type, strength)} (raises on failure)"""
         # Prepare statement list for LLM
-        statements_text = "\n".join([
-            f"{i+1}. {stmt['text'][:150]}" 
-            for i, stmt in enumerate(statements)
-        ])
+        statements_text = self._format_statement_list(statements)
         
         system_prompt = """You are an expert in academic argument analysis. Classify each statement."""
         
@@ -441,95 +918,79 @@ Respond EXACTLY in this format (one per line):
 
 Continue for all {len(statements)} statements."""
 
-        try:
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-            
-            response = self.client.chat_completion(
-                messages=messages,
-                model=self.model,
-                max_tokens=800,
-                temperature=0.3
-            )
-            
-            analysis_text = response.choices[0].message.content
-            
-            # Parse LLM response
-            for i, stmt in enumerate(statements):
-                pattern = rf"{i+1}:\s*type=(\w+)\s*\|\s*strength=([\d\.]+)"
-                match = re.search(pattern, analysis_text, re.IGNORECASE)
-                
-                if match:
-                    stmt['type'] = match.group(1).lower()
-                    stmt['strength'] = float(match.group(2))
-                else:
-                    # Fallback classification
-                    stmt['type'] = self._simple_classify(stmt['text'])
-                    stmt['strength'] = 0.5
-                
-                stmt['complexity'] = self._calculate_complexity(stmt['text'])
-            
-            # Analyze relationships
-            statements = self._analyze_relationships(statements)
-            
-            return statements
-            
-        except Exception as e:
-            print(f"⚠️ LLM classification failed: {e}")
-            # Use fallback
-            for stmt in statements:
-                stmt['type'] = self._simple_classify(stmt['text'])
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        
+        analysis_text = self._chat(
+            'statement_classification',
+            messages,
+            max_tokens=classification_output_budget(len(statements)),
+            usage_log=usage_log,
+            temperature=0.3
+        )
+        return self._parse_classifications(analysis_text, len(statements))
+    
+    def _format_statement_list(self, statements: list) -> str:
+        return "\n".join(f"{i+1}. {stmt['text'][:STATEMENT_PROMPT_CHARS]}" for i, stmt in enumerate(statements))
+    
+    def _parse_classifications(self, analysis_text: str, count: int) -> dict:
+        """{0-based index: (type, strength)} from "N: type=... | strength=..." lines"""
+        classified = {}
+        for match in CLASSIFICATION_LINE_RE.finditer(analysis_text or ''):
+            try:
+                index = int(match.group(1)) - 1
+                if 0 <= index < count:
+                    classified.setdefault(index, (match.group(2).lower(), float(match.group(3))))
+            except ValueError:
+                continue
+        return classified
+    
+    def _apply_classifications(self, statements: list, analysis_text: str) -> list:
+        """Set type/strength from "N: type=... | strength=..." lines (rule-based when missing)"""
+        return self._finish_classifications(statements, self._parse_classifications(analysis_text, len(statements)))
+    
+    def _finish_classifications(self, statements: list, classified: dict, relationships: bool = True) -> list:
+        """Apply parsed classifications (rule-based where missing), complexity and relationships"""
+        features = compute_features([stmt['text'] for stmt in statements])
+        rule_types = features['rule_type']
+        complexities = features['complexity']
+        for i, stmt in enumerate(statements):
+            if i in classified:
+                stmt['type'], stmt['strength'] = classified[i]
+            else:
+                # Fallback classification
+                stmt['type'] = rule_types[i]
                 stmt['strength'] = 0.5
-                stmt['complexity'] = self._calculate_complexity(stmt['text'])
+            
+            stmt['complexity'] = round(complexities[i], 2)
+        
+        if not relationships:
             return statements
+        # Analyze relationships
+        return self._analyze_relationships(statements, features['has_discourse_marker'])
     
-    def _simple_classify(self, text: str) -> str:
-        """Rule-based statement classification"""
-        text_lower = text.lower()
-        
-        if any(w in text_lower for w in ['therefore', 'thus', 'in conclusion', 'hence']):
-            return 'conclusion'
-        if any(w in text_lower for w in ['according to', 'research shows', 'study']):
-            return 'evidence'
-        if any(w in text_lower for w in ['however', 'moreover', 'furthermore']):
-            return 'transition'
-        return 'claim'
-    
-    def _has_citation(self, text: str) -> bool:
-        """Check for citation markers"""
-        patterns = [r'\(\d{4}\)', r'\[\d+\]', r'\(.*?et al.*?\)']
-        return any(re.search(p, text) for p in patterns)
-    
-    def _calculate_complexity(self, text: str) -> float:
-        """Calculate text complexity score"""
-        words = text.split()
-        if not words:
-            return 0.0
-        word_count = len(words)
-        avg_word_len = sum(len(w) for w in words) / word_count
-        complexity = min(1.0, (word_count / 30.0) + (avg_word_len / 20.0))
-        return round(complexity, 2)
-    
-    def _analyze_relationships(self, statements: list) -> list:
+    def _analyze_relationships(self, statements: list, discourse_markers=None) -> list:
         """Find relationships between statements"""
+        if discourse_markers is None:
+            discourse_markers = compute_features([stmt['text'] for stmt in statements])['has_discourse_marker']
+        
+        # Statements sharing an entity anywhere in the essay (inverted index, see statement_graph)
+        shared_entities = entity_links(statements)
+        # Statements about the same thing in other words (TF-IDF cosine, no LLM call)
+        similar = similarity_links([stmt['text'] for stmt in statements])
+        
         for i, stmt in enumerate(statements):
             linked = []
             
             # Link to previous if contains discourse marker
-            if i > 0:
-                markers = ['therefore', 'however', 'this', 'thus']
-                if any(m in stmt['text'].lower() for m in markers):
-                    linked.append(f"stmt_{i-1}")
+            if i > 0 and discourse_markers[i]:
+                linked.append(statements[i - 1]['id'])
             
-            # Link if shares entities (only if spaCy available)
-            if SPACY_AVAILABLE and i < len(statements) - 1:
-                curr_ents = set(e['text'] for e in stmt.get('entities', []))
-                for j in range(i + 1, min(i + 3, len(statements))):
-                    next_ents = set(e['text'] for e in statements[j].get('entities', []))
-                    if curr_ents & next_ents:
-                        linked.append(f"stmt_{j}")
+            for j in shared_entities[i] + similar[i]:
+                if statements[j]['id'] not in linked:
+                    linked.append(statements[j]['id'])
             
             stmt['linked_to'] = linked
         
@@ -537,26 +998,7 @@ Continue for all {len(statements)} statements."""
     
     def _generate_statement_summary(self, statements: list) -> dict:
         """Generate summary statistics"""
-        if not statements:
-            return {}
-        
-        type_counts = {}
-        for stmt in statements:
-            t = stmt.get('type', 'unknown')
-            type_counts[t] = type_counts.get(t, 0) + 1
-        
-        avg_strength = sum(stmt.get('strength', 0.5) for stmt in statements) / len(statements)
-        avg_complexity = sum(stmt.get('complexity', 0.5) for stmt in statements) / len(statements)
-        cited = sum(1 for stmt in statements if stmt.get('has_citation', False))
-        
-        return {
-            'total_statements': len(statements),
-            'by_type': type_counts,
-            'average_strength': round(avg_strength, 2),
-            'average_complexity': round(avg_complexity, 2),
-            'citations_count': cited,
-            'citation_rate': round(cited / len(statements), 2) if statements else 0
-        }
+        return summarize(statements)
 
 
 # Create singleton instance
@@ -0,0 +1,131 @@
+import json
+import os
+
+from .essay_features import extract_features, heuristic_score
+from .evaluation_parser import linguistic_stats
+
+DEFAULT_MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'models', 'local_scorer.json'
+)
+
+
+class RidgeScorer:
+    """
+    Serves a ridge regression trained by scripts/train_scorer.py.
+    Prediction is a plain-Python dot product over standardized features
+    (a few microseconds; no NumPy needed at serving time). Extracting the
+    features costs a spaCy parse unless the essay's Doc is passed in.
+    """
+
+    def __init__(self, model: dict):
+        self.feature_names = tuple(model['feature_names'])
+        self.mean = [float(v) for v in model['mean']]
+        self.scale = [float(v) or 1.0 for v in model['scale']]
+        self.weights = [float(v) for v in model['weights']]
+        self.intercept = float(model['intercept'])
+        # Cross-validated error, used as the prediction's uncertainty
+        self.rmse = float(model.get('cv_rmse', 15.0))
+        self.n_samples = model.get('n_samples')
+        self.trained_at = model.get('trained_at')
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def predict(self, features: dict) -> float:
+        total = self.intercept
+        for name, mean, scale, weight in zip(self.feature_names, self.mean, self.scale, self.weights):
+            total += weight * (float(features.get(name, 0.0)) - mean) / scale
+        return min(100.0, max(0.0, total))
+
+
+class LocalScorer:
+    """
+    Local scoring tier: the trained ridge model when one is available
+    (LOCAL_SCORER_PATH), the hand-tuned heuristic otherwise. Optionally
+    (LOCAL_TIER_ENABLED) decides that an essay needs no LLM pass because
+    its predicted score is confidently extreme.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('LOCAL_SCORER_PATH', DEFAULT_MODEL_PATH)
+        self.model = None
+        self.tier_enabled = os.getenv('LOCAL_TIER_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+        self.tier_low = float(os.getenv('LOCAL_TIER_LOW', 35))
+        self.tier_high = float(os.getenv('LOCAL_TIER_HIGH', 90))
+        self.tier_z = float(os.getenv('LOCAL_TIER_Z', 1.5))
+        self.reload()
+
+    def reload(self):
+        """(Re)load the trained model; keeps the heuristic if there is none"""
+        if not os.path.exists(self.path):
+            self.model = None
+            return
+        try:
+            self.model = RidgeScorer.load(self.path)
+            print(f"📈 Loaded local scorer ({self.model.n_samples} essays, CV RMSE {self.model.rmse:.1f})")
+        except Exception as e:
+            print(f"⚠️ Could not load local scorer from {self.path}: {e}")
+            self.model = None
+
+    def score(self, text: str, doc=None) -> dict:
+        """{'score', 'features', 'scorer', 'uncertainty'} for an essay"""
+        features = extract_features(text, doc)
+        if self.model is not None and features['word_count']:
+            return {
+                'score': int(round(self.model.predict(features))),
+                'features': features,
+                'scorer': 'ridge',
+                'uncertainty': round(self.model.rmse, 1),
+            }
+        return {
+            'score': heuristic_score(features),
+            'features': features,
+            'scorer': 'heuristic',
+            'uncertainty': None,
+        }
+
+    def skip_llm(self, result: dict) -> bool:
+        """True when the tier is on and the trained model is confident the score is extreme"""
+        if not self.tier_enabled or result.get('scorer') != 'ridge':
+            return False
+        margin = self.tier_z * result['uncertainty']
+        return result['score'] - margin >= self.tier_high or result['score'] + margin <= self.tier_low
+
+
+def local_evaluation(content: str, result: dict, reason: str) -> dict:
+    """Evaluation dict (same shape as an LLM one) carrying a local score"""
+    stats = linguistic_stats(content)
+    if reason == 'fallback':
+        feedback = ('AI evaluation is temporarily unavailable. This score is an automatic estimate '
+                    'from writing features; re-evaluate later for detailed feedback.')
+    else:
+        feedback = 'Scored automatically from writing features; a detailed AI review was not needed.'
+    return {
+        'score': result['score'],
+        'grammar': 'Not analyzed',
+        'structure': 'Not analyzed',
+        'content': 'Not analyzed',
+        'coherence': 'Not analyzed',
+        'suggestions': [],
+        'feedback': feedback,
+        'total_grammar_errors': 0,
+        'error_feedback': [],
+        'ai_detection_label': 'Not analyzed',
+        'ai_detection_score': 0,
+        'num_sentences': stats['num_sentences'],
+        'num_tokens': stats['num_tokens'],
+        'avg_sentence_length': stats['avg_sentence_length'],
+        'evaluation_tier': 'local',
+        'local_scorer': result['scorer'],
+    }
+
+
+def provisional_score(text: str, doc=None) -> dict:
+    """Instant local score shown until the LLM evaluation lands"""
+    return local_scorer.score(text, doc)
+
+
+# Create singleton instance
+local_scorer = LocalScorer()
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+
+from .telemetry import telemetry
+
+SPACY_MODEL = os.getenv('SPACY_MODEL', 'en_core_web_sm')
+
+# Pipeline configurations per use. Excluded components are never loaded (no
+# weights in memory). tok2vec always stays, others may listen to it.
+PIPELINES = {
+    # Sentences and named entities (statement segmentation, essay features,
+    # DocCache). The dependency parser stays: it sets the sentence boundaries,
+    # and the smaller `senter` splits differently, which would renumber the
+    # statement ids of stored essays and invalidate their cached
+    # classifications and parses. So the only saving over the shipped model
+    # is dropping tagger, attribute_ruler and lemmatizer (senter ships
+    # disabled; excluding it just skips loading its weights).
+    'entities': {
+        'exclude': ['tagger', 'attribute_ruler', 'lemmatizer', 'senter'],
+    },
+}
+DEFAULT_PIPELINE = 'entities'
+
+
+def _rss_bytes():
+    """Resident set size of this process, or None where it cannot be read"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PipelineRegistry:
+    """
+    Loads each spaCy pipeline configuration once per process, on first use,
+    and shares it between all callers. get() returns None (once warned) when
+    spaCy or the model is not installed, so callers keep their fallbacks.
+    """
+
+    def __init__(self, model=SPACY_MODEL, pipelines=None):
+        self.model = model
+        self.pipelines = pipelines or PIPELINES
+        self._loaded = {}
+        self._failed = {}
+        self._info = {}
+        self._lock = threading.Lock()
+
+    def get(self, name=DEFAULT_PIPELINE):
+        """The shared pipeline for a configuration name, or None if it cannot be loaded"""
+        nlp = self._loaded.get(name)
+        if nlp is not None or name in self._failed:
+            return nlp
+        if name not in self.pipelines:
+            raise KeyError(f"Unknown spaCy pipeline '{name}' (known: {', '.join(self.pipelines)})")
+
+        with self._lock:
+            if name in self._loaded or name in self._failed:
+                return self._loaded.get(name)
+            try:
+                nlp = self._load(name)
+            except Exception as e:
+                self._failed[name] = str(e)
+                print(f"⚠️ spaCy pipeline '{name}' not available ({e}) - using basic text processing")
+                return None
+            self._loaded[name] = nlp
+            return nlp
+
+    def _load(self, name):
+        import spacy
+
+        options = self.pipelines[name]
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        nlp = spacy.load(self.model, exclude=options.get('exclude', []))
+        load_seconds = time.perf_counter() - started
+        rss_after = _rss_bytes()
+
+        # Loads are serialized by the lock, so the RSS growth is this pipeline's
+        memory_mb = None
+        if rss_before is not None and rss_after is not None:
+            memory_mb = round(max(0, rss_after - rss_before) / 2 ** 20, 1)
+        self._info[name] = {
+            'model': self.model,
+            'components': list(nlp.pipe_names),
+            'disabled': list(nlp.disabled),
+            'excluded': list(options.get('exclude', [])),
+            'load_seconds': round(load_seconds, 3),
+            'memory_mb': memory_mb,
+        }
+        telemetry.observe('spacy_load_seconds', load_seconds, pipeline=name)
+        print(f"🧠 Loaded spaCy pipeline '{name}' ({self.model}: {', '.join(nlp.pipe_names)}) "
+              f"in {load_seconds:.2f}s, {memory_mb if memory_mb is not None else '?'} MB")
+        return nlp
+
+    def preload(self, names=None):
+        """Load configurations up front, e.g. before gunicorn forks (SPACY_PRELOAD=entities)"""
+        if names is None:
+            names = [n.strip() for n in os.getenv('SPACY_PRELOAD', '').split(',') if n.strip()]
+        for name in names:
+            self.get(name)
+
+    def stats(self):
+        """Loaded configurations with their components, load time and memory; failed ones with the error"""
+        with self._lock:
+            return {
+                'model': self.model,
+                'loaded': {name: dict(info) for name, info in self._info.items()},
+                'failed': dict(self._failed),
+                'memory_mb': round(sum(info['memory_mb'] or 0 for info in self._info.values()), 1),
+            }
+
+
+# Create singleton instance
+nlp_registry = PipelineRegistry()
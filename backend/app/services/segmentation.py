@@ -0,0 +1,90 @@
+import os
+import re
+
+from .nlp_registry import nlp_registry
+from .statement_features import compute_features
+
+# nlp.pipe settings for bulk analysis (backfills, bulk uploads, regeneration).
+# n_process > 1 forks worker processes, worth it only for hundreds of essays.
+SPACY_BATCH_SIZE = int(os.getenv('SPACY_BATCH_SIZE', 32))
+SPACY_N_PROCESS = int(os.getenv('SPACY_N_PROCESS', 1))
+
+# Sentences shorter than this are not statements
+MIN_STATEMENT_WORDS = 3
+
+# Basic sentence splitting when spaCy is not installed
+FALLBACK_SPLIT_RE = re.compile(r'[.!?]+')
+
+
+def parse_many(texts: list, pipeline: str = 'entities', batch_size: int = None, n_process: int = None) -> list:
+    """
+    spaCy Docs of many texts through nlp.pipe (one batched pass, optionally
+    over several processes), in input order. All None when spaCy is not
+    available.
+    """
+    nlp = nlp_registry.get(pipeline)
+    if nlp is None:
+        return [None] * len(texts)
+    batch_size = batch_size or SPACY_BATCH_SIZE
+    n_process = n_process or SPACY_N_PROCESS
+    # Forking costs more than it saves on a couple of documents
+    n_process = max(1, min(n_process, len(texts) // batch_size or 1))
+    return list(nlp.pipe(texts, batch_size=batch_size, n_process=n_process))
+
+
+def sentence_candidates(text: str, doc=None) -> list:
+    """(index, sentence, start, end, entities) per sentence, from the Doc or basic splitting"""
+    if doc is not None:
+        return [
+            (idx, sent.text.strip(), sent.start_char, sent.end_char,
+             [{'text': ent.text, 'label': ent.label_} for ent in sent.ents])
+            for idx, sent in enumerate(doc.sents)
+        ]
+    candidates = []
+    for idx, sent in enumerate(FALLBACK_SPLIT_RE.split(text)):
+        sent = sent.strip()
+        candidates.append((idx, sent, text.find(sent), text.find(sent) + len(sent), []))
+    return candidates
+
+
+def statements_from_candidates(per_text: list) -> list:
+    """Statement dicts per text; word counts and citations of all texts in one batch"""
+    flat = [c for candidates in per_text for c in candidates]
+    features = compute_features([c[1] for c in flat])
+    word_counts = iter(features['word_count'])
+    citations = iter(features['has_citation'])
+
+    results = []
+    for candidates in per_text:
+        statements = []
+        for (idx, sent, start, end, entities), word_count, cited in zip(candidates, word_counts, citations):
+            if word_count >= MIN_STATEMENT_WORDS:
+                statements.append({
+                    'id': f'stmt_{idx}',
+                    'text': sent,
+                    'position': {
+                        'start': start,
+                        'end': end,
+                        'sentence_index': idx
+                    },
+                    'word_count': word_count,
+                    'has_citation': cited,
+                    'entities': entities
+                })
+        results.append(statements)
+    return results
+
+
+def segment(text: str, doc=None) -> list:
+    """Candidate statements of one text (spaCy sentences + entities when installed)"""
+    if doc is None:
+        nlp = nlp_registry.get('entities')
+        doc = nlp(text) if nlp is not None else None
+    return statements_from_candidates([sentence_candidates(text, doc)])[0]
+
+
+def segment_many(texts: list, batch_size: int = None, n_process: int = None) -> list:
+    """segment() of many texts at once: the same statement lists, parsed with nlp.pipe"""
+    texts = [text or '' for text in texts]
+    docs = parse_many(texts, batch_size=batch_size, n_process=n_process)
+    return statements_from_candidates([sentence_candidates(text, doc) for text, doc in zip(texts, docs)])
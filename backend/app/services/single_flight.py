@@ -0,0 +1,135 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+
+class SingleFlightTimeout(Exception):
+    """An identical call was still running when the wait timed out"""
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls (same key) into one execution.
+
+    Within a process, callers of a key that is already running wait on the
+    leader's Future and get its result. Across processes, the leader holds
+    a lease document in `inflight_leases` (atomic insert on _id = key);
+    callers in other processes poll until the lease is released and then
+    read the stored result via `load_result`. An expired lease (crashed
+    holder) is taken over, and so is the lease of a holder whose call
+    failed: it is kept with the error rather than released, so waiters
+    do not read a result that was never stored and retry the call instead.
+    """
+
+    def __init__(self, db, lease_seconds=None, wait_timeout=None, poll_interval=0.5):
+        self.collection = db['inflight_leases']
+        self.lease_seconds = lease_seconds or int(os.getenv('SINGLE_FLIGHT_LEASE_SECONDS', 300))
+        self.wait_timeout = wait_timeout or float(os.getenv('SINGLE_FLIGHT_WAIT_SECONDS', 180))
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._indexes_ready = False
+
+    def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        try:
+            # Leftover leases of crashed processes are removed by MongoDB
+            self.collection.create_index('expires_at', expireAfterSeconds=0)
+        except Exception as e:
+            print(f"⚠️ Could not create in-flight lease index: {e}")
+        self._indexes_ready = True
+
+    def run(self, key, fn, load_result):
+        """
+        Run fn() once for all concurrent callers of `key` and return
+        (result, shared). `shared` is True when another caller did the
+        work; across processes the result comes from load_result().
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            print(f"⏳ Joining in-flight call {key}")
+            try:
+                return future.result(timeout=self.wait_timeout), True
+            except FutureTimeoutError:
+                raise SingleFlightTimeout(f"Call {key} still running after {self.wait_timeout:.0f}s")
+
+        try:
+            result, shared = self._run_leased(key, fn, load_result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, shared
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _run_leased(self, key, fn, load_result):
+        self._ensure_indexes()
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            if self._acquire(key):
+                try:
+                    result = fn()
+                except BaseException as e:
+                    self._release(key, error=e)
+                    raise
+                self._release(key)
+                return result, False
+
+            if time.monotonic() >= deadline:
+                raise SingleFlightTimeout(f"Call {key} still running in another process")
+            time.sleep(self.poll_interval)
+            if self.collection.find_one({'_id': key}, {'_id': 1}) is None:
+                # The other process finished; its result is in the database
+                print(f"⏳ In-flight call {key} finished in another process")
+                return load_result(), True
+            # Otherwise still held, or expired / failed and taken over on the next pass
+
+    def _acquire(self, key):
+        # UTC, because the TTL index compares expires_at against UTC
+        now = datetime.utcnow()
+        lease = {
+            'owner': self.owner,
+            'acquired_at': now,
+            'expires_at': now + timedelta(seconds=self.lease_seconds),
+        }
+        try:
+            self.collection.insert_one({'_id': key, **lease})
+            return True
+        except DuplicateKeyError:
+            pass
+        # Take over a lease its holder never released, or failed under
+        taken = self.collection.find_one_and_update(
+            {'_id': key, '$or': [{'expires_at': {'$lte': now}}, {'error': {'$ne': None}}]},
+            {'$set': {**lease, 'error': None}}
+        )
+        return taken is not None
+
+    def _release(self, key, error=None):
+        try:
+            if error is not None:
+                self.collection.update_one(
+                    {'_id': key, 'owner': self.owner},
+                    {'$set': {'error': str(error) or type(error).__name__}}
+                )
+            else:
+                self.collection.delete_one({'_id': key, 'owner': self.owner})
+        except Exception as e:
+            # The lease expires on its own
+            print(f"⚠️ Could not release in-flight lease {key}: {e}")
@@ -0,0 +1,82 @@
+from .essay_features import has_citation
+
+# Rule-based types in priority order (substring match, as _simple_classify always did)
+TYPE_MARKERS = (
+    ('conclusion', ('therefore', 'thus', 'in conclusion', 'hence')),
+    ('evidence', ('according to', 'research shows', 'study')),
+    ('transition', ('however', 'moreover', 'furthermore')),
+)
+DEFAULT_TYPE = 'claim'
+# Words that tie a statement to the one before it
+DISCOURSE_MARKERS = ('therefore', 'however', 'this', 'thus')
+
+
+def contains_any(text: str, markers: tuple) -> bool:
+    """Does any marker occur in text (a plain loop: any() over a generator costs more here)"""
+    for marker in markers:
+        if marker in text:
+            return True
+    return False
+
+
+def rule_type(text_lower: str) -> str:
+    """Rule-based statement type of a lower-cased statement"""
+    for name, markers in TYPE_MARKERS:
+        if contains_any(text_lower, markers):
+            return name
+    return DEFAULT_TYPE
+
+
+def complexity(word_count: int, avg_word_length: float) -> float:
+    """Text complexity score in [0, 1] (unrounded)"""
+    if not word_count:
+        return 0.0
+    return min(1.0, word_count / 30.0 + avg_word_length / 20.0)
+
+
+def compute_features(texts: list) -> dict:
+    """
+    Features of many statements, as lists aligned with `texts`:
+    word_count, avg_word_length, complexity, has_citation,
+    has_discourse_marker and rule_type (the rule-based classification).
+    One pass per statement with the precompiled citation patterns.
+    """
+    features = {name: [] for name in ('word_count', 'avg_word_length', 'complexity', 'has_citation',
+                                      'has_discourse_marker', 'rule_type')}
+    for text in texts:
+        words = text.split()
+        word_count = len(words)
+        avg_word_length = sum(map(len, words)) / word_count if word_count else 0.0
+        text_lower = text.lower()
+        features['word_count'].append(word_count)
+        features['avg_word_length'].append(avg_word_length)
+        # Unrounded: callers round() per statement
+        features['complexity'].append(complexity(word_count, avg_word_length))
+        features['has_citation'].append(has_citation(text))
+        features['has_discourse_marker'].append(contains_any(text_lower, DISCOURSE_MARKERS))
+        features['rule_type'].append(rule_type(text_lower))
+    return features
+
+
+def summarize(statements: list) -> dict:
+    """Summary statistics of classified statements in one pass"""
+    if not statements:
+        return {}
+    type_counts = {}
+    strength = complexity_total = 0.0
+    cited = 0
+    for stmt in statements:
+        t = stmt.get('type', 'unknown')
+        type_counts[t] = type_counts.get(t, 0) + 1
+        strength += stmt.get('strength', 0.5)
+        complexity_total += stmt.get('complexity', 0.5)
+        cited += bool(stmt.get('has_citation', False))
+    n = len(statements)
+    return {
+        'total_statements': n,
+        'by_type': type_counts,
+        'average_strength': round(strength / n, 2),
+        'average_complexity': round(complexity_total / n, 2),
+        'citations_count': cited,
+        'citation_rate': round(cited / n, 2),
+    }
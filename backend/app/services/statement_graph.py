@@ -0,0 +1,144 @@
+import bisect
+import os
+import re
+
+import numpy as np
+
+# Caps on entity links: per statement, and entities shared by more statements than this are
+# too common (the essay's main subject) to say anything about a pair
+MAX_ENTITY_LINKS = int(os.getenv('STATEMENT_MAX_ENTITY_LINKS', 5))
+MAX_ENTITY_STATEMENTS = int(os.getenv('STATEMENT_MAX_ENTITY_STATEMENTS', 25))
+
+# Similarity links: up to TOP_K most similar statements with TF-IDF cosine >= THRESHOLD
+SIMILARITY_TOP_K = int(os.getenv('STATEMENT_SIMILARITY_TOP_K', 3))
+SIMILARITY_THRESHOLD = float(os.getenv('STATEMENT_SIMILARITY_THRESHOLD', 0.3))
+# Rows of the similarity matrix computed at once (bounds memory on very long documents)
+SIMILARITY_BLOCK_ROWS = 512
+
+TERM_RE = re.compile(r"[a-z][a-z'-]+")
+STOP_WORDS = frozenset('''
+    a about above after again against all also am an and any are as at be because been before being
+    below between both but by can could did do does doing down during each few for from further had
+    has have having he her here hers herself him himself his how i if in into is it its itself just
+    more most my myself no nor not now of off on once only or other our ours ourselves out over own
+    same she should so some such than that the their theirs them themselves then there these they
+    this those through to too under until up very was we were what when where which while who whom
+    why will with would you your yours yourself yourselves however therefore thus moreover
+    furthermore hence may might must shall one many much
+'''.split())
+
+
+def entity_key(text: str) -> str:
+    """Entity text compared case- and spacing-insensitively"""
+    return ' '.join((text or '').lower().split())
+
+
+def build_entity_index(statements: list) -> dict:
+    """Inverted index: entity key -> ascending indexes of the statements mentioning it"""
+    index = {}
+    for i, stmt in enumerate(statements):
+        for key in {entity_key(e['text']) for e in stmt.get('entities') or []}:
+            if key:
+                index.setdefault(key, []).append(i)
+    return index
+
+
+def entity_links(statements: list, index: dict = None, max_links: int = None,
+                 max_entity_statements: int = None) -> list:
+    """
+    For each statement, the indexes of later statements sharing an entity
+    with it, anywhere in the essay, nearest first and at most `max_links`.
+    Each posting list is entered after the statement itself (bisect) and
+    left as soon as the cap is reached, so the cost is O(n + links).
+    """
+    if index is None:
+        index = build_entity_index(statements)
+    max_links = MAX_ENTITY_LINKS if max_links is None else max_links
+    max_entity_statements = MAX_ENTITY_STATEMENTS if max_entity_statements is None else max_entity_statements
+
+    links = [[] for _ in statements]
+    if max_links <= 0:
+        return links
+    for i, stmt in enumerate(statements):
+        postings = [
+            index[key] for key in {entity_key(e['text']) for e in stmt.get('entities') or []}
+            if 1 < len(index.get(key, ())) <= max_entity_statements
+        ]
+        if not postings:
+            continue
+        # Merge the posting lists from position i onwards, nearest statement first
+        cursors = [bisect.bisect_right(p, i) for p in postings]
+        linked = links[i]
+        while len(linked) < max_links:
+            best = None
+            for n, posting in enumerate(postings):
+                if cursors[n] < len(posting) and (best is None or posting[cursors[n]] < postings[best][cursors[best]]):
+                    best = n
+            if best is None:
+                break
+            j = postings[best][cursors[best]]
+            cursors[best] += 1
+            if not linked or linked[-1] != j:
+                linked.append(j)
+    return links
+
+
+def tfidf_matrix(texts: list):
+    """
+    L2-normalized TF-IDF rows (sublinear tf, smoothed idf) for the texts,
+    built in one vectorized pass from (row, term) index arrays.
+    Returns an (n, vocabulary) float32 array.
+    """
+    vocabulary = {}
+    rows = []
+    cols = []
+    for i, text in enumerate(texts):
+        for term in TERM_RE.findall((text or '').lower()):
+            if term not in STOP_WORDS:
+                rows.append(i)
+                cols.append(vocabulary.setdefault(term, len(vocabulary)))
+
+    matrix = np.zeros((len(texts), len(vocabulary)), dtype=np.float32)
+    if not vocabulary:
+        return matrix
+    np.add.at(matrix, (np.array(rows), np.array(cols)), 1.0)
+
+    present = matrix > 0
+    document_frequency = present.sum(axis=0)
+    idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+    np.log1p(matrix, out=matrix, where=present)
+    matrix *= idf.astype(np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def similarity_links(texts: list, top_k: int = None, threshold: float = None) -> list:
+    """
+    For each text, the indexes of the (at most top_k) other texts whose
+    TF-IDF cosine similarity is at least `threshold`, most similar first.
+    """
+    top_k = SIMILARITY_TOP_K if top_k is None else top_k
+    threshold = SIMILARITY_THRESHOLD if threshold is None else threshold
+    n = len(texts)
+    links = [[] for _ in range(n)]
+    if n < 2 or top_k <= 0:
+        return links
+
+    matrix = tfidf_matrix(texts)
+    k = min(top_k, n - 1)
+    for block_start in range(0, n, SIMILARITY_BLOCK_ROWS):
+        block = matrix[block_start:block_start + SIMILARITY_BLOCK_ROWS]
+        similarity = block @ matrix.T
+        # A statement is not its own neighbour
+        rows = np.arange(len(block))
+        similarity[rows, rows + block_start] = -1.0
+
+        candidates = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(similarity, candidates, axis=1)
+        order = np.argsort(-scores, axis=1, kind='stable')
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        for row, (neighbours, row_scores) in enumerate(zip(candidates.tolist(), scores.tolist())):
+            links[block_start + row] = [j for j, score in zip(neighbours, row_scores) if score >= threshold]
+    return links
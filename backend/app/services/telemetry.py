@@ -0,0 +1,160 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+class Histogram:
+    """Fixed-bucket histogram (thread-safe); quantiles are interpolated within buckets"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        value = float(value)
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+            self._max = max(self._max, value)
+
+    def _quantile(self, counts, count, q):
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self._max
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self._max
+
+    def quantile(self, q):
+        """(value, count) for quantile q of what was observed so far"""
+        with self._lock:
+            counts = list(self._counts)
+            count = self._count
+        return (self._quantile(counts, count, q) if count else 0.0), count
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            count, total, maximum = self._count, self._sum, self._max
+        cumulative = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative.append([bound, running])
+        return {
+            'count': count,
+            'sum': round(total, 6),
+            'avg': round(total / count, 6) if count else 0.0,
+            'max': round(maximum, 6),
+            'p50': round(self._quantile(counts, count, 0.5), 6) if count else 0.0,
+            'p95': round(self._quantile(counts, count, 0.95), 6) if count else 0.0,
+            'p99': round(self._quantile(counts, count, 0.99), 6) if count else 0.0,
+            # Cumulative [upper_bound, count] pairs, as in Prometheus' le buckets
+            'buckets': cumulative,
+        }
+
+
+class Telemetry:
+    """
+    In-process registry of labelled counters and histograms.
+    Names follow Prometheus conventions (snake_case, unit suffix).
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = self._key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(buckets))
+        histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def quantile(self, name, q, **labels):
+        """(value, count) of one histogram's quantile; (0.0, 0) if nothing was observed"""
+        histogram = self._histograms.get(self._key(name, labels))
+        if histogram is None:
+            return 0.0, 0
+        return histogram.quantile(q)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the wall time of the block in seconds (also when it raises)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(counters)
+            ],
+            'histograms': [
+                {'name': name, 'labels': dict(labels), **histogram.snapshot()}
+                for (name, labels), histogram in sorted(histograms, key=lambda item: item[0])
+            ],
+        }
+
+    def prometheus(self):
+        """Text exposition format of the current snapshot"""
+        def label_text(labels, extra=None):
+            pairs = list(labels.items()) + (extra or [])
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for counter in snapshot['counters']:
+            if counter['name'] not in typed:
+                lines.append(f"# TYPE {counter['name']} counter")
+                typed.add(counter['name'])
+            lines.append(f"{counter['name']}{label_text(counter['labels'])} {counter['value']}")
+        for histogram in snapshot['histograms']:
+            name = histogram['name']
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, count in histogram['buckets']:
+                lines.append(f"{name}_bucket{label_text(histogram['labels'], [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{label_text(histogram['labels'], [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{label_text(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{label_text(histogram['labels'])} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+# Create singleton instance
+telemetry = Telemetry()
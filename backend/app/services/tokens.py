@@ -0,0 +1,131 @@
+import re
+
+# Llama-family tokenizers average roughly 4 characters / 0.75 words per token
+# on English prose; we take the larger of the two estimates to stay safe.
+CHARS_PER_TOKEN = 4.0
+TOKENS_PER_WORD = 1.33
+
+BLANK_LINE_RE = re.compile(r'\n\s*\n')
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-leaning token estimate (no tokenizer download needed)"""
+    if not text:
+        return 0
+    return int(max(len(text) / CHARS_PER_TOKEN, len(text.split()) * TOKENS_PER_WORD)) + 1
+
+
+def split_paragraphs(text: str) -> list:
+    """
+    Split essay text into paragraphs. Text with blank lines between
+    paragraphs (typical .txt) splits on those; DOCX extraction yields one
+    paragraph per line, so text without blank lines splits on newlines.
+    """
+    text = (text or '').replace('\r\n', '\n').strip()
+    if not text:
+        return []
+    parts = BLANK_LINE_RE.split(text) if BLANK_LINE_RE.search(text) else text.split('\n')
+    return [p.strip() for p in parts if p.strip()]
+
+
+def chunk_paragraphs(paragraphs: list, max_tokens: int) -> list:
+    """
+    Greedily pack consecutive paragraphs into chunks of at most max_tokens.
+    Paragraphs that are too long on their own are split on sentence ends.
+    Returns a list of chunk strings (paragraphs joined by blank lines).
+    """
+    pieces = []
+    for paragraph in paragraphs:
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        current = ''
+        for sentence in SENTENCE_END_RE.split(paragraph):
+            candidate = f"{current} {sentence}".strip()
+            if current and estimate_tokens(candidate) > max_tokens:
+                pieces.append(current)
+                current = sentence
+            else:
+                current = candidate
+        if current:
+            pieces.append(current)
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append('\n\n'.join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+def batch_ranges(texts: list, max_tokens: int, max_items: int) -> list:
+    """
+    Split consecutive texts (e.g. statements to classify) into batches of
+    at most max_tokens estimated tokens and max_items texts.
+    Returns (start, end) index ranges; a text over the budget gets its own batch.
+    """
+    ranges = []
+    start = 0
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        text_tokens = estimate_tokens(text)
+        if i > start and (current_tokens + text_tokens > max_tokens or i - start >= max_items):
+            ranges.append((start, i))
+            start = i
+            current_tokens = 0
+        current_tokens += text_tokens
+    if start < len(texts):
+        ranges.append((start, len(texts)))
+    return ranges
+
+
+# Typical completion sizes of the evaluation format, in tokens
+EVALUATION_SECTION_TOKENS = {
+    'score': 10,
+    'ai_detection': 15,
+    'grammar': 10,
+    'structure': 90,
+    'content': 90,
+    'coherence': 90,
+    'suggestions': 150,
+    'feedback': 110,
+}
+TOKENS_PER_GRAMMAR_ERROR = 45
+TOKENS_PER_CLASSIFIED_STATEMENT = 16
+OUTPUT_MARGIN = 1.25
+
+
+def estimate_messages_tokens(messages: list) -> int:
+    """Prompt size of a chat request (content plus per-message overhead)"""
+    return sum(estimate_tokens(m.get('content', '')) + 4 for m in messages)
+
+
+def evaluation_output_budget(content: str, sections=None, max_tokens: int = 2000,
+                             min_tokens: int = 400) -> int:
+    """
+    max_tokens for an evaluation response, sized from the essay: fixed cost
+    per requested section plus one grammar-error line per ~60 words
+    (3 to 10, as the prompt asks).
+    """
+    sections = sections or list(EVALUATION_SECTION_TOKENS) + ['grammar_errors']
+    budget = sum(EVALUATION_SECTION_TOKENS.get(s, 0) for s in sections)
+    if 'grammar_errors' in sections:
+        expected_errors = min(10, max(3, len((content or '').split()) // 60))
+        budget += expected_errors * TOKENS_PER_GRAMMAR_ERROR
+    return int(min(max_tokens, max(min_tokens, budget * OUTPUT_MARGIN)))
+
+
+def classification_output_budget(num_statements: int, max_tokens: int = 4000,
+                                 min_tokens: int = 64) -> int:
+    """max_tokens for a statement classification response (one short line per statement)"""
+    budget = (num_statements * TOKENS_PER_CLASSIFIED_STATEMENT + 20) * OUTPUT_MARGIN
+    return int(min(max_tokens, max(min_tokens, budget)))
@@ -0,0 +1,102 @@
+"""
+Replay recorded LLM evaluation responses through EvaluationParser and report
+parse accuracy and throughput.
+
+    python benchmarks/parse_evaluation.py [--repeat 2000] [--chunk-size 8]
+
+Each corpus/evaluations/<name>.txt response has a <name>.json file with the
+values a correct parse should produce (booleans mean "section was found").
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.evaluation_parser import EvaluationParser, NOT_EVALUATED  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus', 'evaluations')
+ORIGINAL_CONTENT = 'A short essay. It has three sentences. Each one is simple.'
+
+
+def load_corpus():
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.txt'))):
+        with open(path, encoding='utf-8') as f:
+            response = f.read()
+        with open(path[:-4] + '.json', encoding='utf-8') as f:
+            expected = json.load(f)
+        corpus.append((os.path.basename(path)[:-4], response, expected))
+    return corpus
+
+
+def parse(response, chunk_size=None):
+    parser = EvaluationParser(ORIGINAL_CONTENT)
+    if chunk_size:
+        for i in range(0, len(response), chunk_size):
+            parser.feed(response[i:i + chunk_size])
+    else:
+        parser.feed(response)
+    return parser.result()
+
+
+def observed(evaluation, field):
+    value = evaluation[field]
+    if field == 'suggestions':
+        return len(value)
+    if field in ('structure', 'content', 'coherence', 'feedback'):
+        return value not in ('', NOT_EVALUATED)
+    return value
+
+
+def check_accuracy(corpus, chunk_size=None):
+    total = correct = 0
+    failures = []
+    for name, response, expected in corpus:
+        evaluation = parse(response, chunk_size)
+        for field, want in expected.items():
+            got = observed(evaluation, field)
+            total += 1
+            if got == want:
+                correct += 1
+            else:
+                failures.append(f"{name}.{field}: expected {want!r}, got {got!r}")
+    return correct, total, failures
+
+
+def measure_throughput(corpus, repeat, chunk_size=None):
+    responses = [response for _, response, _ in corpus]
+    total_bytes = sum(len(r.encode('utf-8')) for r in responses) * repeat
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for response in responses:
+            parse(response, chunk_size)
+    elapsed = time.perf_counter() - started
+    count = len(responses) * repeat
+    return count / elapsed, total_bytes / elapsed / 1e6, elapsed / count * 1e6
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--repeat', type=int, default=2000, help='corpus replays for throughput')
+    arg_parser.add_argument('--chunk-size', type=int, default=8, help='chars per fed chunk in streaming mode')
+    args = arg_parser.parse_args()
+
+    corpus = load_corpus()
+    print(f"Corpus: {len(corpus)} responses from {CORPUS_DIR}")
+
+    for mode, chunk_size in (('whole response', None), (f'streamed ({args.chunk_size} chars)', args.chunk_size)):
+        correct, total, failures = check_accuracy(corpus, chunk_size)
+        per_sec, mb_per_sec, us_each = measure_throughput(corpus, args.repeat, chunk_size)
+        print(f"\n[{mode}]")
+        print(f"  accuracy:   {correct}/{total} fields ({correct / total:.1%})")
+        print(f"  throughput: {per_sec:,.0f} responses/s, {mb_per_sec:.1f} MB/s, {us_each:.1f} µs/response")
+        for failure in failures:
+            print(f"  ✗ {failure}")
+
+
+if __name__ == '__main__':
+    main()
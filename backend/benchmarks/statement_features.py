@@ -0,0 +1,121 @@
+"""
+Compare the statement feature stage (app/services/statement_features.py)
+with the LLMService helpers it replaced, on large synthetic documents.
+
+    python benchmarks/statement_features.py [--sentences 5000] [--repeat 5]
+
+Both paths must agree on every statement before timings are reported.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.statement_features import compute_features, summarize  # noqa: E402
+
+WORDS = (
+    'the students argue that climate policy must change because emissions keep rising across '
+    'every sector while governments hesitate to act on evidence from recent research'
+).split()
+OPENERS = ('However,', 'Therefore,', 'Moreover,', 'According to Smith (2019),', 'This shows that',
+           'In conclusion,', 'Research shows that', 'Thus', 'A recent study [4] found that', '')
+
+
+def make_statements(count, seed=0):
+    rng = random.Random(seed)
+    statements = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(4, 35))]
+        text = f"{rng.choice(OPENERS)} {' '.join(words)}".strip() + '.'
+        if rng.random() < 0.05:
+            text += ' (Lee et al., 2021)'
+        statements.append({'text': text, 'strength': round(rng.random(), 2)})
+    return statements
+
+
+# The per-statement implementation, as it was in LLMService (uncompiled patterns
+# rebuilt for every statement, three passes for the summary)
+def legacy_features(statements):
+    for stmt in statements:
+        text = stmt['text']
+        patterns = [r'\(\d{4}\)', r'\[\d+\]', r'\(.*?et al.*?\)']
+        stmt['has_citation'] = any(re.search(p, text) for p in patterns)
+        text_lower = text.lower()
+        if any(w in text_lower for w in ['therefore', 'thus', 'in conclusion', 'hence']):
+            stmt['type'] = 'conclusion'
+        elif any(w in text_lower for w in ['according to', 'research shows', 'study']):
+            stmt['type'] = 'evidence'
+        elif any(w in text_lower for w in ['however', 'moreover', 'furthermore']):
+            stmt['type'] = 'transition'
+        else:
+            stmt['type'] = 'claim'
+        words = text.split()
+        avg_word_len = sum(len(w) for w in words) / len(words)
+        stmt['complexity'] = round(min(1.0, (len(words) / 30.0) + (avg_word_len / 20.0)), 2)
+        stmt['word_count'] = len(words)
+
+    type_counts = {}
+    for stmt in statements:
+        type_counts[stmt['type']] = type_counts.get(stmt['type'], 0) + 1
+    avg_strength = sum(stmt.get('strength', 0.5) for stmt in statements) / len(statements)
+    avg_complexity = sum(stmt.get('complexity', 0.5) for stmt in statements) / len(statements)
+    cited = sum(1 for stmt in statements if stmt.get('has_citation', False))
+    return statements, {
+        'total_statements': len(statements),
+        'by_type': type_counts,
+        'average_strength': round(avg_strength, 2),
+        'average_complexity': round(avg_complexity, 2),
+        'citations_count': cited,
+        'citation_rate': round(cited / len(statements), 2),
+    }
+
+
+def current_features(statements):
+    features = compute_features([stmt['text'] for stmt in statements])
+    for stmt, cited, rule_type, complexity, word_count in zip(
+            statements, features['has_citation'], features['rule_type'],
+            features['complexity'], features['word_count']):
+        stmt['has_citation'] = cited
+        stmt['type'] = rule_type
+        stmt['complexity'] = round(complexity, 2)
+        stmt['word_count'] = word_count
+    return statements, summarize(statements)
+
+
+def timed(fn, statements, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        copies = [dict(stmt) for stmt in statements]
+        started = time.perf_counter()
+        result = fn(copies)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--sentences', type=int, default=5000, help='statements per document')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='runs per path (best is reported)')
+    args = arg_parser.parse_args()
+
+    statements = make_statements(args.sentences)
+    legacy_time, (legacy, legacy_summary) = timed(legacy_features, statements, args.repeat)
+    current_time, (current, current_summary) = timed(current_features, statements, args.repeat)
+
+    mismatches = sum(1 for a, b in zip(legacy, current) if a != b)
+    print(f"Document: {len(statements)} statements")
+    print(f"  agreement:  {len(statements) - mismatches}/{len(statements)} statements, "
+          f"summary {'identical' if legacy_summary == current_summary else 'DIFFERS'}")
+    print(f"  old helpers: {legacy_time * 1e3:8.1f} ms ({legacy_time / len(statements) * 1e6:.1f} µs/statement)")
+    print(f"  current:     {current_time * 1e3:8.1f} ms ({current_time / len(statements) * 1e6:.1f} µs/statement)")
+    print(f"  speedup:     {legacy_time / current_time:.1f}x")
+    if mismatches or legacy_summary != current_summary:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Extract atomic statements for essays that do not have them yet.
+
+    python scripts/backfill_statements.py [--limit 0] [--chunk 200] [--batch-size 32] [--n-process 1]
+
+Reads essays without statements from the `essays` collection (MONGO_URI)
+chunk by chunk, segments each chunk in one spaCy nlp.pipe pass (optionally
+over several processes), classifies their statements and stores them as
+the statements endpoint would.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import Config  # noqa: E402
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--mongo-uri', default=Config.MONGO_URI, help='defaults to MONGO_URI')
+    arg_parser.add_argument('--limit', type=int, default=0, help='max essays to process (0 = all)')
+    arg_parser.add_argument('--chunk', type=int, default=200, help='essays segmented per nlp.pipe pass')
+    arg_parser.add_argument('--batch-size', type=int, default=None, help='spaCy nlp.pipe batch size')
+    arg_parser.add_argument('--n-process', type=int, default=None, help='spaCy worker processes')
+    args = arg_parser.parse_args()
+
+    if not args.mongo_uri:
+        sys.exit("MONGO_URI is not set (use --mongo-uri)")
+
+    from pymongo import MongoClient
+    from app.models.essay import Essay
+    from app.services.llm_service import llm_service
+
+    client = MongoClient(args.mongo_uri)
+    essay_model = Essay(client.get_default_database())
+    # Only the ids are read up front: a cursor left open while chunks are
+    # classified would hit the server's idle cursor timeout
+    pending = {'content': {'$nin': [None, '']}, '$or': [{'statements': {'$exists': False}}, {'statements': []}]}
+    essay_ids = [essay['_id'] for essay in essay_model.collection.find(pending, {'_id': 1}, limit=args.limit)]
+    print(f"📚 {len(essay_ids)} essays without statements")
+
+    started = time.time()
+    done = 0
+    for start in range(0, len(essay_ids), args.chunk):
+        # Skips essays that got their statements in the meantime
+        chunk = list(essay_model.collection.find(
+            {**pending, '_id': {'$in': essay_ids[start:start + args.chunk]}}, {'content': 1}
+        ))
+        if chunk:
+            done += store_chunk(essay_model, llm_service, chunk, args)
+    client.close()
+    print(f"✅ Backfilled statements of {done} essays in {time.time() - started:.1f}s")
+
+
+def store_chunk(essay_model, llm_service, essays, args):
+    results = llm_service.extract_statements_many(
+        [essay['content'] for essay in essays], batch_size=args.batch_size, n_process=args.n_process
+    )
+    stored = 0
+    for essay, result in zip(essays, results):
+        if result['statements']:
+            essay_model.add_statements(str(essay['_id']), result['statements'], result['summary'],
+                                       result.get('llm_usage'))
+            stored += 1
+    print(f"   {stored}/{len(essays)} essays stored")
+    return stored
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Train the local ridge-regression scorer from LLM-evaluated essays.
+
+    python scripts/train_scorer.py [--output models/local_scorer.json] [--folds 5]
+
+Reads completed essays with an LLM score from the `essays` collection
+(MONGO_URI), builds the essay_features matrix, picks the ridge penalty by
+k-fold cross-validation and writes the model served by
+app/services/local_scorer.py. Restart the app (or call
+local_scorer.reload()) to pick it up.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import Config  # noqa: E402
+from app.services.essay_features import FEATURE_NAMES, extract_features_many  # noqa: E402
+from app.services.local_scorer import DEFAULT_MODEL_PATH, RidgeScorer  # noqa: E402
+
+DEFAULT_ALPHAS = (0.01, 0.1, 1.0, 3.0, 10.0, 30.0, 100.0)
+
+
+def load_training_set(mongo_uri, limit=0, recompute=False, batch_size=None, n_process=None):
+    """(X, y) from essays the LLM scored; local-tier and fallback scores are excluded"""
+    from pymongo import MongoClient
+
+    client = MongoClient(mongo_uri)
+    db = client.get_default_database()
+    cursor = db.essays.find(
+        {
+            'status': 'completed',
+            'ai_evaluated': True,
+            'evaluation_tier': {'$ne': 'local'},
+            'score': {'$gt': 0},
+        },
+        {'content': 1, 'score': 1, 'provisional_features': 1},
+        limit=limit
+    )
+
+    essays = list(cursor)
+    client.close()
+
+    # Stored features are reused unless they predate a feature; the rest are parsed in one nlp.pipe pass
+    stale = [i for i, essay in enumerate(essays)
+             if recompute or not essay.get('provisional_features')
+             or any(name not in essay['provisional_features'] for name in FEATURE_NAMES)]
+    recomputed = extract_features_many([essays[i].get('content', '') for i in stale],
+                                       batch_size=batch_size, n_process=n_process)
+    for i, features in zip(stale, recomputed):
+        essays[i]['provisional_features'] = features
+
+    rows, targets = [], []
+    for essay in essays:
+        features = essay['provisional_features']
+        if not features['word_count']:
+            continue
+        rows.append([float(features[name]) for name in FEATURE_NAMES])
+        targets.append(float(essay['score']))
+    return np.array(rows, dtype=float).reshape(-1, len(FEATURE_NAMES)), np.array(targets, dtype=float)
+
+
+def standardize(X):
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    return mean, scale
+
+
+def fit_ridge(X, y, alpha):
+    """Closed-form ridge on standardized features; the intercept is not penalized"""
+    mean, scale = standardize(X)
+    Xs = (X - mean) / scale
+    intercept = y.mean()
+    gram = Xs.T @ Xs + alpha * np.eye(Xs.shape[1])
+    weights = np.linalg.solve(gram, Xs.T @ (y - intercept))
+    return {'mean': mean, 'scale': scale, 'weights': weights, 'intercept': intercept}
+
+
+def predict(model, X):
+    return np.clip((X - model['mean']) / model['scale'] @ model['weights'] + model['intercept'], 0, 100)
+
+
+def cross_validate(X, y, alpha, folds, seed=0):
+    """Out-of-fold (rmse, mae) for one penalty"""
+    order = np.random.default_rng(seed).permutation(len(y))
+    errors = np.empty(len(y))
+    for fold in np.array_split(order, folds):
+        train = np.setdiff1d(order, fold, assume_unique=True)
+        model = fit_ridge(X[train], y[train], alpha)
+        errors[fold] = predict(model, X[fold]) - y[fold]
+    return float(np.sqrt(np.mean(errors ** 2))), float(np.mean(np.abs(errors)))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--output', default=DEFAULT_MODEL_PATH, help='model JSON to write')
+    arg_parser.add_argument('--mongo-uri', default=Config.MONGO_URI, help='defaults to MONGO_URI')
+    arg_parser.add_argument('--folds', type=int, default=5)
+    arg_parser.add_argument('--alphas', type=float, nargs='+', default=DEFAULT_ALPHAS)
+    arg_parser.add_argument('--limit', type=int, default=0, help='max essays to read (0 = all)')
+    arg_parser.add_argument('--min-samples', type=int, default=30)
+    arg_parser.add_argument('--recompute', action='store_true', help='ignore stored provisional_features')
+    arg_parser.add_argument('--batch-size', type=int, default=None, help='spaCy nlp.pipe batch size')
+    arg_parser.add_argument('--n-process', type=int, default=None, help='spaCy worker processes')
+    args = arg_parser.parse_args()
+
+    if not args.mongo_uri:
+        sys.exit("MONGO_URI is not set (use --mongo-uri)")
+
+    started = time.time()
+    X, y = load_training_set(args.mongo_uri, args.limit, args.recompute, args.batch_size, args.n_process)
+    print(f"📚 {len(y)} LLM-scored essays loaded in {time.time() - started:.1f}s")
+    if len(y) < args.min_samples:
+        sys.exit(f"Need at least {args.min_samples} essays to train (have {len(y)})")
+
+    folds = max(2, min(args.folds, len(y)))
+    baseline_rmse = float(y.std())
+    results = []
+    for alpha in args.alphas:
+        rmse, mae = cross_validate(X, y, alpha, folds)
+        results.append((rmse, mae, alpha))
+        print(f"   alpha={alpha:<8g} CV RMSE {rmse:6.2f}  MAE {mae:6.2f}")
+    rmse, mae, alpha = min(results)
+    print(f"✅ Best alpha {alpha:g}: CV RMSE {rmse:.2f} (predict-the-mean baseline {baseline_rmse:.2f})")
+
+    fitted = fit_ridge(X, y, alpha)
+    model = {
+        'version': 1,
+        'feature_names': list(FEATURE_NAMES),
+        'mean': fitted['mean'].round(6).tolist(),
+        'scale': fitted['scale'].round(6).tolist(),
+        'weights': fitted['weights'].round(6).tolist(),
+        'intercept': round(float(fitted['intercept']), 6),
+        'alpha': alpha,
+        'cv_rmse': round(rmse, 3),
+        'cv_mae': round(mae, 3),
+        'baseline_rmse': round(baseline_rmse, 3),
+        'n_samples': int(len(y)),
+        'trained_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    for name, weight in sorted(zip(FEATURE_NAMES, model['weights']), key=lambda p: -abs(p[1])):
+        print(f"   {name:<22} {weight:+.3f}")
+
+    # Serving check: the module used by the app must load it and answer in well under 1 ms
+    scorer = RidgeScorer(model)
+    sample = dict(zip(FEATURE_NAMES, X[0]))
+    repeat = 10000
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        scorer.predict(sample)
+    per_call_us = (time.perf_counter() - t0) / repeat * 1e6
+    print(f"⚡ Serving prediction: {per_call_us:.1f} µs per essay")
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(model, f, indent=2)
+    print(f"💾 Model written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import mongomock
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# No provider calls from tests (the LLMService singleton is built at import)
+os.environ.setdefault('LLM_BACKEND', 'stub')
+# Fast stub responses unless a test configures its own latency
+os.environ.setdefault('LLM_STUB_LATENCY_P50_MS', '5')
+os.environ.setdefault('LLM_STUB_LATENCY_P95_MS', '10')
+os.environ.setdefault('LLM_STUB_TOKENS_PER_SECOND', '100000')
+os.environ.setdefault('JWT_SECRET_KEY', 'test-secret-key-long-enough-for-hs256')
+
+
+@pytest.fixture
+def db():
+    """A fresh in-memory MongoDB database per test"""
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture(scope='session')
+def app():
+    """The Flask app on an in-memory MongoDB, without background evaluation workers"""
+    from unittest import mock
+
+    import flask_pymongo
+
+    from app import create_app
+    from app.config import Config
+    from app.services.evaluation_queue import EvaluationQueue
+
+    class TestConfig(Config):
+        TESTING = True
+        MONGO_URI = 'mongodb://localhost:27017/essays_test'
+
+    with mock.patch.object(flask_pymongo, 'MongoClient', lambda *args, **kwargs: mongomock.MongoClient()), \
+            mock.patch.object(EvaluationQueue, 'start'):
+        return create_app(TestConfig)
+
+
+@pytest.fixture
+def api(app):
+    """(test client, mongo db) with empty collections"""
+    from app.extensions import mongo
+
+    for name in mongo.db.list_collection_names():
+        mongo.db[name].delete_many({})
+    return app.test_client(), mongo.db
+
+
+@pytest.fixture
+def auth_headers():
+    """Authorization header for a user id"""
+    from app.routes.auth import generate_token
+
+    return lambda user_id: {'Authorization': f'Bearer {generate_token(user_id)}'}
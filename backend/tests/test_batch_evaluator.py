@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.models.essay import Essay
+from app.models.evaluation_batch import EvaluationBatch
+from app.services.batch_evaluator import BatchEvaluator
+
+
+class FakeLLMService:
+    """evaluate_essay returns a fixed score, or runs `during` first (e.g. a concurrent revision)"""
+
+    combined_mode = False
+
+    def __init__(self, score=70, error=None, during=None):
+        self.score = score
+        self.error = error
+        self.during = during
+        self.calls = 0
+
+    def evaluate_essay(self, title, content, use_fallback=True, essay_id=None):
+        self.calls += 1
+        if self.during:
+            self.during()
+        if self.error:
+            raise self.error
+        return {'score': self.score, 'feedback': f'evaluated: {content}'}
+
+
+@pytest.fixture
+def essays(db):
+    return Essay(db)
+
+
+@pytest.fixture
+def batches(db):
+    return EvaluationBatch(db)
+
+
+def run_batch(essays, batches, llm_service, essay_ids, owner):
+    items = [{'essay_id': essay_id, 'title': 'Title', 'content': essays.get_by_id(essay_id)['content']}
+             for essay_id in essay_ids]
+    batch_id = batches.create('user-1', items)['_id']
+    evaluator = BatchEvaluator(essays, batches, llm_service, max_workers=1)
+    return list(evaluator.run(batch_id, items, owner))
+
+
+def test_batch_essays_are_not_claimed_by_the_queue(essays, batches):
+    owner = BatchEvaluator.owner('b1')
+    essay_id = essays.create('user-1', 'Title', 'Batch text.', lease_owner=owner, lease_seconds=900)['_id']
+
+    assert essays.claim_next_evaluation('worker-a', lease_seconds=60) is None
+
+    results = run_batch(essays, batches, FakeLLMService(), [essay_id], owner)
+    assert results[0]['status'] == 'completed'
+    stored = essays.get_by_id(essay_id)
+    assert stored['status'] == 'completed'
+    assert stored['score'] == 70
+
+
+def test_reserve_skips_essays_a_worker_is_evaluating(essays):
+    busy = essays.create('user-1', 'Title', 'Busy text.')['_id']
+    idle = essays.create('user-1', 'Title', 'Idle text.')['_id']
+    essays.collection.update_one({'_id': ObjectId(idle)}, {'$set': {'status': 'completed'}})
+    essays.claim_next_evaluation('worker-a', lease_seconds=60)
+
+    reserved = essays.reserve_for([busy, idle], 'user-1', BatchEvaluator.owner('b1'), 900)
+
+    assert reserved == {idle}
+    assert essays.collection.find_one({'_id': ObjectId(busy)})['job']['worker'] == 'worker-a'
+
+
+def test_expired_reservation_goes_to_the_queue_and_batch_drops_it(essays, batches):
+    owner = BatchEvaluator.owner('b1')
+    essay_id = essays.create('user-1', 'Title', 'Batch text.', lease_owner=owner, lease_seconds=900)['_id']
+    essays.collection.update_one(
+        {'_id': ObjectId(essay_id)},
+        {'$set': {'job.lease_expires': datetime.now() - timedelta(seconds=1)}}
+    )
+    assert essays.claim_next_evaluation('worker-a', lease_seconds=60) is not None
+
+    llm_service = FakeLLMService()
+    results = run_batch(essays, batches, llm_service, [essay_id], owner)
+
+    assert results[0]['status'] == 'failed'
+    assert llm_service.calls == 0
+
+
+def test_revision_during_batch_item_drops_the_stale_result(essays, batches):
+    owner = BatchEvaluator.owner('b1')
+    essay_id = essays.create('user-1', 'Title', 'Old text.', lease_owner=owner, lease_seconds=900)['_id']
+    llm_service = FakeLLMService(during=lambda: essays.requeue_revision(essay_id, 'Title', 'New text.'))
+
+    results = run_batch(essays, batches, llm_service, [essay_id], owner)
+
+    assert results[0]['status'] == 'failed'
+    stored = essays.collection.find_one({'_id': ObjectId(essay_id)})
+    assert stored['status'] == 'evaluating'
+    assert stored['content'] == 'New text.'
+    assert stored['score'] is None
+
+
+def test_failed_item_is_released_to_the_queue(essays, batches):
+    owner = BatchEvaluator.owner('b1')
+    essay_id = essays.create('user-1', 'Title', 'Batch text.', lease_owner=owner, lease_seconds=900)['_id']
+
+    results = run_batch(essays, batches, FakeLLMService(error=RuntimeError('provider down')), [essay_id], owner)
+
+    assert results[0]['status'] == 'failed'
+    job = essays.collection.find_one({'_id': ObjectId(essay_id)})['job']
+    assert job['error'] == 'provider down'
+    assert job['lease_expires'] < datetime.now() + timedelta(seconds=60)
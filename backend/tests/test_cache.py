@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from app.services.cache import EvaluationCache
+
+
+def test_key_ignores_title_and_formatting():
+    key = EvaluationCache.make_key('Some essay text.\r\n\r\nSecond  paragraph.', 'model', 'v1')
+    assert key == EvaluationCache.make_key('Some essay text.\n\nSecond paragraph.', 'model', 'v1')
+    assert key != EvaluationCache.make_key('Some essay text.', 'model', 'v1')
+    assert key != EvaluationCache.make_key('Some essay text.\n\nSecond paragraph.', 'model', 'v2')
+
+
+def test_lru_hits_refresh_last_hit_at(db):
+    cache = EvaluationCache(db, touch_seconds=0)
+    key = EvaluationCache.make_key('text', 'model', 'v1')
+    cache.set(key, {'score': 80}, 'model', 'v1')
+    before = db.evaluation_cache.find_one({'_id': key})['last_hit_at']
+
+    assert cache.get(key) == {'score': 80}
+    entry = db.evaluation_cache.find_one({'_id': key})
+    assert entry['hits'] == 1
+    assert entry['last_hit_at'] >= before
+
+
+def test_lru_touches_are_throttled(db):
+    cache = EvaluationCache(db, touch_seconds=3600)
+    key = EvaluationCache.make_key('text', 'model', 'v1')
+    cache.set(key, {'score': 80}, 'model', 'v1')
+    for _ in range(5):
+        cache.get(key)
+    assert db.evaluation_cache.find_one({'_id': key})['hits'] == 0
+
+    cache.touch_seconds = 0
+    cache.get(key)
+    # The batched hits are written with the next touch
+    assert db.evaluation_cache.find_one({'_id': key})['hits'] == 6
+
+
+def test_eviction_keeps_entries_hot_in_memory(db):
+    cache = EvaluationCache(db, max_entries=1, touch_seconds=0)
+    hot = EvaluationCache.make_key('hot', 'model', 'v1')
+    cold = EvaluationCache.make_key('cold', 'model', 'v1')
+    cache.set(hot, {'score': 1}, 'model', 'v1')
+    cache.set(cold, {'score': 2}, 'model', 'v1')
+    # Written in the same millisecond: make the hot one the older write
+    db.evaluation_cache.update_one({'_id': hot}, {'$set': {'last_hit_at': datetime(2000, 1, 1)}})
+    db.evaluation_cache.update_one({'_id': cold}, {'$set': {'last_hit_at': datetime(2000, 1, 2)}})
+    cache.get(hot)
+
+    cache._evict_overflow()
+    assert db.evaluation_cache.find_one({'_id': hot}) is not None
+    assert db.evaluation_cache.find_one({'_id': cold}) is None
+
+
+def test_ttl_fields_are_utc(db):
+    cache = EvaluationCache(db)
+    key = EvaluationCache.make_key('text', 'model', 'v1')
+    cache.set(key, {'score': 80}, 'model', 'v1')
+
+    entry = db.evaluation_cache.find_one({'_id': key})
+    assert abs((entry['created_at'] - datetime.utcnow()).total_seconds()) < 5
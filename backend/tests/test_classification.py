@@ -0,0 +1,122 @@
+import re
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from app.services import llm_service as llm_service_module
+from app.services.cache import ClassificationCache
+
+PROMPT_LINE_RE = re.compile(r'^(\d+)\. .*?number (\d+)', re.MULTILINE)
+
+
+def make_statements(count, failing=()):
+    """Statements whose text carries their position; `failing` ones break the batch they land in"""
+    return [
+        {'id': f'stmt_{k}',
+         'text': f'Sentence number {k} covers point {k}' + (' and fails.' if k in failing else '.')}
+        for k in range(count)
+    ]
+
+
+def expected(k):
+    """What the fake LLM answers for sentence number k (never what the rule-based fallback gives)"""
+    return ('evidence' if k % 2 else 'transition', round(0.01 * (k + 1), 2))
+
+
+class FakeChat:
+    """Stands in for LLMService._chat: answers each numbered line, later batches faster"""
+
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, purpose, messages, max_tokens, usage_log, **kwargs):
+        prompt = messages[-1]['content']
+        lines = [(int(n), int(k)) for n, k in PROMPT_LINE_RE.findall(prompt)]
+        with self._lock:
+            self.batches.append([k for _, k in lines])
+        # Answers come back out of order: the first batch is the slowest
+        time.sleep(max(0.0, 0.05 - 0.01 * lines[0][1] / 5))
+        if 'fails' in prompt:
+            raise RuntimeError('provider down')
+        return '\n'.join(f'{n}: type={expected(k)[0]} | strength={expected(k)[1]}' for n, k in lines)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = llm_service_module.LLMService()
+    service.classify_batch_tokens = 10000
+    service.classify_batch_size = 5
+    service.classify_min_batch = 1
+    service.chunk_parallelism = 3
+    chat = FakeChat()
+    monkeypatch.setattr(service, '_chat', chat)
+    return service, chat
+
+
+def test_multi_batch_classification_keeps_sentence_order(service):
+    service, chat = service
+
+    statements = service._llm_classify_statements(make_statements(20), relationships=False)
+
+    assert len(chat.batches) == 4
+    assert sorted(k for batch in chat.batches for k in batch) == list(range(20))
+    assert [stmt['id'] for stmt in statements] == [f'stmt_{k}' for k in range(20)]
+    assert [(stmt['type'], stmt['strength']) for stmt in statements] == [expected(k) for k in range(20)]
+
+
+def test_failed_batch_falls_back_to_rule_based_classification(service):
+    service, chat = service
+
+    statements = service._llm_classify_statements(make_statements(20, failing={7}), relationships=False)
+
+    failed = next(batch for batch in chat.batches if 7 in batch)
+    for k, stmt in enumerate(statements):
+        if k in failed:
+            assert (stmt['type'], stmt['strength']) == ('claim', 0.5)
+        else:
+            assert (stmt['type'], stmt['strength']) == expected(k)
+
+
+def test_cached_classifications_make_no_backend_calls(service, db):
+    service, chat = service
+    service.attach_classification_cache(ClassificationCache(db))
+
+    first = service._llm_classify_statements(make_statements(20), relationships=False)
+    calls = len(chat.batches)
+    assert calls == 4
+
+    second = service._llm_classify_statements(make_statements(20), relationships=False)
+    assert len(chat.batches) == calls
+    assert second == first
+
+
+
+def test_classifications_stored_by_another_process_make_no_backend_calls(service, db):
+    service, chat = service
+    cache = ClassificationCache(db)
+    service.attach_classification_cache(cache)
+    statements = make_statements(20)
+    db['classification_cache'].insert_many([
+        {'_id': cache.make_key(stmt['text'], service.model, llm_service_module.CLASSIFICATION_PROMPT_VERSION),
+         'type': expected(k)[0], 'strength': expected(k)[1], 'created_at': datetime.utcnow()}
+        for k, stmt in enumerate(statements)
+    ])
+
+    classified = service._llm_classify_statements(statements, relationships=False)
+    assert chat.batches == []
+    assert [(stmt['type'], stmt['strength']) for stmt in classified] == [expected(k) for k in range(20)]
+
+
+def test_failed_batch_is_not_cached(service, db):
+    service, chat = service
+    service.attach_classification_cache(ClassificationCache(db))
+
+    service._llm_classify_statements(make_statements(20, failing={7}), relationships=False)
+    failed = next(batch for batch in chat.batches if 7 in batch)
+    calls = len(chat.batches)
+
+    service._llm_classify_statements(make_statements(20), relationships=False)
+    assert sorted(k for batch in chat.batches[calls:] for k in batch) == sorted(failed)
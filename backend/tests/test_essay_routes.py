@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.models.essay import Essay
+
+USER_ID = 'user-1'
+
+
+def create_pending(db):
+    provisional = {'score': 62, 'features': {'word_count': 3}, 'scorer': 'heuristic'}
+    return Essay(db).create(USER_ID, 'Title', 'Essay text here.', provisional=provisional)['_id']
+
+
+def test_essay_list_shows_provisional_score_while_evaluating(api, auth_headers):
+    client, db = api
+    essay_id = create_pending(db)
+
+    response = client.get('/api/essays', headers=auth_headers(USER_ID))
+    assert response.status_code == 200
+    [essay] = response.get_json()['essays']
+    assert essay['id'] == essay_id
+    assert essay['status'] == 'evaluating'
+    assert essay['provisional_score'] == 62
+
+
+def test_essay_detail_shows_provisional_score_while_evaluating(api, auth_headers):
+    client, db = api
+    essay_id = create_pending(db)
+
+    response = client.get(f'/api/essays/{essay_id}', headers=auth_headers(USER_ID))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['score'] is None
+    assert body['provisional_score'] == 62
+
+
+STATEMENTS = [{'id': 'stmt_1', 'text': 'Essay text here.', 'type': 'claim', 'strength': 0.7, 'linked_to': []}]
+
+
+def create_with_statements(db):
+    essay_id = Essay(db).create(USER_ID, 'Title', 'Essay text here.')['_id']
+    db.essays.update_one({'_id': ObjectId(essay_id)}, {'$set': {
+        'statements': STATEMENTS,
+        'statement_summary': {'total': 1},
+        'statements_generated_at': datetime.now() - timedelta(hours=1),
+    }})
+    return essay_id
+
+
+@pytest.fixture
+def api_routes(api):
+    """The api blueprint module (importable once the app exists)"""
+    from app.routes import api as api_routes
+    return api_routes
+
+
+class FindOneSpy:
+    """Wraps a collection and records the projection of every find_one"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.projections = []
+
+    def find_one(self, filter, projection=None, *args, **kwargs):
+        self.projections.append(projection)
+        return self.collection.find_one(filter, projection, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_statements_are_read_with_one_projected_query(api, api_routes, auth_headers, monkeypatch):
+    client, db = api
+    essay_id = create_with_statements(db)
+    spy = FindOneSpy(api_routes.essay_model.collection)
+    monkeypatch.setattr(api_routes.essay_model, 'collection', spy)
+
+    response = client.get(f'/api/essays/{essay_id}/statements', headers=auth_headers(USER_ID))
+    assert response.status_code == 200
+    assert response.get_json()['statements'] == STATEMENTS
+    assert len(spy.projections) == 1
+    assert 'content' not in spy.projections[0]
+    assert 'statements' in spy.projections[0]
+
+
+def test_unchanged_statements_answer_304(api, auth_headers):
+    client, db = api
+    essay_id = create_with_statements(db)
+    url = f'/api/essays/{essay_id}/statements'
+
+    first = client.get(url, headers=auth_headers(USER_ID))
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+
+    second = client.get(url, headers={**auth_headers(USER_ID), 'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+
+
+def test_regenerated_statements_change_the_etag(api, api_routes, auth_headers, monkeypatch):
+    client, db = api
+    essay_id = create_with_statements(db)
+    url = f'/api/essays/{essay_id}/statements'
+    regenerated = [dict(STATEMENTS[0], type='evidence')]
+    monkeypatch.setattr(api_routes.llm_service, 'extract_atomic_statements',
+                        lambda content, essay_id=None: {'statements': regenerated, 'summary': {'total': 1}})
+
+    etag = client.get(url, headers=auth_headers(USER_ID)).headers['ETag']
+    assert client.post(f'{url}/regenerate', headers=auth_headers(USER_ID)).status_code == 200
+
+    response = client.get(url, headers={**auth_headers(USER_ID), 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['statements'] == regenerated
@@ -0,0 +1,72 @@
+import glob
+import json
+import os
+
+import pytest
+
+from app.services.evaluation_parser import EvaluationParser, NOT_EVALUATED, merge_evaluations
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'benchmarks', 'corpus', 'evaluations')
+CONTENT = 'A short essay. It has three sentences. Each one is simple.'
+
+
+def load_corpus():
+    corpus = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.txt'))):
+        with open(path, encoding='utf-8') as f:
+            response = f.read()
+        with open(path[:-4] + '.json', encoding='utf-8') as f:
+            expected = json.load(f)
+        corpus.append(pytest.param(response, expected, id=os.path.basename(path)[:-4]))
+    return corpus
+
+
+def parse(response, chunk_size=None):
+    parser = EvaluationParser(CONTENT)
+    step = chunk_size or len(response) or 1
+    for i in range(0, len(response), step):
+        parser.feed(response[i:i + step])
+    return parser.result()
+
+
+def observed(evaluation, field):
+    value = evaluation[field]
+    if field == 'suggestions':
+        return len(value)
+    if field in ('structure', 'content', 'coherence', 'feedback'):
+        return value not in ('', NOT_EVALUATED)
+    return value
+
+
+@pytest.mark.parametrize('response,expected', load_corpus())
+@pytest.mark.parametrize('chunk_size', [None, 1, 7])
+def test_corpus_parses_as_expected(response, expected, chunk_size):
+    evaluation = parse(response, chunk_size)
+    assert {field: observed(evaluation, field) for field in expected} == expected
+
+
+@pytest.mark.parametrize('header', ['SCORE: 64', '**Score:** 64', '## SCORE: 64', 'score : 64', 'Score:\n64'])
+def test_score_header_variants(header):
+    assert parse(header + '\nFEEDBACK: Fine.')['score'] == 64
+
+
+def test_inline_section_names_do_not_start_sections():
+    evaluation = parse('SCORE: 70\nSTRUCTURE: Clear, but the SCORE: of each part varies.\n'
+                       'FEEDBACK: Mentions CONTENT QUALITY: inline.')
+    assert evaluation['score'] == 70
+    assert evaluation['structure'] == 'Clear, but the SCORE: of each part varies.'
+    assert evaluation['content'] == NOT_EVALUATED
+
+
+@pytest.mark.parametrize('line', ['No errors found.', 'No significant grammar errors', 'There are no issues.'])
+def test_no_errors_line_counts_no_errors(line):
+    evaluation = parse(f'GRAMMAR ERRORS:\n{line}\nGRAMMAR RATING: Good')
+    assert evaluation['total_grammar_errors'] == 0
+    assert evaluation['error_feedback'] == []
+
+
+def test_merge_of_no_evaluations():
+    merged = merge_evaluations([], [], CONTENT)
+    assert merged['score'] == 0
+    assert merged['suggestions'] == []
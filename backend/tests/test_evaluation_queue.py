@@ -0,0 +1,177 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.models.essay import Essay
+from app.services.evaluation_queue import EvaluationQueue
+
+
+class FakeLLMService:
+    """evaluate_essay returns a fixed score, or runs `during` first (e.g. a concurrent revision)"""
+
+    def __init__(self, score=80, error=None, during=None):
+        self.score = score
+        self.error = error
+        self.during = during
+        self.calls = 0
+
+    def evaluate_essay(self, title, content, use_fallback=True, essay_id=None):
+        self.calls += 1
+        if self.during:
+            self.during()
+        if self.error:
+            raise self.error
+        return {'score': self.score, 'feedback': f'evaluated: {content}'}
+
+
+@pytest.fixture
+def essays(db):
+    return Essay(db)
+
+
+def make_queue(essays, llm_service, **kwargs):
+    queue = EvaluationQueue(essays, llm_service, workers=1, lease_seconds=60, poll_interval=0.01, **kwargs)
+    queue.retry_delay = 10
+    return queue
+
+
+def create(essays, content='Essay text.', uploaded=None):
+    essay_id = essays.create('user-1', 'Title', content)['_id']
+    if uploaded:
+        essays.collection.update_one({'_id': ObjectId(essay_id)}, {'$set': {'upload_date': uploaded}})
+    return essay_id
+
+
+def expire_lease(essays, essay_id):
+    essays.collection.update_one(
+        {'_id': ObjectId(essay_id)},
+        {'$set': {'job.lease_expires': datetime.now() - timedelta(seconds=1)}}
+    )
+
+
+def test_claim_takes_oldest_and_leases_it(essays):
+    older = create(essays, 'first', datetime.now() - timedelta(minutes=5))
+    newer = create(essays, 'second')
+
+    claimed = essays.claim_next_evaluation('worker-a', lease_seconds=60)
+    assert str(claimed['_id']) == older
+    assert claimed['job']['worker'] == 'worker-a'
+    assert claimed['job']['attempts'] == 1
+    assert claimed['job']['lease_expires'] > datetime.now()
+
+    # The leased essay is not handed out twice
+    assert str(essays.claim_next_evaluation('worker-b', 60)['_id']) == newer
+    assert essays.claim_next_evaluation('worker-c', 60) is None
+
+
+def test_expired_lease_is_claimed_again(essays):
+    essay_id = create(essays)
+    essays.claim_next_evaluation('worker-a', 60)
+    assert essays.claim_next_evaluation('worker-b', 60) is None
+
+    expire_lease(essays, essay_id)
+    claimed = essays.claim_next_evaluation('worker-b', 60)
+    assert claimed['job']['worker'] == 'worker-b'
+    assert claimed['job']['attempts'] == 2
+
+
+def test_failed_job_is_released_with_backoff(essays):
+    essay_id = create(essays)
+    queue = make_queue(essays, FakeLLMService(error=RuntimeError('provider down')))
+
+    queue._process(essays.claim_next_evaluation('worker-a', 60), 'worker-a')
+    job = essays.get_by_id(essay_id)['job']
+    assert job['error'] == 'provider down'
+    # First retry after retry_delay, not claimable before
+    assert timedelta(seconds=8) < job['lease_expires'] - datetime.now() <= timedelta(seconds=10)
+    assert essays.claim_next_evaluation('worker-b', 60) is None
+
+    expire_lease(essays, essay_id)
+    queue._process(essays.claim_next_evaluation('worker-a', 60), 'worker-a')
+    job = essays.get_by_id(essay_id)['job']
+    # Doubled for the second attempt
+    assert timedelta(seconds=18) < job['lease_expires'] - datetime.now() <= timedelta(seconds=20)
+
+
+def test_job_is_abandoned_after_max_attempts(essays):
+    essay_id = create(essays)
+    queue = make_queue(essays, FakeLLMService(), max_attempts=1)
+    essays.claim_next_evaluation('worker-a', 60)
+    expire_lease(essays, essay_id)
+
+    queue._process(essays.claim_next_evaluation('worker-a', 60), 'worker-a')
+    assert essays.get_by_id(essay_id)['status'] == 'failed'
+
+
+def test_failing_to_abandon_a_job_does_not_raise(monkeypatch, essays):
+    essay_id = create(essays)
+    queue = make_queue(essays, FakeLLMService(), max_attempts=1)
+    essays.claim_next_evaluation('worker-a', 60)
+    expire_lease(essays, essay_id)
+
+    def mongo_down(*args, **kwargs):
+        raise RuntimeError('connection reset')
+
+    monkeypatch.setattr(essays, 'mark_evaluation_failed', mongo_down)
+    queue._process(essays.claim_next_evaluation('worker-a', 60), 'worker-a')
+    assert essays.get_by_id(essay_id)['status'] == 'evaluating'
+
+
+def test_result_is_written_under_the_claim(essays):
+    essay_id = create(essays)
+    queue = make_queue(essays, FakeLLMService(score=75))
+
+    queue._process(essays.claim_next_evaluation('worker-a', 60), 'worker-a')
+    essay = essays.get_by_id(essay_id)
+    assert essay['status'] == 'completed'
+    assert essay['score'] == 75
+
+
+def test_result_for_revised_content_is_dropped(essays):
+    essay_id = create(essays, 'old text')
+    # The user edits the essay while the worker waits on the LLM
+    revise = lambda: essays.requeue_revision(essay_id, 'Title', 'new text')
+    queue = make_queue(essays, FakeLLMService(during=revise))
+
+    queue._process(essays.claim_next_evaluation('worker-a', 60), 'worker-a')
+    essay = essays.get_by_id(essay_id)
+    assert essay['status'] == 'evaluating'
+    assert essay['score'] is None
+    # The revision is still queued for evaluation
+    claimed = essays.claim_next_evaluation('worker-b', 60)
+    assert claimed['content'] == 'new text'
+
+
+def test_write_after_lease_takeover_is_dropped(essays):
+    essay_id = create(essays)
+    slow = essays.claim_next_evaluation('worker-a', 60)
+    expire_lease(essays, essay_id)
+    fast = essays.claim_next_evaluation('worker-b', 60)
+
+    make_queue(essays, FakeLLMService(score=90))._process(fast, 'worker-b')
+    make_queue(essays, FakeLLMService(score=10))._process(slow, 'worker-a')
+    assert essays.get_by_id(essay_id)['score'] == 90
+
+
+def test_release_by_superseded_worker_is_ignored(essays):
+    essay_id = create(essays)
+    claimed = essays.claim_next_evaluation('worker-a', 60)
+    essays.requeue_revision(essay_id, 'Title', 'new text')
+
+    make_queue(essays, FakeLLMService(error=RuntimeError('boom')))._process(claimed, 'worker-a')
+    job = essays.get_by_id(essay_id)['job']
+    # The requeued job stays immediately claimable
+    assert job['lease_expires'] is None
+    assert 'error' not in job
+
+
+def test_revise_stores_features_of_the_new_text(essays):
+    essay_id = create(essays, 'Old text.')
+    provisional = {'score': 55, 'features': {'word_count': 3}, 'scorer': 'heuristic'}
+
+    essays.revise(essay_id, 'Title', 'New text here.', {'score': 70}, [], provisional=provisional)
+
+    stored = essays.collection.find_one({'_id': ObjectId(essay_id)})
+    assert stored['provisional_features'] == {'word_count': 3}
+    assert stored['provisional_score'] == 55
@@ -0,0 +1,95 @@
+import threading
+import time
+
+from app.services import deadline
+from app.services import llm_service as llm_service_module
+from app.services.llm_backends import StubBackend, completion_response
+from app.services.llm_client import CircuitBreaker, ResilientLLMClient
+
+MESSAGES = [{'role': 'user', 'content': 'hello'}]
+
+
+class ScriptedStub(StubBackend):
+    """Stub backend whose n-th call takes latencies[n] seconds and answers 'call-n'"""
+
+    def __init__(self, latencies):
+        super().__init__()
+        self.latencies = list(latencies)
+        self.started = []
+        self._calls_lock = threading.Lock()
+
+    def chat_completion(self, messages, model=None, max_tokens=None, stream=False, timeout=None, **kwargs):
+        with self._calls_lock:
+            index = len(self.started)
+            self.started.append(time.monotonic())
+        time.sleep(self.latencies[index])
+        return completion_response(f'call-{index}')
+
+
+def hedging_service(monkeypatch, latencies, max_concurrency=2, p95=0.2, p50=0.05):
+    """LLMService over a ScriptedStub with known latency quantiles (p95 sets the hedge delay)"""
+    service = llm_service_module.LLMService()
+    backend = ScriptedStub(latencies)
+    service.client = ResilientLLMClient(backend, max_concurrency=max_concurrency, rate_per_second=100,
+                                        burst=10, max_retries=0, breaker=CircuitBreaker(failure_threshold=100))
+    service.hedging = True
+    service.hedge_min_delay = 0.01
+    service.min_call_seconds = 0.0
+    monkeypatch.setattr(service, '_model_seconds', lambda q, purpose: p95 if q >= 0.9 else p50)
+    return service, backend
+
+
+def answer(response):
+    return response.choices[0].message.content
+
+
+def wait_idle(client, slots, timeout=3):
+    stop = time.monotonic() + timeout
+    while client.idle_slots < slots and time.monotonic() < stop:
+        time.sleep(0.01)
+    return client.idle_slots
+
+
+def test_hedge_fires_after_p95_and_first_answer_wins(monkeypatch):
+    service, backend = hedging_service(monkeypatch, latencies=[0.8, 0.05])
+
+    started = time.monotonic()
+    response = service._hedged_completion('evaluation', messages=MESSAGES)
+
+    assert answer(response) == 'call-1'
+    assert len(backend.started) == 2
+    assert backend.started[1] - backend.started[0] >= 0.2
+    assert time.monotonic() - started < 0.6
+    # The losing call finishes in the background and gives its slot back
+    assert wait_idle(service.client, 2) == 2
+
+
+def test_no_hedge_when_the_call_beats_p95(monkeypatch):
+    service, backend = hedging_service(monkeypatch, latencies=[0.05, 0.05])
+
+    assert answer(service._hedged_completion('evaluation', messages=MESSAGES)) == 'call-0'
+    assert len(backend.started) == 1
+
+
+def test_no_hedge_without_an_idle_slot(monkeypatch):
+    service, backend = hedging_service(monkeypatch, latencies=[0.4, 0.05], max_concurrency=1)
+
+    assert answer(service._hedged_completion('evaluation', messages=MESSAGES)) == 'call-0'
+    assert len(backend.started) == 1
+
+
+def test_no_hedge_when_the_budget_cannot_cover_it(monkeypatch):
+    # At the hedge point 0.1s are left, less than a median (0.25s) call
+    service, backend = hedging_service(monkeypatch, latencies=[0.25, 0.05], p50=0.25)
+
+    with deadline.request_budget(0.3):
+        assert answer(service._hedged_completion('evaluation', messages=MESSAGES)) == 'call-0'
+    assert len(backend.started) == 1
+
+
+def test_hedging_off_sends_one_call(monkeypatch):
+    service, backend = hedging_service(monkeypatch, latencies=[0.3, 0.05])
+    service.hedging = False
+
+    assert answer(service._hedged_completion('evaluation', messages=MESSAGES)) == 'call-0'
+    assert len(backend.started) == 1
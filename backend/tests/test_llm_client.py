@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from app.services.llm_backends import LLMBackend, LLMBackendError, StubBackend
+from app.services.llm_client import CircuitBreaker, ResilientLLMClient
+
+MESSAGES = [{'role': 'user', 'content': 'hello'}]
+
+
+def make_client(backend, **kwargs):
+    return ResilientLLMClient(backend, max_concurrency=2, rate_per_second=100, burst=10,
+                              breaker=CircuitBreaker(failure_threshold=100), **kwargs)
+
+
+def test_slow_provider_call_is_cut_at_the_deadline():
+    client = make_client(StubBackend(latency_p50_ms=5000, latency_p95_ms=5000, seed=1), max_retries=0)
+    started = time.monotonic()
+    with pytest.raises(LLMBackendError):
+        client.chat_completion(deadline=0.3, messages=MESSAGES)
+    assert time.monotonic() - started < 1.0
+
+
+def test_retries_stop_at_the_deadline():
+    client = make_client(StubBackend(latency_p50_ms=5000, latency_p95_ms=5000, seed=1),
+                         max_retries=5, backoff_base=0.01, backoff_max=0.01)
+    started = time.monotonic()
+    with pytest.raises(Exception):
+        client.chat_completion(deadline=0.5, messages=MESSAGES)
+    assert time.monotonic() - started < 1.2
+
+
+def test_fast_call_is_unaffected():
+    client = make_client(StubBackend(latency_p50_ms=10, latency_p95_ms=10, tokens_per_second=100000, seed=1))
+    response = client.chat_completion(deadline=5, messages=MESSAGES)
+    assert response.choices[0].message.content == 'OK'
+    assert client.stats()['in_flight'] == 0
+
+
+def test_incomplete_backend_fails_at_construction():
+    class NoCompletion(LLMBackend):
+        name = 'incomplete'
+
+    with pytest.raises(TypeError):
+        NoCompletion()
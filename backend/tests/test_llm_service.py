@@ -0,0 +1,131 @@
+import pytest
+
+from app.models.essay import diff_paragraphs
+from app.services import llm_service as llm_service_module
+from app.services.cache import EvaluationCache
+from app.services.local_scorer import local_scorer
+
+
+@pytest.fixture
+def service():
+    return llm_service_module.LLMService()
+
+
+@pytest.fixture
+def scored(monkeypatch, service):
+    """Records the Doc local_scorer.score is given; the essay's parse is a marker object"""
+    calls = []
+    doc = object()
+
+    def score(text, doc=None):
+        calls.append(doc)
+        return {'score': 50, 'features': {}, 'scorer': 'heuristic', 'uncertainty': None}
+
+    monkeypatch.setattr(local_scorer, 'score', score)
+    monkeypatch.setattr(service, '_parse', lambda text, essay_id=None: doc if essay_id else None)
+    return calls, doc
+
+
+def test_local_tier_off_extracts_no_features(monkeypatch, service, scored):
+    calls, _ = scored
+    monkeypatch.setattr(local_scorer, 'tier_enabled', False)
+
+    assert service._local_tier_evaluation('Some essay text.', 'essay-1') is None
+    assert calls == []
+
+
+def test_local_tier_scores_the_cached_parse(monkeypatch, service, scored):
+    calls, doc = scored
+    monkeypatch.setattr(local_scorer, 'tier_enabled', True)
+
+    service._local_tier_evaluation('Some essay text.', 'essay-1')
+    assert calls == [doc]
+
+
+def test_fallback_scores_the_cached_parse(service, scored):
+    calls, doc = scored
+
+    evaluation = service._fallback_evaluation('Some essay text.', 'essay-1')
+    assert evaluation['score'] == 50
+    assert calls == [doc]
+
+
+def test_revision_links_statements_once_with_unique_ids(monkeypatch, service):
+    paragraph_evaluation = {
+        'score': 80, 'grammar': 'Good', 'ai_detection_score': 0, 'structure': 'Clear.', 'content': 'Solid.',
+        'coherence': 'Flows.', 'feedback': 'Fine.', 'suggestions': [], 'error_feedback': [],
+        'total_grammar_errors': 0,
+    }
+    monkeypatch.setattr(service, '_evaluate_part', lambda *args: dict(paragraph_evaluation))
+    monkeypatch.setattr(service, '_classify_batched', lambda statements, usage_log: {})
+    linked = []
+    analyze = service._analyze_relationships
+    monkeypatch.setattr(service, '_analyze_relationships',
+                        lambda statements, *args: linked.append(len(statements)) or analyze(statements, *args))
+
+    content = ('Solar power is cheap today in many places. It grows every single year now.\n\n'
+               'Wind power is cheap today in many places. It also grows every single year.')
+    result = service.evaluate_revision('Energy', content, diff_paragraphs([], content))
+
+    ids = [stmt['id'] for stmt in result['statements']]
+    assert len(ids) == 4
+    assert len(set(ids)) == 4
+    assert linked == [4]
+    assert all('linked_to' in stmt for stmt in result['statements'])
+
+
+PARAGRAPH_EVALUATION = {
+    'score': 80, 'grammar': 'Good', 'ai_detection_score': 0, 'structure': 'Clear.', 'content': 'Solid.',
+    'coherence': 'Flows.', 'feedback': 'Fine.', 'suggestions': [], 'error_feedback': [],
+    'total_grammar_errors': 0,
+}
+LONG_ESSAY = '\n\n'.join(f'Paragraph {i} talks about energy policy in some detail here.' for i in range(3))
+
+
+def chunked_service(monkeypatch, service, db, failing_parts):
+    service.attach_cache(EvaluationCache(db))
+    service.chunk_tokens = 15
+
+    def evaluate_part(title, text, part, usage_log, purpose):
+        if part[0] in failing_parts:
+            raise RuntimeError('provider down')
+        return dict(PARAGRAPH_EVALUATION)
+
+    monkeypatch.setattr(service, '_evaluate_part', evaluate_part)
+    return service
+
+
+def test_partial_chunked_evaluation_is_not_cached(monkeypatch, service, db):
+    chunked_service(monkeypatch, service, db, failing_parts={2})
+
+    evaluation = service.evaluate_essay('Energy', LONG_ESSAY)
+    assert evaluation['failed_chunks'] == 1
+    assert evaluation['score'] == 80
+    assert db.evaluation_cache.count_documents({}) == 0
+
+
+def test_complete_chunked_evaluation_is_cached(monkeypatch, service, db):
+    chunked_service(monkeypatch, service, db, failing_parts=set())
+
+    evaluation = service.evaluate_essay('Energy', LONG_ESSAY)
+    assert 'failed_chunks' not in evaluation
+    assert db.evaluation_cache.count_documents({}) == 1
+
+
+def test_combined_mode_honours_the_local_tier(monkeypatch, service):
+    monkeypatch.setattr(local_scorer, 'tier_enabled', True)
+    monkeypatch.setattr(local_scorer, 'score', lambda text, doc=None: {
+        'score': 98, 'features': {}, 'scorer': 'ridge', 'uncertainty': 1.0,
+    })
+    monkeypatch.setattr(service, '_chat', lambda *args, **kwargs: pytest.fail('LLM called'))
+
+    result = service.evaluate_with_statements('Title', 'An essay with a few sentences. It is short.')
+    assert result['evaluation']['evaluation_tier'] == 'local'
+    assert result['statements'] is None
+
+
+def test_streamed_usage_is_labelled_like_its_telemetry(service):
+    events = list(service.stream_evaluation('Title', 'An essay with a few sentences. It is short.'))
+    kind, evaluation = events[-1]
+    assert kind == 'complete'
+    assert [entry['purpose'] for entry in evaluation['llm_usage']] == ['evaluation_stream']
@@ -0,0 +1,42 @@
+import pytest
+
+from app.services import llm_service as llm_service_module
+from app.services import segmentation
+from app.services.segmentation import segment, segment_many
+
+ESSAYS = [
+    'Solar power is cheap today in many places. Yes. It grows every single year (IEA, 2023).',
+    '',
+    'Short one.',
+    'Wind power is cheap too! However, storage still costs a lot? Research shows prices fall every year.',
+    'Nuclear power runs all day and night. Ok. Ok. It needs long and careful planning [4].',
+]
+
+
+@pytest.fixture
+def fallback(monkeypatch):
+    """Basic sentence splitting, as when spaCy is not installed"""
+    monkeypatch.setattr(segmentation.nlp_registry, 'get', lambda name='entities': None)
+
+
+def test_segment_many_matches_segment_per_text(fallback):
+    assert segment_many(ESSAYS) == [segment(text) for text in ESSAYS]
+
+
+def test_segment_many_of_nothing(fallback):
+    assert segment_many([]) == []
+
+
+def test_extract_statements_many_keeps_ids_and_order_per_essay(fallback):
+    service = llm_service_module.LLMService()
+
+    results = service.extract_statements_many(ESSAYS)
+
+    assert len(results) == len(ESSAYS)
+    for text, result in zip(ESSAYS, results):
+        single = service.extract_atomic_statements(text)
+        assert [stmt['id'] for stmt in result['statements']] == [stmt['id'] for stmt in single['statements']]
+        assert [stmt['text'] for stmt in result['statements']] == [stmt['text'] for stmt in segment(text)]
+        assert result['summary'].get('total_statements', 0) == len(result['statements'])
+    # Ids are sentence indices, so a skipped short sentence leaves a gap
+    assert [stmt['id'] for stmt in results[0]['statements']] == ['stmt_0', 'stmt_2']
@@ -0,0 +1,126 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.single_flight import SingleFlight, SingleFlightTimeout
+
+
+def make_flight(db, **kwargs):
+    kwargs.setdefault('wait_timeout', 5)
+    return SingleFlight(db, lease_seconds=60, poll_interval=0.01, **kwargs)
+
+
+def run_in_thread(flight, key, fn, load_result=lambda: 'loaded'):
+    """Start flight.run in a thread; returns a dict filled with 'result' or 'error'"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = flight.run(key, fn, load_result)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    outcome['thread'] = thread
+    return outcome
+
+
+def blocking(release, value=None, error=None):
+    """fn that waits for `release`, then returns value or raises error"""
+    def fn():
+        release.wait(5)
+        if error:
+            raise error
+        return value
+    return fn
+
+
+def test_waiter_in_process_shares_the_leaders_result(db):
+    flight = make_flight(db)
+    release = threading.Event()
+    calls = []
+
+    leader = run_in_thread(flight, 'k', blocking(release, 'done'))
+    time.sleep(0.05)
+    waiter = run_in_thread(flight, 'k', lambda: calls.append('waiter') or 'own')
+    time.sleep(0.05)
+    release.set()
+    leader['thread'].join(5)
+    waiter['thread'].join(5)
+
+    assert leader['result'] == ('done', False)
+    assert waiter['result'] == ('done', True)
+    assert calls == []
+    assert db['inflight_leases'].count_documents({}) == 0
+
+
+def test_waiter_in_process_gets_the_leaders_error(db):
+    flight = make_flight(db, wait_timeout=30)
+    release = threading.Event()
+
+    leader = run_in_thread(flight, 'k', blocking(release, error=RuntimeError('provider down')))
+    time.sleep(0.05)
+    waiter = run_in_thread(flight, 'k', lambda: 'own')
+    time.sleep(0.05)
+    started = time.monotonic()
+    release.set()
+    waiter['thread'].join(5)
+
+    assert isinstance(waiter['error'], RuntimeError)
+    assert time.monotonic() - started < 1
+
+
+def test_other_process_reads_the_stored_result_after_the_leader(db):
+    leader_flight, other_flight = make_flight(db), make_flight(db)
+    release = threading.Event()
+
+    leader = run_in_thread(leader_flight, 'k', blocking(release, 'done'))
+    time.sleep(0.05)
+    waiter = run_in_thread(other_flight, 'k', lambda: 'own', load_result=lambda: 'from db')
+    time.sleep(0.05)
+    release.set()
+    leader['thread'].join(5)
+    waiter['thread'].join(5)
+
+    assert leader['result'] == ('done', False)
+    assert waiter['result'] == ('from db', True)
+
+
+def test_other_process_retries_when_the_leader_fails(db):
+    leader_flight, other_flight = make_flight(db), make_flight(db, wait_timeout=30)
+    release = threading.Event()
+
+    leader = run_in_thread(leader_flight, 'k', blocking(release, error=RuntimeError('provider down')))
+    time.sleep(0.05)
+    waiter = run_in_thread(other_flight, 'k', lambda: 'own', load_result=lambda: 'never stored')
+    time.sleep(0.05)
+    started = time.monotonic()
+    release.set()
+    leader['thread'].join(5)
+    waiter['thread'].join(5)
+
+    assert isinstance(leader['error'], RuntimeError)
+    assert waiter['result'] == ('own', False)
+    assert time.monotonic() - started < 1
+    assert db['inflight_leases'].count_documents({}) == 0
+
+
+def test_expired_lease_is_taken_over(db):
+    past = datetime.utcnow() - timedelta(seconds=1)
+    db['inflight_leases'].insert_one({'_id': 'k', 'owner': 'crashed', 'acquired_at': past, 'expires_at': past})
+
+    assert make_flight(db).run('k', lambda: 'done', lambda: 'never stored') == ('done', False)
+    assert db['inflight_leases'].count_documents({}) == 0
+
+
+def test_live_lease_of_another_process_times_out(db):
+    future = datetime.utcnow() + timedelta(seconds=60)
+    db['inflight_leases'].insert_one({'_id': 'k', 'owner': 'other', 'acquired_at': datetime.utcnow(),
+                                      'expires_at': future})
+
+    with pytest.raises(SingleFlightTimeout):
+        make_flight(db, wait_timeout=0.1).run('k', lambda: 'own', lambda: 'never stored')
+    assert db['inflight_leases'].find_one({'_id': 'k'})['owner'] == 'other'
@@ -0,0 +1,56 @@
+import re
+
+import pytest
+
+from app.services.statement_features import compute_features, summarize
+
+
+def baseline(text):
+    """The LLMService helpers compute_features replaced"""
+    words = text.split()
+    lowered = text.lower()
+    if any(w in lowered for w in ['therefore', 'thus', 'in conclusion', 'hence']):
+        rule_type = 'conclusion'
+    elif any(w in lowered for w in ['according to', 'research shows', 'study']):
+        rule_type = 'evidence'
+    elif any(w in lowered for w in ['however', 'moreover', 'furthermore']):
+        rule_type = 'transition'
+    else:
+        rule_type = 'claim'
+    return {
+        'word_count': len(words),
+        'complexity': round(min(1.0, len(words) / 30.0 + sum(len(w) for w in words) / len(words) / 20.0), 2)
+        if words else 0.0,
+        'has_citation': any(re.search(p, text) for p in [r'\(\d{4}\)', r'\[\d+\]', r'\(.*?et al.*?\)']),
+        'has_discourse_marker': any(m in lowered for m in ['therefore', 'however', 'this', 'thus']),
+        'rule_type': rule_type,
+    }
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    'Short.',
+    'Therefore the policy failed (Smith, 2019).',
+    'According to Lee (2020) the data is clear.',
+    'As shown in [12], HOWEVER, results vary.',
+    'The effect was large (Lee et al., 2021) and lasting.',
+    'A sentence with (brackets) but no citation in it.',
+    'İstanbul research shows growth\tacross\nlines.',
+])
+def test_features_match_the_replaced_helpers(text):
+    features = compute_features([text])
+    observed = {name: values[0] for name, values in features.items() if name != 'avg_word_length'}
+    observed['complexity'] = round(observed['complexity'], 2)
+    assert observed == baseline(text)
+
+
+def test_summary_counts_types_in_first_seen_order():
+    summary = summarize([
+        {'type': 'evidence', 'strength': 0.8, 'complexity': 0.4, 'has_citation': True},
+        {'type': 'claim', 'strength': 0.6, 'complexity': 0.6},
+        {'type': 'evidence', 'strength': 0.4, 'complexity': 0.5},
+    ])
+    assert list(summary['by_type'].items()) == [('evidence', 2), ('claim', 1)]
+    assert summary['average_strength'] == 0.6
+    assert summary['citations_count'] == 1
+    assert summary['citation_rate'] == 0.33
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from app.models.stream_ticket import StreamTicket
+
+
+def test_ticket_is_single_use(db):
+    tickets = StreamTicket(db)
+    ticket = tickets.issue('user-1', 'essay-1')
+    assert tickets.redeem(ticket, 'essay-1') == 'user-1'
+    assert tickets.redeem(ticket, 'essay-1') is None
+
+
+def test_ticket_is_bound_to_its_essay(db):
+    tickets = StreamTicket(db)
+    ticket = tickets.issue('user-1', 'essay-1')
+    assert tickets.redeem(ticket, 'essay-2') is None
+    assert tickets.redeem(ticket, 'essay-1') == 'user-1'
+
+
+def test_expired_ticket_is_rejected(db):
+    tickets = StreamTicket(db)
+    ticket = tickets.issue('user-1', 'essay-1')
+    db.stream_tickets.update_many({}, {'$set': {'expires_at': datetime.utcnow() - timedelta(seconds=1)}})
+    assert tickets.redeem(ticket, 'essay-1') is None
+
+
+def test_only_the_hash_is_stored(db):
+    ticket = StreamTicket(db).issue('user-1', 'essay-1')
+    assert db.stream_tickets.find_one({'_id': ticket}) is None
+    assert db.stream_tickets.count_documents({}) == 1